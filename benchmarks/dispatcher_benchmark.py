@@ -0,0 +1,262 @@
+"""
+Load test of the dispatcher from main.py. Synthetic updates of many simulated users are fed to the real dispatcher
+through Dispatcher.feed_update, Telegram API is replaced by a mock session and the database by DB_URL
+(a temporary SQLite database by default, set DB_URL to use a local PostgreSQL).
+
+Usage from the project root:
+    python -m benchmarks.dispatcher_benchmark [--users 1000] [--concurrency 100] [--api-latency-ms 0]
+                                              [--json result.json] [--compare baseline.json]
+
+Every simulated user sends /start, adds an expense through the whole AddIncomeExpense flow and opens
+statistics and history. Throughput, p50/p95/p99 latency per handler and SQL statements per update are reported.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncGenerator, Optional
+
+BOT_ID = 42
+
+# Environment must be prepared before main.py creates the bot and the database engine
+os.environ.setdefault('BOT_TOKEN', f'{BOT_ID}:BENCHMARK')
+if 'DB_URL' not in os.environ:
+    os.environ['DB_URL'] = f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/benchmark.db'
+# Simulated users send updates without pauses, so they must not be throttled
+os.environ.setdefault('THROTTLE_RATE', '0')
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update, Message, Chat
+from loguru import logger
+from sqlalchemy import event
+
+import main
+from database.engine import engine, migrate_db
+from keyboards.inline import MenuCallBack
+
+# Statistics of the update being processed, shared with the middleware, the bot session and engine events
+current_update: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('current_update', default=None)
+
+
+class MockSession(BaseSession):
+    """Bot session answering all requests locally after optional latency"""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests += 1
+
+        update_stats = current_update.get()
+        if update_stats is not None:
+            update_stats['api_calls'] += 1
+            update_stats['api_time'] += time.perf_counter() - started
+
+        if method.__returning__ is not Message:
+            return True
+
+        self._message_id += 1
+        chat_id = getattr(method, 'chat_id', 0)
+        return Message(message_id=self._message_id, date=datetime.now(), chat=Chat(id=chat_id, type='private'),
+                       text=getattr(method, 'text', None))
+
+    async def stream_content(self, url: str, headers: Optional[dict] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b''
+
+    async def close(self) -> None:
+        pass
+
+
+async def handler_name_middleware(handler, event, data):
+    """Remembers name of the handler matched for the update"""
+
+    update_stats = current_update.get()
+    if update_stats is not None:
+        update_stats['handler'] = data['handler'].callback.__name__
+    return await handler(event, data)
+
+
+def count_statement(*args) -> None:
+    update_stats = current_update.get()
+    if update_stats is not None:
+        update_stats['statements'] += 1
+
+
+class SimulatedUser:
+    """Generates updates of one user"""
+
+    def __init__(self, telegram_id: int) -> None:
+        self.telegram_id = telegram_id
+        self.message_id = 0
+
+    def _user(self) -> dict:
+        return {'id': self.telegram_id, 'is_bot': False, 'first_name': f'User{self.telegram_id}'}
+
+    def _chat(self) -> dict:
+        return {'id': self.telegram_id, 'type': 'private'}
+
+    def message(self, update_id: int, text: str) -> Update:
+        self.message_id += 1
+        message = {'message_id': self.message_id, 'date': int(time.time()), 'chat': self._chat(),
+                   'from': self._user(), 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.model_validate({'update_id': update_id, 'message': message})
+
+    def callback(self, update_id: int, callback_data: MenuCallBack) -> Update:
+        bot_message = {'message_id': self.message_id, 'date': int(time.time()), 'chat': self._chat(),
+                       'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bot'}, 'text': 'menu'}
+        return Update.model_validate({'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': self._user(), 'chat_instance': str(self.telegram_id),
+            'message': bot_message, 'data': callback_data.pack(),
+        }})
+
+    def scenario(self, next_update_id) -> list[Update]:
+        """Updates of one session: /start, adding an expense, statistics and history"""
+        return [
+            self.message(next_update_id(), '/start'),
+            self.callback(next_update_id(), MenuCallBack(level=1, menu_name='add_expense')),
+            self.message(next_update_id(), '250.50'),
+            self.callback(next_update_id(), MenuCallBack(level=2, menu_name='add_expense', category='Продукты')),
+            self.callback(next_update_id(), MenuCallBack(action='skip')),
+            self.callback(next_update_id(), MenuCallBack(action='save')),
+            self.callback(next_update_id(), MenuCallBack(level=1, menu_name='statistics')),
+            self.callback(next_update_id(), MenuCallBack(level=1, menu_name='history')),
+            self.callback(next_update_id(), MenuCallBack(level=0, menu_name='main')),
+        ]
+
+
+def percentile(values: list[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run(users: int, concurrency: int, api_latency: float) -> dict:
+    logger.remove()
+    engine.sync_engine.echo = False
+    event.listen(engine.sync_engine, 'before_cursor_execute', count_statement)
+    main.dp.message.middleware(handler_name_middleware)
+    main.dp.callback_query.middleware(handler_name_middleware)
+    await migrate_db()
+
+    session = MockSession(latency=api_latency)
+    bot = Bot(token=os.environ['BOT_TOKEN'], session=session, default=DefaultBotProperties(parse_mode='HTML'))
+
+    update_ids = iter(range(1, 10 ** 9))
+    results: list[dict] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update: Update) -> None:
+        update_stats = {'handler': 'unhandled', 'statements': 0, 'api_calls': 0, 'api_time': 0.0}
+        current_update.set(update_stats)
+        started = time.perf_counter()
+        await main.dp.feed_update(bot, update)
+        update_stats['latency'] = time.perf_counter() - started
+        results.append(update_stats)
+
+    async def simulate(telegram_id: int) -> None:
+        async with semaphore:
+            for update in SimulatedUser(telegram_id).scenario(lambda: next(update_ids)):
+                await feed(update)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(1_000_000 + i) for i in range(users)))
+    duration = time.perf_counter() - started
+
+    by_handler = defaultdict(list)
+    for result in results:
+        by_handler[result['handler']].append(result)
+
+    handlers = {}
+    for name, handler_results in sorted(by_handler.items()):
+        latencies = [result['latency'] * 1000 for result in handler_results]
+        handlers[name] = {
+            'count': len(handler_results),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'statements_per_update': statistics.mean(result['statements'] for result in handler_results),
+            'api_calls_per_update': statistics.mean(result['api_calls'] for result in handler_results),
+        }
+
+    return {
+        'commit': _get_commit(),
+        'database': engine.dialect.name,
+        'users': users,
+        'concurrency': concurrency,
+        'api_latency_ms': api_latency * 1000,
+        'updates': len(results),
+        'duration_s': duration,
+        'throughput_updates_per_s': len(results) / duration,
+        'statements_per_update': statistics.mean(result['statements'] for result in results),
+        'handlers': handlers,
+    }
+
+
+def _get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    def delta(value: float, base: Optional[float]) -> str:
+        return f' ({(value - base) / base:+.0%})' if base else ''
+
+    base_handlers = baseline['handlers'] if baseline else {}
+    print(f'{report["updates"]} updates of {report["users"]} users in {report["duration_s"]:.2f}s, '
+          f'{report["throughput_updates_per_s"]:.0f} updates/s'
+          f'{delta(report["throughput_updates_per_s"], baseline and baseline["throughput_updates_per_s"])}, '
+          f'{report["statements_per_update"]:.2f} statements/update')
+    print(f'{"handler":<36}{"count":>7}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>14}{"stmts":>7}{"api":>6}')
+    for name, handler in report['handlers'].items():
+        base = base_handlers.get(name, {})
+        print(f'{name:<36}{handler["count"]:>7}{handler["p50_ms"]:>9.2f}{handler["p95_ms"]:>9.2f}'
+              f'{handler["p99_ms"]:>8.2f}{delta(handler["p99_ms"], base.get("p99_ms")):>6}'
+              f'{handler["statements_per_update"]:>7.2f}{handler["api_calls_per_update"]:>6.2f}')
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Load test of the bot dispatcher')
+    parser.add_argument('--users', type=int, default=1000, help='number of simulated users')
+    parser.add_argument('--concurrency', type=int, default=100, help='number of users active at the same time')
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help='simulated latency of Telegram API')
+    parser.add_argument('--json', help='write report to this file')
+    parser.add_argument('--compare', help='report of a previous run to compare with')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.users, args.concurrency, args.api_latency_ms / 1000))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
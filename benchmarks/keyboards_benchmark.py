@@ -0,0 +1,50 @@
+"""
+Micro-benchmark of inline keyboards: building markups from scratch versus registry and memoized markups.
+Run from the project root: python -m benchmarks.keyboards_benchmark
+"""
+import timeit
+
+from keyboards import inline
+
+CATEGORIES = ['Продукты', 'ЖКХ', 'Лекарства', 'Отдых', 'Транспорт']
+SIZES = (2, 2, 1)
+
+CASES = {
+    'main_menu': (
+        lambda: inline._build_main_menu_buttons(0, (2,)),
+        lambda: inline.get_main_menu_buttons(level=0),
+    ),
+    'cancel': (
+        inline._build_cancel_button,
+        inline.get_cancel_button,
+    ),
+    'skip': (
+        inline._build_skip_buttons,
+        inline.get_skip_buttons,
+    ),
+    'save': (
+        inline._build_save_buttons,
+        inline.get_save_buttons,
+    ),
+    'category_list': (
+        lambda: inline._build_category_list_buttons(tuple(CATEGORIES), 1, 'add_expense', False, SIZES),
+        lambda: inline.get_category_list_buttons(categories=CATEGORIES, level=1, menu_name='add_expense', sizes=SIZES),
+    ),
+}
+
+
+def measure(function, number: int) -> float:
+    """Returns the best time of one call in microseconds"""
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def main(number: int = 2000):
+    print(f'{"keyboard":<15}{"build, us":>12}{"cached, us":>12}{"speedup":>10}')
+    for name, (build, cached) in CASES.items():
+        build_time = measure(build, number)
+        cached_time = measure(cached, number)
+        print(f'{name:<15}{build_time:>12.2f}{cached_time:>12.3f}{build_time / cached_time:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+from dotenv import load_dotenv, find_dotenv
+
+from services.metrics import registry, CollectedCounter
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+
+@dataclass
+class CacheStats:
+    """Counters of cache usage"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class UserIdCache:
+    """
+    Bounded LRU cache with TTL mapping telegram_id to id of the user in the User table.
+    The cache is per process and is not invalidated by other processes. It is safe since the bot never deletes users,
+    so the mapping does not change once the user is added. A user deleted from the database by hand is recognised
+    by other processes after ttl seconds.
+    """
+
+    def __init__(self, max_size: int = 100_000, ttl: float = 3600.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: OrderedDict[int, tuple[int, float]] = OrderedDict()
+
+    def get(self, telegram_id: int) -> Optional[int]:
+        """Returns cached user id or None if there is no fresh entry for specified telegram_id"""
+
+        entry = self._data.get(telegram_id)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._data[telegram_id]
+            self.stats.misses += 1
+            return None
+
+        self._data.move_to_end(telegram_id)
+        self.stats.hits += 1
+        return entry[0]
+
+    def set(self, telegram_id: int, user_id: int) -> None:
+        """Puts user id to the cache evicting the least recently used entry if the cache is full"""
+
+        self._data[telegram_id] = (user_id, time.monotonic() + self.ttl)
+        self._data.move_to_end(telegram_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, telegram_id: int) -> None:
+        """Removes entry of specified telegram_id from the cache"""
+        self._data.pop(telegram_id, None)
+
+    def clear(self) -> None:
+        """Removes all entries from the cache"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+user_id_cache = UserIdCache(ttl=float(os.getenv('USER_ID_CACHE_TTL', 600)))
+
+
+@dataclass(frozen=True)
+class CachedCategories:
+    """Snapshot of active categories of one user with lookups in both directions"""
+    name_to_id: dict[str, int]
+    id_to_name: dict[int, str]
+    # Monthly limits of expense categories by id, categories without limit are absent
+    limits: dict[int, Decimal]
+    version: int
+    expires_at: float
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple], *, version: int, ttl: float) -> 'CachedCategories':
+        """Creates snapshot from rows (name, id) or (name, id, limit)"""
+
+        name_to_id = {row[0]: row[1] for row in rows}
+        id_to_name = {row[1]: row[0] for row in rows}
+        limits = {row[1]: row[2] for row in rows if len(row) > 2 and row[2]}
+        return cls(name_to_id, id_to_name, limits, version, time.monotonic() + ttl)
+
+
+class CategoryCache:
+    """
+    Bounded LRU cache of user categories keyed by (telegram_id, is_income).
+    Writes to categories invalidate the snapshot of the user in this process. A snapshot loaded while the categories
+    of the user were invalidated is not stored, so snapshots loaded before a write are never returned after it.
+    The cache is local to the process, so writes made by other workers are seen after ttl seconds at most,
+    which is why ttl is short.
+    """
+
+    def __init__(self, max_size: int = 50_000, ttl: float = 30.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: OrderedDict[tuple[int, bool], CachedCategories] = OrderedDict()
+        # Number of invalidations made so far
+        self._invalidation_count = 0
+        # Number of the latest invalidation of each key, the oldest keys are forgotten beyond max_size
+        self._invalidations: OrderedDict[tuple[int, bool], int] = OrderedDict()
+        # Version of every key not in _invalidations: raised by clear() and by forgetting keys
+        self._base_version = 0
+
+    def version(self, telegram_id: int, is_income: bool) -> int:
+        """
+        Returns version to be passed to set() with categories of specified user loaded after this call.
+        It changes only when categories of this user and type are invalidated (or versions of old keys are forgotten),
+        so writes of other users do not prevent storing the snapshot
+        """
+        return max(self._invalidations.get((telegram_id, is_income), 0), self._base_version)
+
+    def get(self, telegram_id: int, is_income: bool) -> Optional[CachedCategories]:
+        """Returns snapshot of categories or None if there is no fresh snapshot of the current version"""
+
+        key = (telegram_id, is_income)
+        entry = self._data.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.stats.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    def set(self, telegram_id: int, is_income: bool, rows: list[tuple], *, version: int) -> CachedCategories:
+        """
+        Stores categories loaded from the database
+        :param telegram_id: telegram_id of the user
+        :param is_income: True for income categories, False for expense categories
+        :param rows: list of (name, id) or (name, id, limit) of active categories
+        :param version: version obtained before loading categories from the database
+        :return: stored snapshot
+        """
+
+        key = (telegram_id, is_income)
+        entry = CachedCategories.from_rows(rows, version=version, ttl=self.ttl)
+        if version != self.version(*key):
+            # Categories of the user were changed while loading, the snapshot may be stale
+            return entry
+
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+        return entry
+
+    def invalidate(self, telegram_id: int, is_income: Optional[bool] = None) -> None:
+        """Removes categories of specified user. If is_income is None, both category types are invalidated"""
+
+        self._invalidation_count += 1
+        for flag in ((True, False) if is_income is None else (is_income,)):
+            key = (telegram_id, flag)
+            self._data.pop(key, None)
+            self._invalidations[key] = self._invalidation_count
+            self._invalidations.move_to_end(key)
+        while len(self._invalidations) > self.max_size:
+            _, forgotten = self._invalidations.popitem(last=False)
+            self._base_version = max(self._base_version, forgotten)
+
+    def clear(self) -> None:
+        """Removes all entries from the cache"""
+        self._invalidation_count += 1
+        self._base_version = self._invalidation_count
+        self._invalidations.clear()
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+category_cache = CategoryCache(ttl=float(os.getenv('CATEGORY_CACHE_TTL', 30)))
+
+
+def _collect_cache_stats() -> dict[tuple[str, ...], float]:
+    values = {}
+    for cache_name, stats in (('user_id', user_id_cache.stats), ('category', category_cache.stats)):
+        values[(cache_name, 'hit')] = stats.hits
+        values[(cache_name, 'miss')] = stats.misses
+        values[(cache_name, 'eviction')] = stats.evictions
+    return values
+
+
+registry.register(CollectedCounter(
+    'bot_cache_events_total', 'Hits, misses and evictions of in-process caches', _collect_cache_stats,
+    labels=('cache', 'event'),
+))
@@ -0,0 +1,25 @@
+import json
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv, find_dotenv
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+DEFAULT_CATEGORIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default_categories.json')
+
+
+@lru_cache(maxsize=1)
+def get_default_categories() -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """
+    Loads default categories of a new user from the file specified by DEFAULT_CATEGORIES_FILE environment variable
+    (database/default_categories.json by default)
+    :return: tuple of income category names and expense category names
+    """
+
+    path = os.getenv('DEFAULT_CATEGORIES_FILE') or DEFAULT_CATEGORIES_PATH
+    with open(path, encoding='utf-8') as file:
+        categories = json.load(file)
+
+    return tuple(categories.get('income', [])), tuple(categories.get('expense', []))
@@ -0,0 +1,15 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def dialect_insert(session: AsyncSession, table):
+    """Returns INSERT construct of the session's database dialect supporting ON CONFLICT clauses"""
+
+    dialect_name = session.bind.dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_
+    else:
+        raise NotImplementedError(f'ON CONFLICT is not supported for {dialect_name} database')
+
+    return insert_(table)
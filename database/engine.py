@@ -1,23 +1,69 @@
 import os
+from typing import Optional
 
 from dotenv import load_dotenv, find_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 
+from database.migrations import migrate, check_schema_version
 from database.model import Base
+from database.replica import READ_ONLY_KEY
+from database.sql_logging import setup_sql_logging
 
 # Loading environment variables
 load_dotenv(find_dotenv())
 
-# Creating database url from values of environment variables
-db_url = (
+# Creating database url from values of environment variables. DB_URL overrides separate values,
+# e.g. sqlite+aiosqlite:///bot.db for local runs and benchmarks
+db_url = os.getenv('DB_URL') or (
     f'{os.getenv("DB_TYPE")}+{os.getenv("DB_ENGINE")}://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}\
 @{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}'
 )
 
-# Creating database engine and session maker
-engine = create_async_engine(db_url, echo=True)
+# Creating database engine and session maker. Statements are not echoed, a sample of them is logged instead
+engine = create_async_engine(db_url)
+setup_sql_logging(engine)
 session_maker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
+# Optional read replica for analytical queries (statistics, history, export), e.g. a streaming replica of
+# PostgreSQL. Without READ_DB_URL analytical queries use the primary database
+read_db_url = os.getenv('READ_DB_URL')
+read_engine: Optional[AsyncEngine] = None
+read_session_maker: Optional[async_sessionmaker] = None
+if read_db_url:
+    read_engine = create_async_engine(read_db_url)
+    setup_sql_logging(read_engine)
+    read_session_maker = async_sessionmaker(bind=read_engine, class_=AsyncSession, expire_on_commit=False,
+                                            info={READ_ONLY_KEY: True})
+
+
+# Connections of the primary pool which background tasks (write-behind writer and recurrence scheduler) may use
+# at the same time as updates
+BACKGROUND_CONNECTIONS = 2
+
+
+def get_pool_capacity(async_engine: AsyncEngine) -> Optional[int]:
+    """Returns maximum number of connections of the engine pool (pool_size + max_overflow), None if it is unlimited"""
+
+    pool = async_engine.sync_engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+
+def get_update_concurrency(async_engine: AsyncEngine) -> Optional[int]:
+    """
+    Returns number of updates which may be processed at a time without waiting for connections of the engine pool,
+    None if the pool is unlimited. Every update is assumed to hold at most one connection of the pool (the session of
+    its handler, SQL FSM storage and the read replica have their own pools), connections of background tasks are
+    reserved
+    """
+
+    capacity = get_pool_capacity(async_engine)
+    if capacity is None:
+        return None
+    return max(capacity - BACKGROUND_CONNECTIONS, 1)
+
 
 async def create_db():
     """Creates all database tables"""
@@ -29,3 +75,13 @@ async def drop_db():
     """Deletes all database tables"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
+
+
+async def migrate_db() -> int:
+    """Applies pending schema migrations. Returns version of the schema"""
+    return await migrate(engine)
+
+
+async def check_schema() -> int:
+    """Checks that migrations of the code have been applied to the database. Returns version of the schema"""
+    return await check_schema_version(engine)
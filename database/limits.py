@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+# Share of the monthly limit after which the user is warned
+LIMIT_WARNING_RATIO = Decimal('0.8')
+
+
+@dataclass(frozen=True)
+class LimitStatus:
+    """State of the monthly limit of an expense category after a save"""
+    limit: Decimal
+    spent: Decimal
+
+    @property
+    def remaining(self) -> Decimal:
+        return self.limit - self.spent
+
+    @property
+    def ratio(self) -> Decimal:
+        return self.spent / self.limit
+
+    @property
+    def status(self) -> str:
+        """'ok', 'warning' (LIMIT_WARNING_RATIO of the limit is reached) or 'exceeded'"""
+
+        if self.spent > self.limit:
+            return 'exceeded'
+        if self.ratio >= LIMIT_WARNING_RATIO:
+            return 'warning'
+        return 'ok'
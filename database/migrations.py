@@ -0,0 +1,100 @@
+from typing import Awaitable, Callable, NamedTuple
+
+from loguru import logger
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from database.model import Base, SchemaVersion, Expense, Income, Recurrence, RecurrenceOccurrence
+from database.search import create_search_indexes
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+
+
+async def _create_initial_schema(conn: AsyncConnection) -> None:
+    await conn.run_sync(Base.metadata.create_all)
+
+
+async def _create_history_indexes(conn: AsyncConnection) -> None:
+    for table in (Expense.__table__, Income.__table__):
+        for index in table.indexes:
+            if index.name.endswith('_user_id_created_id'):
+                await conn.run_sync(index.create, checkfirst=True)
+
+
+async def _create_recurrence_tables(conn: AsyncConnection) -> None:
+    for table in (Recurrence.__table__, RecurrenceOccurrence.__table__):
+        await conn.run_sync(table.create, checkfirst=True)
+
+
+# Migrations are applied in order of versions, each one in its own transaction.
+# New migrations must only be appended and must be safe for databases created by the initial migration
+# from newer models (use checkfirst when creating objects).
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, 'Initial schema', _create_initial_schema),
+    Migration(2, 'Composite indexes of history on (user_id, created, id)', _create_history_indexes),
+    Migration(3, 'Recurring incomes and expenses', _create_recurrence_tables),
+    Migration(4, 'Full-text search of descriptions of incomes and expenses', create_search_indexes),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+class SchemaVersionError(RuntimeError):
+    """Raised at startup if the database schema is older than the code, so migrations must be applied first"""
+
+
+async def get_schema_version(conn: AsyncConnection) -> int:
+    """Returns version of the database schema, 0 if the database has no schema_version table"""
+
+    has_table = await conn.run_sync(
+        lambda sync_conn: sync_conn.dialect.has_table(sync_conn, SchemaVersion.__tablename__)
+    )
+    if not has_table:
+        return 0
+
+    result = await conn.execute(select(func.max(SchemaVersion.version)))
+    return result.scalar() or 0
+
+
+async def check_schema_version(engine: AsyncEngine) -> int:
+    """
+    Checks that the database schema is not older than the code without reflecting tables. Errors of connecting to
+    the database are raised as they are. Returns version of the schema. A newer schema is accepted, so workers with
+    the previous code keep working during a rolling deploy
+    """
+
+    async with engine.connect() as conn:
+        version = await get_schema_version(conn)
+
+    if version < LATEST_VERSION:
+        raise SchemaVersionError(f'Database schema is at version {version}, but version {LATEST_VERSION} is required. '
+                                 f'Apply migrations with "python manage.py migrate"')
+    if version > LATEST_VERSION:
+        logger.warning(f'Database schema is at version {version}, newer than version {LATEST_VERSION} of the code')
+    return version
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """Applies pending migrations. Returns version of the schema after migration"""
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SchemaVersion.__table__.create, checkfirst=True)
+        version = await get_schema_version(conn)
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+
+        async with engine.begin() as conn:
+            await migration.apply(conn)
+            await conn.execute(
+                SchemaVersion.__table__.insert().values(version=migration.version, description=migration.description)
+            )
+        version = migration.version
+        logger.info(f'Database migrated to version {version}: {migration.description}')
+
+    return version
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Numeric, DateTime, func, ForeignKey
+from sqlalchemy import String, Numeric, DateTime, Date, func, ForeignKey, JSON, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -17,6 +17,10 @@ class User(Base):
 
 class Expense(Base):
     __tablename__ = 'expense'
+    __table_args__ = (
+        # Keyset pagination of history by (created, id) of one user
+        Index('ix_expense_user_id_created_id', 'user_id', 'created', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     amount: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
@@ -31,6 +35,10 @@ class Expense(Base):
 
 class Income(Base):
     __tablename__ = 'income'
+    __table_args__ = (
+        # Keyset pagination of history by (created, id) of one user
+        Index('ix_income_user_id_created_id', 'user_id', 'created', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     amount: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
@@ -62,3 +70,69 @@ class CategoryIncome(Base):
     is_active: Mapped[bool] = mapped_column(default=True)
 
     user_id: Mapped[int] = mapped_column(ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+
+class CategoryRollup(Base):
+    """Running totals of incomes or expenses of a category per day and per month"""
+    __tablename__ = 'category_rollup'
+
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    # 'day' or 'month'
+    period: Mapped[str] = mapped_column(String(5), primary_key=True)
+    period_start: Mapped[Date] = mapped_column(Date, primary_key=True)
+    is_income: Mapped[bool] = mapped_column(primary_key=True)
+    # Refers to category_income or category_expense depending on is_income
+    category_id: Mapped[int] = mapped_column(primary_key=True)
+    total: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    count: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class Recurrence(Base):
+    """Income or expense added automatically every day, week or month"""
+    __tablename__ = 'recurrence'
+    __table_args__ = (
+        # Loading of recurrences due in a time window in order of (next_due, id)
+        Index('ix_recurrence_is_active_next_due_id', 'is_active', 'next_due', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    is_income: Mapped[bool] = mapped_column(nullable=False)
+    amount: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    description: Mapped[str] = mapped_column(String(150), nullable=True)
+    # 'daily', 'weekly' or 'monthly'
+    frequency: Mapped[str] = mapped_column(String(10), nullable=False)
+    # Day of month of monthly recurrences, so occurrences return to it after short months
+    day: Mapped[int] = mapped_column(nullable=True)
+    next_due: Mapped[DateTime] = mapped_column(DateTime, nullable=False)
+    is_active: Mapped[bool] = mapped_column(default=True)
+    created: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    # Refers to category_income or category_expense depending on is_income
+    category_id: Mapped[int] = mapped_column(nullable=False)
+
+
+class RecurrenceOccurrence(Base):
+    """Occurrences of recurrences already written, so an occurrence is never written twice"""
+    __tablename__ = 'recurrence_occurrence'
+
+    recurrence_id: Mapped[int] = mapped_column(ForeignKey('recurrence.id', ondelete='CASCADE'), primary_key=True)
+    due: Mapped[DateTime] = mapped_column(DateTime, primary_key=True)
+    created: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_record'
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+    expires_at: Mapped[DateTime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+
+    version: Mapped[int] = mapped_column(primary_key=True)
+    description: Mapped[str] = mapped_column(String(255), nullable=False)
+    applied: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
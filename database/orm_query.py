@@ -1,51 +1,55 @@
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Optional, Sequence, NamedTuple, AsyncIterator
 
 from loguru import logger
-from sqlalchemy import select
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import select, delete, update, insert, literal, and_, func, tuple_, union_all, Numeric, String, \
+    DateTime, Boolean
+from sqlalchemy.exc import SQLAlchemyError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped
 
-from database.model import User, CategoryIncome, CategoryExpense, Income, Expense
+from database.cache import user_id_cache, category_cache, CachedCategories
+from database.defaults import get_default_categories
+from database.dialect import dialect_insert
+from database.model import User, CategoryIncome, CategoryExpense, Income, Expense, CategoryRollup
+from database.limits import LimitStatus
+from database.rollups import apply_rollup_deltas, RollupDelta, period_start
 
 
 async def orm_get_user_id(session: AsyncSession, telegram_id: int) -> Mapped[int]:
-    """Gets user id by telegram_id"""
+    """Gets user id by telegram_id. The result is cached because the mapping never changes while the user exists"""
 
-    query = select(User).where(User.telegram_id == telegram_id)
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+
+    query = select(User.id).where(User.telegram_id == telegram_id)
     result = await session.execute(query)
-    user_id = result.scalar().id
+    user_id = result.scalar_one()
+    user_id_cache.set(telegram_id, user_id)
     return user_id
 
 
 async def orm_add_default_categories(
         session: AsyncSession,
         *,
-        telegram_id: int,
-        income_categories: list[str],
-        expense_categories: list[str],
+        user_id: int,
+        income_categories: Sequence[str],
+        expense_categories: Sequence[str],
 ):
-    """Adds default categories of incomes and expenses for a new user"""
-
-    user_id = orm_get_user_id(session, telegram_id)
+    """Adds default categories of incomes and expenses for a new user with one multi-row INSERT per table. Does not commit"""
 
-    for category in income_categories:
-        session.add(
-            CategoryIncome(name=category, user_id=user_id)
+    if income_categories:
+        await session.execute(
+            insert(CategoryIncome).values([{'name': name, 'user_id': user_id} for name in income_categories])
         )
 
-    for category in expense_categories:
-        session.add(
-            CategoryExpense(name=category, user_id=user_id)
+    if expense_categories:
+        await session.execute(
+            insert(CategoryExpense).values([{'name': name, 'user_id': user_id} for name in expense_categories])
         )
 
-    try:
-        await session.commit()
-        logger.debug(f'Default categories of incomes and expenses were added to user with telegram_id={telegram_id}')
-    except SQLAlchemyError as e:
-        logger.error(f'Error when adding default categories of incomes and expenses: {e}')
-
 
 async def orm_add_user(
         session: AsyncSession,
@@ -54,34 +58,73 @@ async def orm_add_user(
         first_name: str | None = None,
         last_name: str | None = None,
 ) -> bool:
-    """Tries to add a new user to the User table. Returns True if added successfully. Returns False if user with specified telegram_id already exists."""
+    """
+    Tries to add a new user to the User table together with default categories in one transaction.
+    Returns True if added successfully. Returns False if user with specified telegram_id already exists.
+    Raises SQLAlchemyError if the user could not be added.
+    The user is looked up first, so returning users cost one SELECT (or none if cached) and do not waste values of
+    the id sequence. The INSERT ignores the conflict of two concurrent /start of a new user.
+    """
 
-    query = select(User).where(User.telegram_id == telegram_id)
-    result = await session.execute(query)
+    try:
+        await orm_get_user_id(session, telegram_id)
+        logger.debug(f'User with telegram_id={telegram_id} already exists in Users')
+        return False
+    except NoResultFound:
+        pass
 
-    if result.first() is None:
-        try:
-            session.add(
-                User(telegram_id=telegram_id, first_name=first_name, last_name=last_name)
-            )
-            await session.commit()
-            logger.debug(f'User with telegram_id={telegram_id} added to Users')
+    query = (
+        dialect_insert(session, User)
+        .values(telegram_id=telegram_id, first_name=first_name, last_name=last_name)
+        .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        .returning(User.id)
+    )
+
+    try:
+        result = await session.execute(query)
+        user_id = result.scalar()
+
+        if user_id is None:
+            await session.rollback()
+            logger.debug(f'User with telegram_id={telegram_id} already exists in Users')
+            return False
+
+        income_categories, expense_categories = get_default_categories()
+        await orm_add_default_categories(session,
+                                         user_id=user_id,
+                                         income_categories=income_categories,
+                                         expense_categories=expense_categories)
+        await session.commit()
+
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(f'Error when adding a new user to Users: {e}')
+        raise
+
+    user_id_cache.set(telegram_id, user_id)
+    category_cache.invalidate(telegram_id)
+    logger.debug(f'User with telegram_id={telegram_id} and default categories added to Users')
+    return True
 
-            # TODO Move categories to separate file
-            income_categories = ['Зарплата', 'Вклады']
-            expense_categories = ['Продукты', 'ЖКХ', 'Лекарства', 'Отдых']
 
-            await orm_add_default_categories(session,
-                                             telegram_id=telegram_id,
-                                             income_categories=income_categories,
-                                             expense_categories=expense_categories)
-            return True
+async def orm_get_cached_categories(
+        session: AsyncSession,
+        telegram_id: int,
+        is_income: bool = False
+) -> CachedCategories:
+    """Returns snapshot of active income or expense categories of user with specified telegram_id. Loads categories from the database only if there is no fresh snapshot in the cache"""
 
-        except SQLAlchemyError as e:
-            logger.error(f'Error when adding a new user to Users: {e}')
+    cached = category_cache.get(telegram_id, is_income)
+    if cached is not None:
+        return cached
 
-    logger.debug(f'User with telegram_id={telegram_id} already exists in Users')
-    return False
+    version = category_cache.version(telegram_id, is_income)
+    user_id = await orm_get_user_id(session, telegram_id)
+    table = CategoryIncome if is_income else CategoryExpense
+    columns = (table.name, table.id) if is_income else (table.name, table.id, table.limit)
+    query = select(*columns).where(table.user_id == user_id, table.is_active == True).order_by(table.id)
+    result = await session.execute(query)
+    return category_cache.set(telegram_id, is_income, [tuple(row) for row in result.all()], version=version)
 
 
 async def orm_get_user_categories(
@@ -91,13 +134,86 @@ async def orm_get_user_categories(
 ) -> dict[str, int]:
     """Returns dictionary with names and ids of income or expense categories (in the form 'name: id') of user with specified telegram_id. If is_income is True, returns income categories, otherwise - expense categories"""
 
+    cached = await orm_get_cached_categories(session, telegram_id, is_income)
+    return dict(cached.name_to_id)
+
+
+async def orm_get_category_id(session: AsyncSession, telegram_id: int, name: str, is_income: bool = False) -> int:
+    """Returns id of active category with specified name. Raises KeyError if there is no such category"""
+
+    cached = await orm_get_cached_categories(session, telegram_id, is_income)
+    return cached.name_to_id[name]
+
+
+async def orm_get_category_name(session: AsyncSession, telegram_id: int, category_id: int, is_income: bool = False) -> str:
+    """Returns name of active category with specified id. Raises KeyError if there is no such category"""
+
+    cached = await orm_get_cached_categories(session, telegram_id, is_income)
+    return cached.id_to_name[category_id]
+
+
+async def orm_add_category(session: AsyncSession, *, telegram_id: int, name: str, is_income: bool = False) -> int:
+    """Adds new income or expense category to user with specified telegram_id. Returns id of the new category"""
+
     user_id = await orm_get_user_id(session, telegram_id)
     table = CategoryIncome if is_income else CategoryExpense
-    query = select(table).where(table.user_id == user_id and table.is_active == True)
-    result = await session.execute(query)
-    categories_scalars = result.scalars().all()
-    categories = {category.name: category.id for category in categories_scalars}
-    return categories
+    category = table(name=name, user_id=user_id)
+    session.add(category)
+    await session.commit()
+    category_cache.invalidate(telegram_id, is_income)
+    logger.debug(f'Category "{name}" added to user with telegram_id={telegram_id}')
+    return category.id
+
+
+async def _orm_update_category(session: AsyncSession, telegram_id: int, category_id: int, is_income: bool, **values):
+    """Updates category of user with specified telegram_id and invalidates cached categories of the user"""
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    table = CategoryIncome if is_income else CategoryExpense
+    query = update(table).where(table.id == category_id, table.user_id == user_id).values(**values)
+    await session.execute(query)
+    await session.commit()
+    category_cache.invalidate(telegram_id, is_income)
+
+
+async def orm_rename_category(
+        session: AsyncSession,
+        *,
+        telegram_id: int,
+        category_id: int,
+        name: str,
+        is_income: bool = False,
+):
+    """Renames income or expense category of user with specified telegram_id"""
+    await _orm_update_category(session, telegram_id, category_id, is_income, name=name)
+
+
+async def orm_deactivate_category(session: AsyncSession, *, telegram_id: int, category_id: int, is_income: bool = False):
+    """Deactivates income or expense category of user with specified telegram_id"""
+    await _orm_update_category(session, telegram_id, category_id, is_income, is_active=False)
+
+
+async def orm_set_category_limit(session: AsyncSession, *, telegram_id: int, category_id: int, limit: float):
+    """Sets monthly limit of expense category of user with specified telegram_id"""
+    await _orm_update_category(session, telegram_id, category_id, False, limit=limit)
+
+
+class SavedRecord(NamedTuple):
+    id: int
+    created: datetime
+    # State of the monthly limit of the expense category, None for incomes and categories without limit
+    limit_status: Optional[LimitStatus] = None
+
+
+def _get_limit_status(limit: Optional[Decimal], totals: dict[tuple, Decimal], user_id: int,
+                      category_id: int, created: datetime) -> Optional[LimitStatus]:
+    """Returns state of the category limit from the month total returned by the rollup upsert"""
+
+    if not limit:
+        return None
+
+    spent = totals[(user_id, 'month', period_start(created, 'month'), False, category_id)]
+    return LimitStatus(Decimal(limit), Decimal(spent))
 
 
 async def orm_add_income_expense(
@@ -109,19 +225,375 @@ async def orm_add_income_expense(
         category: str,
         description: Optional[str] = None,
         date_time: datetime,
+) -> SavedRecord:
+    """
+    Adds new income or expense to user with specified telegram_id in a single statement.
+    User and category are resolved inside the INSERT ... SELECT, the returned ids are used to update day and month
+    totals in the same transaction. The new month total of an expense category is checked against its limit.
+    Raises NoResultFound if the user or the active category with specified name does not exist.
+    :return: id and creation time of the new record with state of the category limit
+    """
+
+    table_to_add = Income if is_income else Expense
+    category_table = CategoryIncome if is_income else CategoryExpense
+
+    # Category id is taken from the cache if it is already there, otherwise it is resolved by name
+    cached = category_cache.get(telegram_id, is_income)
+    if cached is not None and category in cached.name_to_id:
+        category_condition = category_table.id == cached.name_to_id[category]
+    else:
+        category_condition = category_table.name == category
+
+    source = (
+        select(
+            literal(amount, Numeric(10, 2)),
+            literal(description, String(150)),
+            literal(date_time, DateTime),
+            User.id,
+            category_table.id,
+        )
+        .select_from(User)
+        .join(category_table, category_table.user_id == User.id)
+        .where(User.telegram_id == telegram_id, category_condition, category_table.is_active == True)
+        .limit(1)
+    )
+    query = (
+        insert(table_to_add)
+        .from_select(['amount', 'description', 'created', 'user_id', 'category_id'], source)
+        .returning(table_to_add.id, table_to_add.created, table_to_add.user_id, table_to_add.category_id,
+                   table_to_add.amount)
+    )
+
+    result = await session.execute(query)
+    record_id, created, user_id, category_id, amount = result.one()
+    totals = await apply_rollup_deltas(session, [RollupDelta(user_id, is_income, category_id, created, amount, 1)])
+
+    limit_status = None
+    if not is_income:
+        cached = cached or await orm_get_cached_categories(session, telegram_id, is_income)
+        limit_status = _get_limit_status(cached.limits.get(category_id), totals, user_id, category_id, created)
+
+    await session.commit()
+    return SavedRecord(record_id, created, limit_status)
+
+
+async def orm_add_incomes_expenses(session: AsyncSession, records: Sequence[dict]) -> list[SavedRecord | SQLAlchemyError]:
+    """
+    Adds many incomes and expenses (possibly of different users) with one multi-row INSERT per table. Does not commit.
+    Every record is a dictionary with keys telegram_id, is_income, amount, category, description and date_time,
+    is_income and description are optional as in orm_add_income_expense.
+    Limit state of expense categories is taken from cached categories or from the query resolving category ids.
+    :return: list with the new record or an error for every record in the order of records
+    """
+
+    results: list[SavedRecord | SQLAlchemyError | None] = [None] * len(records)
+
+    # Resolving ids of users which are not cached yet with one query
+    user_ids = {record['telegram_id']: user_id_cache.get(record['telegram_id']) for record in records}
+    missing_telegram_ids = [telegram_id for telegram_id, user_id in user_ids.items() if user_id is None]
+    if missing_telegram_ids:
+        query = select(User.telegram_id, User.id).where(User.telegram_id.in_(missing_telegram_ids))
+        for telegram_id, user_id in (await session.execute(query)).all():
+            user_ids[telegram_id] = user_id
+            user_id_cache.set(telegram_id, user_id)
+
+    for is_income in (False, True):
+        table_to_add = Income if is_income else Expense
+        category_table = CategoryIncome if is_income else CategoryExpense
+        indexes = [i for i, record in enumerate(records) if bool(record.get('is_income', False)) == is_income]
+        if not indexes:
+            continue
+
+        # Resolving category ids and limits from the cache and, for the rest of users, with one query
+        category_ids: dict[tuple[int, str], int] = {}
+        limits: dict[int, Decimal] = {}
+        uncached_user_ids = set()
+        for i in indexes:
+            telegram_id = records[i]['telegram_id']
+            cached = category_cache.get(telegram_id, is_income)
+            if cached is not None:
+                category_ids.update({(telegram_id, name): id_ for name, id_ in cached.name_to_id.items()})
+                limits.update(cached.limits)
+            elif user_ids[telegram_id] is not None:
+                uncached_user_ids.add(user_ids[telegram_id])
+
+        if uncached_user_ids:
+            telegram_ids = {user_id: telegram_id for telegram_id, user_id in user_ids.items()}
+            limit_column = CategoryExpense.limit if not is_income else literal(None, Numeric(10, 2))
+            query = (
+                select(category_table.user_id, category_table.name, category_table.id, limit_column)
+                .where(category_table.user_id.in_(uncached_user_ids), category_table.is_active == True)
+            )
+            for user_id, name, category_id, limit in (await session.execute(query)).all():
+                category_ids.setdefault((telegram_ids[user_id], name), category_id)
+                if limit:
+                    limits[category_id] = limit
+
+        rows, row_indexes = [], []
+        for i in indexes:
+            record = records[i]
+            user_id = user_ids[record['telegram_id']]
+            category_id = category_ids.get((record['telegram_id'], record['category']))
+            if user_id is None or category_id is None:
+                results[i] = NoResultFound(f'User or category "{record["category"]}" of user with '
+                                           f'telegram_id={record["telegram_id"]} not found')
+                continue
+
+            rows.append({
+                'amount': record['amount'],
+                'description': record.get('description'),
+                'created': record['date_time'],
+                'user_id': user_id,
+                'category_id': category_id,
+            })
+            row_indexes.append(i)
+
+        if rows:
+            query = insert(table_to_add).returning(table_to_add.id, table_to_add.created, sort_by_parameter_order=True)
+            result = await session.execute(query, rows)
+            inserted = result.all()
+
+            totals = await apply_rollup_deltas(session, [
+                RollupDelta(row['user_id'], is_income, row['category_id'], row['created'], row['amount'], 1)
+                for row in rows
+            ])
+
+            for i, row, (record_id, created) in zip(row_indexes, rows, inserted):
+                limit_status = None
+                if not is_income:
+                    limit_status = _get_limit_status(limits.get(row['category_id']), totals, row['user_id'],
+                                                     row['category_id'], row['created'])
+                results[i] = SavedRecord(record_id, created, limit_status)
+
+    return results
+
+
+async def orm_update_income_expense(
+        session: AsyncSession,
+        *,
+        telegram_id: int,
+        record_id: int,
+        is_income: bool = False,
+        amount: Optional[float] = None,
+        category: Optional[str] = None,
+        description: Optional[str] = None,
 ):
-    """Adds new income or expense to user with specified telegram_id"""
+    """Edits amount, category or description of income or expense of user with specified telegram_id and updates totals"""
 
     user_id = await orm_get_user_id(session, telegram_id)
-    categories = await orm_get_user_categories(session, telegram_id, is_income=is_income)
-    category_id = categories[category]
-    table_to_add = Income if is_income else Expense
+    table = Income if is_income else Expense
+    query = select(table).where(table.id == record_id, table.user_id == user_id).with_for_update()
+    record = (await session.execute(query)).scalar_one()
 
-    session.add(table_to_add(
-        amount=amount,
-        description=description,
-        created=date_time,
-        user_id=user_id,
-        category_id=category_id,
-    ))
+    deltas = [RollupDelta(user_id, is_income, record.category_id, record.created, -record.amount, -1)]
+    if amount is not None:
+        record.amount = amount
+    if category is not None:
+        record.category_id = await orm_get_category_id(session, telegram_id, category, is_income=is_income)
+    if description is not None:
+        record.description = description
+    deltas.append(RollupDelta(user_id, is_income, record.category_id, record.created, record.amount, 1))
+
+    await session.flush()
+    await apply_rollup_deltas(session, deltas)
     await session.commit()
+
+
+async def orm_delete_income_expense(session: AsyncSession, *, telegram_id: int, record_id: int, is_income: bool = False):
+    """Deletes income or expense of user with specified telegram_id and subtracts it from totals"""
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    table = Income if is_income else Expense
+    query = (
+        delete(table)
+        .where(table.id == record_id, table.user_id == user_id)
+        .returning(table.category_id, table.created, table.amount)
+    )
+    category_id, created, amount = (await session.execute(query)).one()
+    await apply_rollup_deltas(session, [RollupDelta(user_id, is_income, category_id, created, -amount, -1)])
+    await session.commit()
+
+
+async def orm_get_statistics(session: AsyncSession, telegram_id: int, month: date) -> list[tuple[bool, str, Decimal, int]]:
+    """
+    Returns totals of incomes and expenses of user with specified telegram_id by category for the month
+    starting with specified day. Reads only month totals, so the cost does not depend on the number of records.
+    :return: list of (is_income, category name, total, count) sorted by total in descending order
+    """
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    query = (
+        select(
+            CategoryRollup.is_income,
+            func.coalesce(CategoryIncome.name, CategoryExpense.name),
+            CategoryRollup.total,
+            CategoryRollup.count,
+        )
+        .outerjoin(CategoryIncome, and_(CategoryRollup.is_income == True,
+                                        CategoryIncome.id == CategoryRollup.category_id))
+        .outerjoin(CategoryExpense, and_(CategoryRollup.is_income == False,
+                                         CategoryExpense.id == CategoryRollup.category_id))
+        .where(
+            CategoryRollup.user_id == user_id,
+            CategoryRollup.period == 'month',
+            CategoryRollup.period_start == month,
+            CategoryRollup.count > 0,
+        )
+        .order_by(CategoryRollup.total.desc())
+    )
+    result = await session.execute(query)
+    return [tuple(row) for row in result.all()]
+
+
+async def orm_get_monthly_totals(session: AsyncSession, telegram_id: int, since: date) -> list[tuple[date, bool, Decimal]]:
+    """
+    Returns totals of incomes and expenses of user with specified telegram_id by month for months starting
+    from specified day. Reads only month totals.
+    :return: list of (month start, is_income, total) sorted by month
+    """
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    query = (
+        select(
+            CategoryRollup.period_start,
+            CategoryRollup.is_income,
+            func.sum(CategoryRollup.total, type_=Numeric(14, 2)),
+        )
+        .where(
+            CategoryRollup.user_id == user_id,
+            CategoryRollup.period == 'month',
+            CategoryRollup.period_start >= since,
+        )
+        .group_by(CategoryRollup.period_start, CategoryRollup.is_income)
+        .order_by(CategoryRollup.period_start)
+    )
+    result = await session.execute(query)
+    return [tuple(row) for row in result.all()]
+
+
+class HistoryCursor(NamedTuple):
+    """Position in the history feed ordered by (created, is_income, id) in descending order"""
+    created: datetime
+    is_income: bool
+    id: int
+
+
+class HistoryRecord(NamedTuple):
+    is_income: bool
+    id: int
+    created: datetime
+    amount: Decimal
+    category: str
+    description: Optional[str]
+
+    @property
+    def cursor(self) -> HistoryCursor:
+        return HistoryCursor(self.created, self.is_income, self.id)
+
+
+def _history_query(user_id: int, is_income: bool):
+    """Returns query of incomes or expenses of the user with names of categories in the form of HistoryRecord"""
+
+    table = Income if is_income else Expense
+    category_table = CategoryIncome if is_income else CategoryExpense
+    return (
+        select(
+            literal(is_income, Boolean).label('is_income'),
+            table.id.label('id'),
+            table.created.label('created'),
+            table.amount.label('amount'),
+            category_table.name.label('category'),
+            table.description.label('description'),
+        )
+        .join(category_table, category_table.id == table.category_id)
+        .where(table.user_id == user_id)
+    )
+
+
+async def orm_get_history_page(
+        session: AsyncSession,
+        telegram_id: int,
+        cursor: Optional[HistoryCursor] = None,
+        limit: int = 10,
+) -> tuple[list[HistoryRecord], Optional[HistoryCursor]]:
+    """
+    Returns page of incomes and expenses of user with specified telegram_id merged into one feed from new to old.
+    Uses keyset pagination: every table is read by index on (user_id, created, id) starting right after the cursor,
+    so any page costs the same as the first one.
+    :param cursor: cursor of the last record of the previous page, None for the first page
+    :param limit: number of records on the page
+    :return: records of the page and cursor of the next page (None if this page is the last one)
+    """
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    branches = []
+    for is_income in (False, True):
+        table = Income if is_income else Expense
+        query = (
+            _history_query(user_id, is_income)
+            .order_by(table.created.desc(), table.id.desc())
+            .limit(limit + 1)
+        )
+
+        if cursor is not None:
+            # (created, is_income, id) < cursor, where is_income is constant inside the branch
+            if is_income == cursor.is_income:
+                query = query.where(tuple_(table.created, table.id) < tuple_(cursor.created, cursor.id))
+            elif is_income < cursor.is_income:
+                query = query.where(table.created <= cursor.created)
+            else:
+                query = query.where(table.created < cursor.created)
+
+        branches.append(select(query.subquery()))
+
+    feed = union_all(*branches).subquery()
+    query = (
+        select(feed)
+        .order_by(feed.c.created.desc(), feed.c.is_income.desc(), feed.c.id.desc())
+        .limit(limit + 1)
+    )
+    result = await session.execute(query)
+    records = [HistoryRecord(*row) for row in result.all()]
+
+    if len(records) > limit:
+        records = records[:limit]
+        return records, records[-1].cursor
+    return records, None
+
+
+async def orm_stream_history(session: AsyncSession, telegram_id: int, batch_size: int = 1000) -> AsyncIterator[HistoryRecord]:
+    """
+    Yields all incomes and expenses of user with specified telegram_id from old to new.
+    Rows are fetched through a server-side cursor in batches, so memory use does not depend on the size of history.
+    """
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    feed = union_all(_history_query(user_id, False), _history_query(user_id, True)).subquery()
+    query = (
+        select(feed)
+        .order_by(feed.c.created, feed.c.is_income, feed.c.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    result = await session.stream(query)
+    async for row in result:
+        yield HistoryRecord(*row)
+
+
+async def orm_get_records_between(
+        session: AsyncSession,
+        telegram_id: int,
+        start: datetime,
+        end: datetime,
+        is_income: bool = False,
+) -> list[tuple[Decimal, datetime, Optional[str]]]:
+    """Returns (amount, created, description) of incomes or expenses of the user created between start and end inclusive"""
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    table = Income if is_income else Expense
+    query = (
+        select(table.amount, table.created, table.description)
+        .where(table.user_id == user_id, table.created >= start, table.created <= end)
+    )
+    result = await session.execute(query)
+    return [tuple(row) for row in result.all()]
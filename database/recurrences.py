@@ -0,0 +1,230 @@
+import calendar
+from datetime import datetime, timedelta, time
+from decimal import Decimal
+from typing import NamedTuple, Optional, Sequence
+
+from sqlalchemy import select, update, insert, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.dialect import dialect_insert
+from database.model import Recurrence, RecurrenceOccurrence, User, Income, Expense, CategoryIncome, CategoryExpense
+from database.orm_query import orm_get_user_id, orm_get_category_id
+from database.rollups import apply_rollup_deltas, RollupDelta
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+# Time of day when recurring records are added
+RECURRENCE_TIME = time(9, 0)
+# Maximum number of missed occurrences of one recurrence written at once, e.g. after a long downtime
+MAX_CATCH_UP_OCCURRENCES = 366
+# Occurrences registered by one multi-row INSERT, keeps the statement far below the limit of bind parameters
+# (65535 in PostgreSQL) when a batch of recurrences catches up after a long downtime
+OCCURRENCE_INSERT_CHUNK = 1000
+
+
+class MaterializedOccurrence(NamedTuple):
+    """Record written for an occurrence of a recurrence"""
+    recurrence_id: int
+    telegram_id: int
+    is_income: bool
+    amount: Decimal
+    category: str
+    description: Optional[str]
+    due: datetime
+
+
+def _add_month(due: datetime, day: int) -> datetime:
+    year, month = (due.year + 1, 1) if due.month == 12 else (due.year, due.month + 1)
+    return due.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(due: datetime, frequency: str, day: Optional[int] = None) -> datetime:
+    """Returns the occurrence following the one at due"""
+
+    if frequency == 'daily':
+        return due + timedelta(days=1)
+    if frequency == 'weekly':
+        return due + timedelta(weeks=1)
+    return _add_month(due, day or due.day)
+
+
+def first_occurrence(now: datetime, frequency: str, day: Optional[int] = None) -> datetime:
+    """
+    Returns the first occurrence after now at RECURRENCE_TIME. day is a day of month (1-31) of monthly recurrences
+    and a day of week (1 - Monday, 7 - Sunday) of weekly recurrences, today by default
+    """
+
+    due = datetime.combine(now.date(), RECURRENCE_TIME)
+    if frequency == 'weekly' and day is not None:
+        due += timedelta(days=(day - 1 - due.weekday()) % 7)
+    elif frequency == 'monthly' and day is not None:
+        due = due.replace(day=min(day, calendar.monthrange(due.year, due.month)[1]))
+
+    while due <= now:
+        due = next_occurrence(due, frequency, day)
+    return due
+
+
+async def orm_add_recurrence(
+        session: AsyncSession,
+        *,
+        telegram_id: int,
+        is_income: bool,
+        amount: Decimal,
+        category: str,
+        description: Optional[str] = None,
+        frequency: str,
+        day: Optional[int] = None,
+        now: Optional[datetime] = None,
+) -> Recurrence:
+    """Adds recurring income or expense of user with specified telegram_id starting from the next occurrence"""
+
+    if frequency not in FREQUENCIES:
+        raise ValueError(f'Unknown frequency: {frequency}')
+
+    now = now or datetime.now()
+    next_due = first_occurrence(now, frequency, day)
+    recurrence = Recurrence(
+        user_id=await orm_get_user_id(session, telegram_id),
+        category_id=await orm_get_category_id(session, telegram_id, category, is_income=is_income),
+        is_income=is_income,
+        amount=amount,
+        description=description,
+        frequency=frequency,
+        day=next_due.day if frequency == 'monthly' else None,
+        next_due=next_due,
+    )
+    session.add(recurrence)
+    await session.commit()
+    return recurrence
+
+
+async def orm_get_user_recurrences(session: AsyncSession, telegram_id: int) -> list[tuple[Recurrence, str]]:
+    """Returns active recurrences of the user with names of their categories"""
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    result = []
+    for is_income, category_table in ((False, CategoryExpense), (True, CategoryIncome)):
+        query = (
+            select(Recurrence, category_table.name)
+            .join(category_table, category_table.id == Recurrence.category_id)
+            .where(Recurrence.user_id == user_id, Recurrence.is_income == is_income, Recurrence.is_active == True)
+            .order_by(Recurrence.id)
+        )
+        result.extend((await session.execute(query)).tuples().all())
+    return result
+
+
+async def orm_deactivate_recurrence(session: AsyncSession, *, telegram_id: int, recurrence_id: int) -> bool:
+    """Stops recurrence of the user. Returns False if the user has no such active recurrence"""
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    query = (
+        update(Recurrence)
+        .where(Recurrence.id == recurrence_id, Recurrence.user_id == user_id, Recurrence.is_active == True)
+        .values(is_active=False)
+        .returning(Recurrence.id)
+    )
+    deactivated = (await session.execute(query)).first() is not None
+    await session.commit()
+    return deactivated
+
+
+async def orm_get_due_recurrences(
+        session: AsyncSession,
+        until: datetime,
+        after: Optional[tuple[datetime, int]] = None,
+        limit: int = 1000,
+) -> list[tuple[datetime, int]]:
+    """
+    Returns (next_due, id) of active recurrences due before until in order of (next_due, id),
+    starting after the specified (next_due, id)
+    """
+
+    query = (
+        select(Recurrence.next_due, Recurrence.id)
+        .where(Recurrence.is_active == True, Recurrence.next_due < until)
+        .order_by(Recurrence.next_due, Recurrence.id)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(tuple_(Recurrence.next_due, Recurrence.id) > tuple_(*after))
+    return [tuple(row) for row in (await session.execute(query)).all()]
+
+
+async def orm_materialize_recurrences(
+        session: AsyncSession,
+        recurrence_ids: Sequence[int],
+        now: datetime,
+) -> tuple[list[MaterializedOccurrence], dict[int, datetime]]:
+    """
+    Writes incomes and expenses for all occurrences of the recurrences due until now in one transaction and moves
+    the recurrences to their next occurrences. Every occurrence is registered in recurrence_occurrence first, so an
+    occurrence already written by another process or before a restart is skipped.
+    :return: written occurrences and new next_due by recurrence id
+    """
+
+    query = (
+        select(Recurrence, User.telegram_id)
+        .join(User, User.id == Recurrence.user_id)
+        .where(Recurrence.id.in_(recurrence_ids), Recurrence.is_active == True, Recurrence.next_due <= now)
+        .with_for_update(of=Recurrence, skip_locked=True)
+    )
+    rows = (await session.execute(query)).all()
+    if not rows:
+        await session.commit()
+        return [], {}
+
+    occurrences, next_dues = [], {}
+    for recurrence, telegram_id in rows:
+        due, count = recurrence.next_due, 0
+        while due <= now:
+            if count < MAX_CATCH_UP_OCCURRENCES:
+                occurrences.append({'recurrence_id': recurrence.id, 'due': due})
+                count += 1
+            due = next_occurrence(due, recurrence.frequency, recurrence.day)
+        recurrence.next_due = next_dues[recurrence.id] = due
+
+    # Registering occurrences, those registered earlier are not returned
+    new_occurrences = []
+    for start in range(0, len(occurrences), OCCURRENCE_INSERT_CHUNK):
+        query = (
+            dialect_insert(session, RecurrenceOccurrence)
+            .values(occurrences[start:start + OCCURRENCE_INSERT_CHUNK])
+            .on_conflict_do_nothing(index_elements=[RecurrenceOccurrence.recurrence_id, RecurrenceOccurrence.due])
+            .returning(RecurrenceOccurrence.recurrence_id, RecurrenceOccurrence.due)
+        )
+        new_occurrences.extend((await session.execute(query)).all())
+
+    recurrences = {recurrence.id: (recurrence, telegram_id) for recurrence, telegram_id in rows}
+    category_names = {}
+    for is_income, category_table in ((False, CategoryExpense), (True, CategoryIncome)):
+        category_ids = {recurrence.category_id for recurrence, _ in rows if recurrence.is_income == is_income}
+        if category_ids:
+            query = select(category_table.id, category_table.name).where(category_table.id.in_(category_ids))
+            category_names.update({(is_income, id_): name for id_, name in (await session.execute(query)).all()})
+
+    materialized, deltas = [], []
+    for is_income, table in ((False, Expense), (True, Income)):
+        records = []
+        for recurrence_id, due in new_occurrences:
+            recurrence, telegram_id = recurrences[recurrence_id]
+            if recurrence.is_income != is_income:
+                continue
+            records.append({
+                'amount': recurrence.amount,
+                'description': recurrence.description,
+                'created': due,
+                'user_id': recurrence.user_id,
+                'category_id': recurrence.category_id,
+            })
+            deltas.append(RollupDelta(recurrence.user_id, is_income, recurrence.category_id, due, recurrence.amount, 1))
+            materialized.append(MaterializedOccurrence(
+                recurrence_id, telegram_id, is_income, recurrence.amount,
+                category_names.get((is_income, recurrence.category_id), ''), recurrence.description, due,
+            ))
+        if records:
+            await session.execute(insert(table), records)
+
+    await apply_rollup_deltas(session, deltas)
+    await session.commit()
+    return materialized, next_dues
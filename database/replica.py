@@ -0,0 +1,56 @@
+import os
+import time
+from dataclasses import replace
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from dotenv import load_dotenv, find_dotenv
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session, ORMExecuteState
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+# Keys of Session.info
+READ_ONLY_KEY = 'read_only'
+COMMITTED_KEY = 'committed'
+
+
+class RecentWriters:
+    """
+    Remembers users who have written to the primary database during the last window seconds.
+    Their reads are sent to the primary too, so they see their own writes while the replica is lagging.
+    The time of the last write is kept in the FSM storage under its own destiny, so with redis or sql storage every
+    bot process sees writes made through the others. Wall clock time is stored, since it is compared across processes.
+    """
+
+    DESTINY = 'read_after_write'
+
+    def __init__(self, window: float = 5.0) -> None:
+        self.window = window
+
+    def _build_key(self, key: StorageKey) -> StorageKey:
+        return replace(key, destiny=self.DESTINY)
+
+    async def mark(self, storage: BaseStorage, key: StorageKey) -> None:
+        """Remembers that the user of the FSM key has just written to the primary database"""
+
+        await storage.set_data(self._build_key(key), {'written_at': time.time()})
+
+    async def wrote_recently(self, storage: BaseStorage, key: StorageKey) -> bool:
+        written = (await storage.get_data(self._build_key(key))).get('written_at')
+        return written is not None and time.time() - written < self.window
+
+
+recent_writers = RecentWriters(window=float(os.getenv('READ_AFTER_WRITE_SECONDS', 5)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_commit(session: Session) -> None:
+    session.info[COMMITTED_KEY] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _forbid_writes_in_read_only_session(orm_execute_state: ORMExecuteState) -> None:
+    if orm_execute_state.session.info.get(READ_ONLY_KEY) and not orm_execute_state.is_select:
+        raise InvalidRequestError('Read-only session can not execute statements changing data')
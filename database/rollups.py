@@ -0,0 +1,116 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, NamedTuple, Optional
+
+from sqlalchemy import select, delete, insert, func, literal, cast, Date, String, Boolean, Numeric
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.dialect import dialect_insert
+from database.model import CategoryRollup, Income, Expense
+
+PERIODS = ('day', 'month')
+# Totals changed by one upsert statement, keeps it far below the limit of bind parameters (65535 in PostgreSQL)
+UPSERT_CHUNK = 1000
+
+
+class RollupDelta(NamedTuple):
+    """Change of totals caused by adding (count=1) or deleting (count=-1 and negative amount) a record.
+    An edit is a deletion of the old values plus an addition of the new ones"""
+    user_id: int
+    is_income: bool
+    category_id: int
+    created: datetime
+    amount: Decimal
+    count: int
+
+
+def period_start(created: datetime | date, period: str) -> date:
+    """Returns the first day of the day or month period containing specified time"""
+
+    day = created.date() if isinstance(created, datetime) else created
+    return day if period == 'day' else day.replace(day=1)
+
+
+async def apply_rollup_deltas(session: AsyncSession, deltas: Iterable[RollupDelta]) -> dict[tuple, Decimal]:
+    """
+    Adds deltas to day and month totals with one upsert statement per UPSERT_CHUNK totals. Does not commit, so totals
+    are changed in the same transaction as the records.
+    :return: new totals by (user_id, period, period_start, is_income, category_id)
+    """
+
+    aggregated: dict[tuple, list] = {}
+    for delta in deltas:
+        for period in PERIODS:
+            key = (delta.user_id, period, period_start(delta.created, period), delta.is_income, delta.category_id)
+            totals = aggregated.setdefault(key, [Decimal(0), 0])
+            totals[0] += Decimal(str(delta.amount))
+            totals[1] += delta.count
+
+    if not aggregated:
+        return {}
+
+    rows = [
+        {'user_id': key[0], 'period': key[1], 'period_start': key[2], 'is_income': key[3], 'category_id': key[4],
+         'total': total, 'count': count}
+        for key, (total, count) in aggregated.items()
+    ]
+    totals = {}
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        query = dialect_insert(session, CategoryRollup).values(rows[start:start + UPSERT_CHUNK])
+        query = query.on_conflict_do_update(
+            index_elements=[CategoryRollup.user_id, CategoryRollup.period, CategoryRollup.period_start,
+                            CategoryRollup.is_income, CategoryRollup.category_id],
+            set_={
+                'total': CategoryRollup.total + query.excluded.total,
+                'count': CategoryRollup.count + query.excluded.count,
+            },
+        ).returning(CategoryRollup.user_id, CategoryRollup.period, CategoryRollup.period_start,
+                    CategoryRollup.is_income, CategoryRollup.category_id, CategoryRollup.total)
+
+        result = await session.execute(query)
+        totals.update({tuple(row[:5]): row[5] for row in result.all()})
+    return totals
+
+
+def _period_start_expression(session: AsyncSession, column, period: str):
+    """Returns SQL expression truncating the time column to the start of the period"""
+
+    if session.bind.dialect.name == 'sqlite':
+        return func.date(column) if period == 'day' else func.date(column, 'start of month')
+    return cast(func.date_trunc(period, column), Date)
+
+
+async def rebuild_rollups(session: AsyncSession, user_id: Optional[int] = None) -> None:
+    """
+    Recalculates day and month totals from incomes and expenses of one user or of all users if user_id is None.
+    Used for backfill of existing data and for repair. Does not commit
+    """
+
+    query = delete(CategoryRollup)
+    if user_id is not None:
+        query = query.where(CategoryRollup.user_id == user_id)
+    await session.execute(query)
+
+    for is_income, table in ((True, Income), (False, Expense)):
+        for period in PERIODS:
+            start = _period_start_expression(session, table.created, period)
+            source = (
+                select(
+                    table.user_id,
+                    literal(period, String(5)),
+                    start,
+                    literal(is_income, Boolean),
+                    table.category_id,
+                    cast(func.sum(table.amount), Numeric(14, 2)),
+                    func.count(),
+                )
+                .group_by(table.user_id, start, table.category_id)
+            )
+            if user_id is not None:
+                source = source.where(table.user_id == user_id)
+
+            await session.execute(
+                insert(CategoryRollup).from_select(
+                    ['user_id', 'period', 'period_start', 'is_income', 'category_id', 'total', 'count'], source
+                )
+            )
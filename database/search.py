@@ -0,0 +1,136 @@
+import re
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, func, case, union_all, table, column, literal_column, text, Numeric
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from database.model import Expense, Income
+from database.orm_query import orm_get_user_id, HistoryRecord, _history_query
+
+# Text search configuration of PostgreSQL stemming Russian words, so 'продукты' also finds 'продуктов'
+SEARCH_CONFIG = 'russian'
+# Maximum length of a search query
+MAX_QUERY_LENGTH = 100
+
+_SEARCH_TABLES = (Expense.__tablename__, Income.__tablename__)
+
+# The search query must use exactly the expression of the index, so the index is used
+_TSVECTOR = f"to_tsvector('{SEARCH_CONFIG}'::regconfig, description)"
+
+_POSTGRESQL_DDL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Whole words with stemming
+    'CREATE INDEX IF NOT EXISTS ix_{table}_description_fts ON {table} USING gin (' + _TSVECTOR + ')',
+    # Parts of words, e.g. 'такс' entered by the user, searched by ILIKE
+    'CREATE INDEX IF NOT EXISTS ix_{table}_description_trgm ON {table} USING gin (description gin_trgm_ops)',
+)
+
+# SQLite has no stemming, so words of the query are searched as prefixes in an FTS5 index kept in sync by triggers
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(description, content='{table}', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN '
+    'INSERT INTO {table}_fts(rowid, description) VALUES (new.id, new.description); END',
+    'CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN '
+    "INSERT INTO {table}_fts({table}_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    'CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF description ON {table} BEGIN '
+    "INSERT INTO {table}_fts({table}_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+    'INSERT INTO {table}_fts(rowid, description) VALUES (new.id, new.description); END',
+    # Indexing of existing records
+    "INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+)
+
+
+class SearchResult(NamedTuple):
+    """Page of records found by a search query and totals of all found records"""
+    records: list[HistoryRecord]
+    count: int
+    expenses_total: Decimal
+    incomes_total: Decimal
+
+
+async def create_search_indexes(conn: AsyncConnection) -> None:
+    """Creates full-text indexes of descriptions of incomes and expenses. Other databases are searched without index"""
+
+    statements = {'postgresql': _POSTGRESQL_DDL, 'sqlite': _SQLITE_DDL}.get(conn.dialect.name, ())
+    for table_name in _SEARCH_TABLES:
+        for statement in statements:
+            await conn.execute(text(statement.format(table=table_name)))
+
+
+def _search_words(query: str) -> list[str]:
+    return re.findall(r'\w+', query.lower())
+
+
+def prepare_query(query: str) -> Optional[str]:
+    """Returns the query stripped and cut to MAX_QUERY_LENGTH, None if it has no words to search"""
+
+    query = query.strip()[:MAX_QUERY_LENGTH]
+    return query if _search_words(query) else None
+
+
+def _match_condition(dialect_name: str, record_table, query: str):
+    """Returns condition of the records of the table whose descriptions match the query"""
+
+    if dialect_name == 'postgresql':
+        tsquery = func.plainto_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), query)
+        return literal_column(_TSVECTOR).op('@@')(tsquery) | record_table.description.icontains(query, autoescape=True)
+
+    if dialect_name == 'sqlite':
+        words = _search_words(query)
+        fts_table = table(f'{record_table.__tablename__}_fts', column('rowid'))
+        fts_query = ' '.join(f'"{word}"*' for word in words)
+        matches = select(fts_table.c.rowid).where(literal_column(fts_table.name).op('MATCH')(fts_query))
+        return record_table.id.in_(matches)
+
+    return record_table.description.icontains(query, autoescape=True)
+
+
+async def orm_search_history(
+        session: AsyncSession,
+        telegram_id: int,
+        query: str,
+        offset: int = 0,
+        limit: int = 10,
+) -> SearchResult:
+    """
+    Returns page of incomes and expenses of user with specified telegram_id whose descriptions match the query,
+    from new to old, with number and totals of all matching records. Descriptions are searched by full-text indexes,
+    and the page and totals are returned by one statement: totals are window aggregates over all matches
+    computed before the page is cut. A query without words finds nothing, so it is not sent to the database
+    """
+
+    query = prepare_query(query)
+    if query is None:
+        return SearchResult([], 0, Decimal(0), Decimal(0))
+
+    user_id = await orm_get_user_id(session, telegram_id)
+    dialect_name = session.bind.dialect.name
+
+    branches = []
+    for is_income in (False, True):
+        record_table = Income if is_income else Expense
+        branches.append(_history_query(user_id, is_income).where(_match_condition(dialect_name, record_table, query)))
+
+    feed = union_all(*branches).subquery()
+    statement = (
+        select(
+            feed,
+            func.count().over().label('count'),
+            func.sum(case((feed.c.is_income, 0), else_=feed.c.amount), type_=Numeric(14, 2)).over()
+            .label('expenses_total'),
+            func.sum(case((feed.c.is_income, feed.c.amount), else_=0), type_=Numeric(14, 2)).over()
+            .label('incomes_total'),
+        )
+        .order_by(feed.c.created.desc(), feed.c.is_income.desc(), feed.c.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+    rows = (await session.execute(statement)).all()
+    if not rows:
+        return SearchResult([], 0, Decimal(0), Decimal(0))
+
+    records = [HistoryRecord(*row[:len(HistoryRecord._fields)]) for row in rows]
+    count, expenses_total, incomes_total = rows[0][len(HistoryRecord._fields):]
+    return SearchResult(records, count, Decimal(expenses_total or 0), Decimal(incomes_total or 0))
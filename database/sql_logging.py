@@ -0,0 +1,91 @@
+import os
+import random
+import time
+
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+
+class SampledSqlLogger:
+    """
+    Logs a sample of SQL statements instead of echoing every statement with its parameters.
+    Each statement is logged with probability sample_rate and at most max_per_second statements are logged per second.
+    Statements executed longer than slow_threshold seconds are always logged as warnings.
+    """
+
+    def __init__(self, *, sample_rate: float = 0.0, max_per_second: int = 10, slow_threshold: float | None = None,
+                 log_parameters: bool = False) -> None:
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.slow_threshold = slow_threshold
+        self.log_parameters = log_parameters
+        self.suppressed = 0
+        self._window_start = 0.0
+        self._window_count = 0
+
+    def _allow(self) -> bool:
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return False
+
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            if self.suppressed:
+                logger.debug(f'{self.suppressed} sampled SQL statements were not logged because of rate limit')
+            self._window_start, self._window_count, self.suppressed = now, 0, 0
+        if self._window_count >= self.max_per_second:
+            self.suppressed += 1
+            return False
+        self._window_count += 1
+        return True
+
+    def _format(self, statement: str, parameters) -> str:
+        statement = ' '.join(statement.split())
+        return f'{statement} {parameters!r}' if self.log_parameters else statement
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('sql_logging_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        duration = time.perf_counter() - conn.info['sql_logging_started'].pop()
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            logger.warning(f'Slow SQL statement ({duration * 1000:.1f} ms): {self._format(statement, parameters)}')
+        elif self._allow():
+            logger.debug(f'SQL ({duration * 1000:.1f} ms): {self._format(statement, parameters)}')
+
+    def handle_error(self, exception_context) -> None:
+        # after_cursor_execute is not called for failed statements
+        if exception_context.connection is not None and exception_context.connection.info.get('sql_logging_started'):
+            exception_context.connection.info['sql_logging_started'].pop()
+
+    def register(self, engine: AsyncEngine) -> None:
+        event.listen(engine.sync_engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine.sync_engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(engine.sync_engine, 'handle_error', self.handle_error)
+
+
+def setup_sql_logging(engine: AsyncEngine) -> SampledSqlLogger | None:
+    """
+    Registers sampled SQL logging configured by environment variables:
+    SQL_LOG_SAMPLE_RATE (share of logged statements, 0 by default), SQL_LOG_MAX_PER_SECOND (10 by default),
+    SQL_LOG_SLOW_MS (threshold of slow statements) and SQL_LOG_PARAMETERS (log parameters of statements).
+    Returns None if nothing has to be logged
+    """
+
+    sample_rate = float(os.getenv('SQL_LOG_SAMPLE_RATE', 0))
+    slow_ms = os.getenv('SQL_LOG_SLOW_MS')
+    if not sample_rate and not slow_ms:
+        return None
+
+    sql_logger = SampledSqlLogger(
+        sample_rate=sample_rate,
+        max_per_second=int(os.getenv('SQL_LOG_MAX_PER_SECOND', 10)),
+        slow_threshold=float(slow_ms) / 1000 if slow_ms else None,
+        log_parameters=os.getenv('SQL_LOG_PARAMETERS', 'false').lower() in ('1', 'true', 'yes'),
+    )
+    sql_logger.register(engine)
+    return sql_logger
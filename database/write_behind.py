@@ -0,0 +1,225 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.orm_query import orm_add_income_expense, orm_add_incomes_expenses, SavedRecord
+from database.replica import COMMITTED_KEY
+from services.metrics import write_behind_batch_size, write_behind_flush_duration
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+
+@dataclass
+class WriteBehindStats:
+    """
+    Metrics of the write-behind queue. Keeps the last observations for percentile calculation,
+    observations are exported on the metrics endpoint too
+    """
+    batches: int = 0
+    rows: int = 0
+    failed_batches: int = 0
+    batch_sizes: deque = field(default_factory=lambda: deque(maxlen=1000))
+    flush_latencies: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    def observe(self, batch_size: int, flush_latency: float, *, failed: bool = False) -> None:
+        self.batches += 1
+        self.rows += batch_size
+        self.failed_batches += failed
+        self.batch_sizes.append(batch_size)
+        self.flush_latencies.append(flush_latency)
+        write_behind_batch_size.observe(batch_size)
+        write_behind_flush_duration.observe(flush_latency, 'error' if failed else 'ok')
+
+    def snapshot(self) -> dict[str, float]:
+        """Returns counters together with mean batch size and p50/p99 of flush latency in seconds"""
+
+        latencies = sorted(self.flush_latencies)
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'failed_batches': self.failed_batches,
+            'mean_batch_size': sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else 0.0,
+            'flush_latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+            'flush_latency_p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+
+class IncomeExpenseWriter:
+    """
+    Write-behind queue of incomes and expenses. Pending records are collected for max_delay seconds or until
+    max_batch records, then written with one multi-row INSERT per table in one transaction.
+    Every caller waits until the transaction with the caller's record is committed.
+    Records submitted after stopping has started are written directly, each in its own transaction.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, *, max_batch: int = 200, max_delay: float = 0.005) -> None:
+        self.session_pool = session_pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = WriteBehindStats()
+        self._queue: asyncio.Queue[Optional[tuple[dict, asyncio.Future]]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        """Starts background task flushing the queue"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flushes pending records and stops background task"""
+
+        if self._task is None:
+            return
+
+        self._stopping = True
+        # Sentinel is put after all pending records, so they are flushed before the task finishes
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._stopping = False
+
+    async def submit(self, **record) -> SavedRecord:
+        """
+        Puts income or expense to the queue and waits for commit of its batch. Accepts the same keyword arguments as
+        orm_add_income_expense. Raises SQLAlchemyError if the record was not written.
+        :return: the new record with state of the category limit
+        """
+
+        if self._stopping or self._task is None:
+            # Nobody will take the record from the queue after the sentinel
+            async with self.session_pool() as session:
+                return await orm_add_income_expense(session, **record)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.exception(f'Unexpected error when flushing write-behind queue: {e}')
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        """Writes batch of records in one transaction and resolves futures of callers"""
+
+        started = time.perf_counter()
+        records = [record for record, _ in batch]
+
+        try:
+            async with self.session_pool() as session:
+                results = await orm_add_incomes_expenses(session, records)
+                await session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f'Error when writing batch of {len(batch)} incomes/expenses, writing them one by one: {e}')
+            self.stats.observe(len(batch), time.perf_counter() - started, failed=True)
+            await asyncio.gather(*(self._write_single(record, future) for record, future in batch))
+            return
+
+        self.stats.observe(len(batch), time.perf_counter() - started)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _write_single(self, record: dict, future: asyncio.Future) -> None:
+        """Writes one record in its own transaction, so an error of one record does not affect others"""
+
+        try:
+            async with self.session_pool() as session:
+                result = await orm_add_income_expense(session, **record)
+        except SQLAlchemyError as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        if not future.done():
+            future.set_result(result)
+
+
+income_expense_writer: Optional[IncomeExpenseWriter] = None
+
+
+def is_write_behind_enabled() -> bool:
+    """Returns True if write-behind queue is switched on by WRITE_BEHIND_ENABLED environment variable"""
+    return os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+def start_write_behind(session_pool: async_sessionmaker) -> IncomeExpenseWriter:
+    """Creates and starts the write-behind queue configured from environment variables"""
+
+    global income_expense_writer
+    income_expense_writer = IncomeExpenseWriter(
+        session_pool,
+        max_batch=int(os.getenv('WRITE_BEHIND_MAX_BATCH', 200)),
+        max_delay=float(os.getenv('WRITE_BEHIND_MAX_DELAY_MS', 5)) / 1000,
+    )
+    income_expense_writer.start()
+    logger.info(f'Write-behind queue started with max_batch={income_expense_writer.max_batch}, '
+                f'max_delay={income_expense_writer.max_delay}s')
+    return income_expense_writer
+
+
+async def stop_write_behind() -> None:
+    """Flushes and stops the write-behind queue if it is running"""
+
+    global income_expense_writer
+    if income_expense_writer is not None:
+        await income_expense_writer.stop()
+        logger.info(f'Write-behind queue stopped, stats: {income_expense_writer.stats.snapshot()}')
+        income_expense_writer = None
+
+
+async def add_income_expense(session: AsyncSession, **record) -> SavedRecord:
+    """
+    Adds new income or expense through the write-behind queue if it is running, otherwise directly with
+    orm_add_income_expense. Accepts the same keyword arguments as orm_add_income_expense.
+    :return: the new record with state of the category limit
+    """
+
+    if income_expense_writer is None:
+        return await orm_add_income_expense(session, **record)
+
+    saved = await income_expense_writer.submit(**record)
+    # The record is committed by the session of the queue, so the handler session is marked as committed explicitly
+    # and DataBaseSession sends the user to the primary database
+    session.info[COMMITTED_KEY] = True
+    return saved
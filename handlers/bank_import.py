@@ -0,0 +1,100 @@
+import html
+from tempfile import SpooledTemporaryFile
+
+from aiogram import Router, F, Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command, StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import StatesGroup, State
+from aiogram.types import Message
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from keyboards.inline import get_cancel_button, get_back_button
+from services.bank_import import import_statement, ImportResult, StatementFormatError
+
+bank_import_router = Router()
+
+# Telegram Bot API does not allow bots to download larger files
+MAX_STATEMENT_SIZE = 20 * 1024 * 1024
+
+
+class ImportStatement(StatesGroup):
+    file = State()
+
+
+@bank_import_router.message(StateFilter(None), Command('import'), flags={'db_session': False})
+async def handle_import_command(message: Message, state: FSMContext):
+    """Handles command /import asking the user to send a bank statement"""
+
+    await message.delete()
+    sent_message = await message.answer(
+        'Отправьте выписку из банка в формате CSV.\n\n'
+        'В файле должны быть столбцы "Дата" и "Сумма" (расходы - с минусом), '
+        'а также, по желанию, "Описание" и "Категория".',
+        reply_markup=get_cancel_button())
+    await state.set_state(ImportStatement.file)
+    await state.update_data(previous_bot_message_id=sent_message.message_id)
+
+
+@bank_import_router.message(ImportStatement.file, F.document)
+async def handle_statement_file(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+    """Imports bank statement sent as a document reporting progress in one message"""
+
+    try:
+        await _import_statement_file(message, state, session, bot)
+    finally:
+        await state.clear()
+
+
+async def _import_statement_file(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+    """Downloads and imports the statement. The state is cleared by the caller whatever happens"""
+
+    state_data = await state.get_data()
+    await bot.delete_message(message.chat.id, state_data['previous_bot_message_id'])
+
+    if message.document.file_size and message.document.file_size > MAX_STATEMENT_SIZE:
+        await message.answer('Файл слишком большой, максимальный размер - 20 МБ', reply_markup=get_back_button())
+        return
+
+    progress_message = await message.answer('Загружаю выписку...')
+    # Number of records committed so far, reported if the import fails
+    added = 0
+
+    async def report_progress(result: ImportResult):
+        nonlocal added
+        added = result.added
+        # Progress is best-effort, a failed edit must not interrupt the import
+        try:
+            await progress_message.edit_text(f'Обработано строк: {result.processed}, добавлено: {result.added}')
+        except TelegramAPIError as e:
+            logger.debug(f'Could not report progress of import: {e}')
+
+    with SpooledTemporaryFile(max_size=MAX_STATEMENT_SIZE) as file:
+        await bot.download(message.document, destination=file)
+        file.seek(0)
+
+        try:
+            result = await import_statement(session, message.from_user.id, file, on_progress=report_progress)
+        except StatementFormatError as e:
+            logger.debug(f'Wrong statement from user with telegram_id={message.from_user.id}: {e}')
+            await progress_message.edit_text('Не удалось распознать выписку. Проверьте, что это CSV файл '
+                                             'со столбцами "Дата" и "Сумма".', reply_markup=get_back_button())
+            return
+        except SQLAlchemyError as e:
+            logger.error(f'Error when importing bank statement: {e}')
+            await session.rollback()
+            await progress_message.edit_text(f'При импорте произошла ошибка! Добавлено записей: {added}. '
+                                             f'Загрузите выписку ещё раз, уже добавленные записи не повторятся.',
+                                             reply_markup=get_back_button())
+            return
+
+    logger.debug(f'User with telegram_id={message.from_user.id} imported {result.added} records')
+    text = (f'<b>Импорт завершён</b>\n\nДобавлено: {result.added}\nДубликатов: {result.duplicates}\n'
+            f'Без категории: {result.unmatched}\nОшибочных строк: {result.invalid}')
+    if result.unmatched_examples:
+        text += '\n\nНе удалось определить категорию, например:\n' + '\n'.join(
+            html.escape(example) for example in result.unmatched_examples
+        )
+    await progress_message.edit_text(text, reply_markup=get_back_button())
@@ -0,0 +1,93 @@
+from datetime import date
+
+from aiogram import Router, F
+from aiogram.filters import StateFilter
+from aiogram.types import CallbackQuery, BufferedInputFile
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_get_statistics, orm_get_monthly_totals
+from handlers.menu_processing import MONTH_NAMES
+from keyboards.inline import MenuCallBack
+from services.charts import chart_service, render_pie_chart, render_bar_chart, data_version, ChartQueueFull
+
+charts_router = Router()
+
+# Number of months shown on the bar chart
+BAR_CHART_MONTHS = 6
+
+
+def _months_back(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def _get_pie_chart(session: AsyncSession, telegram_id: int):
+    """Returns key, rendering function and its arguments of the chart of expenses by category for the current month"""
+
+    month = date.today().replace(day=1)
+    rows = [row for row in await orm_get_statistics(session, telegram_id, month) if not row[0]]
+    if not rows:
+        return None
+
+    labels = tuple(name for _, name, _, _ in rows)
+    values = tuple(float(total) for _, _, total, _ in rows)
+    title = f'Расходы за {MONTH_NAMES[month.month - 1]} {month.year}'
+    key = (telegram_id, 'pie', month.isoformat(), data_version(labels, values))
+    return key, render_pie_chart, (title, labels, values)
+
+
+async def _get_bar_chart(session: AsyncSession, telegram_id: int):
+    """Returns key, rendering function and its arguments of the chart of incomes and expenses by month"""
+
+    month = date.today().replace(day=1)
+    months = [_months_back(month, count) for count in range(BAR_CHART_MONTHS - 1, -1, -1)]
+    totals = {(month_start, is_income): float(total)
+              for month_start, is_income, total in await orm_get_monthly_totals(session, telegram_id, months[0])}
+    if not totals:
+        return None
+
+    labels = tuple(f'{MONTH_NAMES[month_start.month - 1][:3]} {month_start:%y}' for month_start in months)
+    series = {
+        'Расходы': tuple(totals.get((month_start, False), 0.0) for month_start in months),
+        'Доходы': tuple(totals.get((month_start, True), 0.0) for month_start in months),
+    }
+    key = (telegram_id, 'bar', month.isoformat(), data_version(labels, series))
+    return key, render_bar_chart, ('Доходы и расходы по месяцам', labels, series)
+
+
+@charts_router.callback_query(StateFilter(None), MenuCallBack.filter(F.menu_name == 'chart'),
+                              flags={'db_session': 'read'})
+async def handle_chart(callback: CallbackQuery, callback_data: MenuCallBack, session: AsyncSession):
+    """Handles clicks on chart buttons of the statistics page sending the chart as a photo"""
+
+    logger.debug(f'User with telegram_id={callback.from_user.id} requested {callback_data.action} chart')
+    get_chart = _get_bar_chart if callback_data.action == 'bar' else _get_pie_chart
+    chart = await get_chart(session, callback.from_user.id)
+    # The connection is returned to the pool before rendering and uploading of the chart
+    await session.close()
+    if chart is None:
+        await callback.answer('Пока нет данных для диаграммы', show_alert=True)
+        return
+    key, render_function, args = chart
+
+    # The same chart has already been uploaded, so it is sent by file_id without rendering
+    file_id = chart_service.get_file_id(key)
+    if file_id is not None:
+        await callback.message.answer_photo(file_id)
+        await callback.answer()
+        return
+
+    try:
+        png = await chart_service.render(key, render_function, *args)
+    except ChartQueueFull:
+        await callback.answer('Сейчас строится слишком много диаграмм, попробуйте через минуту', show_alert=True)
+        return
+    except ImportError:
+        logger.error('matplotlib is not installed, charts are unavailable')
+        await callback.answer('Диаграммы недоступны', show_alert=True)
+        return
+
+    sent_message = await callback.message.answer_photo(BufferedInputFile(png, filename='chart.png'))
+    chart_service.set_file_id(key, sent_message.photo[-1].file_id)
+    await callback.answer()
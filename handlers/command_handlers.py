@@ -1,16 +1,17 @@
 from typing import Optional
 
 from aiogram import Router, F, Bot
-from aiogram.filters import CommandStart
+from aiogram.filters import CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup
 from aiogram.types import Message, CallbackQuery
 from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.orm_query import orm_add_user
-from handlers.menu_processing import get_main_page
-from keyboards.inline import MenuCallBack
+from handlers.menu_processing import get_main_page, get_statistics_text
+from keyboards.inline import MenuCallBack, get_statistics_buttons
 
 commands_handlers_router = Router()
 
@@ -22,10 +23,16 @@ async def handle_start_command(message: Message, state: FSMContext, session: Asy
     logger.debug(f'User with telegram_id={message.from_user.id} used command /start')
     await state.clear()
 
-    is_user_created = await orm_add_user(session,
-                                         telegram_id=message.from_user.id,
-                                         first_name=message.from_user.first_name,
-                                         last_name=message.from_user.last_name)
+    try:
+        is_user_created = await orm_add_user(session,
+                                             telegram_id=message.from_user.id,
+                                             first_name=message.from_user.first_name,
+                                             last_name=message.from_user.last_name)
+        statistics_text = None if is_user_created else await get_statistics_text(session, message.from_user.id)
+    except SQLAlchemyError as e:
+        logger.error(f'Error when processing command /start: {e}')
+        await message.answer('При запуске бота произошла ошибка! Попробуйте еще раз: /start')
+        return
 
     text, keyboard_markup = get_main_page(session=session, level=0, menu_name='main')
 
@@ -34,8 +41,7 @@ async def handle_start_command(message: Message, state: FSMContext, session: Asy
         sent_message = await message.answer(f'Hello, {message.from_user.first_name}', reply_markup=keyboard_markup)
 
     else:
-        # TODO Create function fetching statistics from database and formatting message with statistics
-        sent_message = await message.answer('Example statistics', reply_markup=keyboard_markup)
+        sent_message = await message.answer(statistics_text, reply_markup=keyboard_markup)
 
 
 @commands_handlers_router.callback_query(MenuCallBack.filter(F.level == 0))
@@ -50,7 +56,18 @@ async def handle_user_menu(callback: CallbackQuery, callback_data: MenuCallBack,
     await callback.answer()
 
 
-@commands_handlers_router.message()
+@commands_handlers_router.callback_query(StateFilter(None), MenuCallBack.filter(F.menu_name == 'statistics'),
+                                         flags={'db_session': 'read'})
+async def handle_statistics_menu(callback: CallbackQuery, session: AsyncSession):
+    """Handles click on inline menu button 'Статистика'"""
+
+    logger.debug(f'User with telegram_id={callback.from_user.id} opened statistics')
+    statistics_text = await get_statistics_text(session, callback.from_user.id)
+    await callback.message.edit_text(text=statistics_text, reply_markup=get_statistics_buttons())
+    await callback.answer()
+
+
+@commands_handlers_router.message(flags={'db_session': False})
 async def delete_user_message(message: Message):
     """Deletes all messages sent by a user"""
     await message.delete()
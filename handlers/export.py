@@ -0,0 +1,47 @@
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_stream_history
+from services.export import EXPORT_FORMATS, export_history, export_semaphore, SpooledInputFile
+
+export_router = Router()
+
+
+@export_router.message(Command('export'), flags={'db_session': 'read'})
+async def handle_export_command(message: Message, command: CommandObject, session: AsyncSession):
+    """Handles command /export [csv|xlsx] sending the whole history of the user as a document"""
+
+    export_format = (command.args or 'csv').strip().lower()
+    await message.delete()
+
+    if export_format not in EXPORT_FORMATS:
+        await message.answer(f'Доступные форматы выгрузки: {", ".join(EXPORT_FORMATS)}')
+        return
+
+    logger.debug(f'User with telegram_id={message.from_user.id} requested {export_format} export')
+    status_message = await message.answer('Готовлю выгрузку...')
+
+    async with export_semaphore:
+        try:
+            file, count = await export_history(orm_stream_history(session, message.from_user.id), export_format)
+        except ImportError:
+            logger.error('openpyxl is not installed, XLSX export is unavailable')
+            await status_message.edit_text('Выгрузка в XLSX недоступна, используйте /export csv')
+            return
+        except SQLAlchemyError as e:
+            logger.error(f'Error when exporting history: {e}')
+            await status_message.edit_text('При выгрузке произошла ошибка! Попробуйте еще раз.')
+            return
+        finally:
+            # The connection is returned to the pool before the file is uploaded
+            await session.close()
+
+        with file:
+            await message.answer_document(SpooledInputFile(file, filename=f'history.{export_format}'),
+                                          caption=f'Записей: {count}')
+
+    await status_message.delete()
@@ -0,0 +1,158 @@
+import html
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram import Router, F, Bot
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import StatesGroup, State
+from aiogram.types import CallbackQuery, Message
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_get_history_page, HistoryCursor, HistoryRecord
+from database.search import orm_search_history, SearchResult, prepare_query
+from keyboards.inline import MenuCallBack, get_history_buttons, get_search_buttons, get_cancel_button
+
+history_router = Router()
+
+HISTORY_PAGE_SIZE = 10
+EPOCH = datetime(1970, 1, 1)
+
+
+class SearchHistory(StatesGroup):
+    query = State()
+    results = State()
+
+    # Search query and previous_bot_message_id are kept in FSM storage, so pages of results are shown for the query
+    # without putting it into callback data (limited to 64 bytes)
+
+
+def encode_cursor(cursor: Optional[HistoryCursor]) -> Optional[str]:
+    """Encodes cursor compactly for callback data (limited to 64 bytes): hex microseconds, kind and hex id"""
+
+    if cursor is None:
+        return None
+    microseconds = (cursor.created - EPOCH) // timedelta(microseconds=1)
+    return f'{microseconds:x}.{int(cursor.is_income)}.{cursor.id:x}'
+
+
+def decode_cursor(value: Optional[str]) -> Optional[HistoryCursor]:
+    """Decodes cursor encoded by encode_cursor. Returns None for empty or malformed value"""
+
+    if not value:
+        return None
+    try:
+        microseconds, is_income, record_id = value.split('.')
+        return HistoryCursor(EPOCH + timedelta(microseconds=int(microseconds, 16)), is_income == '1', int(record_id, 16))
+    except ValueError:
+        return None
+
+
+def format_history_page(records: list[HistoryRecord]) -> str:
+    """Returns text of a history page"""
+
+    if not records:
+        return 'История операций пуста'
+
+    lines = ['<b>История операций</b>\n']
+    lines.extend(format_history_record(record) for record in records)
+    return '\n'.join(lines)
+
+
+def format_history_record(record: HistoryRecord) -> str:
+    """Returns line of a history page describing the record"""
+
+    line = f'{record.created:%d.%m %H:%M} {["➖", "➕"][record.is_income]} {record.amount:.2f} - {record.category}'
+    if record.description:
+        line += f' - {html.escape(record.description)}'
+    return line
+
+
+def format_search_page(query: str, result: SearchResult) -> str:
+    """Returns text of a page of search results with totals of all found records"""
+
+    query = html.escape(query)
+    if not result.count:
+        return f'По запросу «{query}» ничего не найдено'
+
+    lines = [
+        f'<b>Поиск: «{query}»</b>',
+        f'Найдено записей: {result.count}',
+        f'Расходы: {result.expenses_total:.2f}, доходы: {result.incomes_total:.2f}\n',
+    ]
+    lines.extend(format_history_record(record) for record in result.records)
+    return '\n'.join(lines)
+
+
+async def _get_search_page(session: AsyncSession, telegram_id: int, query: str, page: int):
+    """Returns text and keyboard of the page of search results"""
+
+    result = await orm_search_history(session, telegram_id, query, offset=page * HISTORY_PAGE_SIZE,
+                                      limit=HISTORY_PAGE_SIZE)
+    next_page = page + 1 if (page + 1) * HISTORY_PAGE_SIZE < result.count else None
+    return format_search_page(query, result), get_search_buttons(next_page=next_page, is_first_page=page == 0)
+
+
+@history_router.callback_query(StateFilter(None), MenuCallBack.filter(F.menu_name == 'history'),
+                               flags={'db_session': 'read'})
+async def handle_history_menu(callback: CallbackQuery, callback_data: MenuCallBack, session: AsyncSession):
+    """Handles click on inline menu button 'История' and history page buttons"""
+
+    logger.debug(f'User with telegram_id={callback.from_user.id} opened history page')
+    cursor = decode_cursor(callback_data.cursor)
+    records, next_cursor = await orm_get_history_page(session, callback.from_user.id, cursor, limit=HISTORY_PAGE_SIZE)
+
+    keyboard = get_history_buttons(next_cursor=encode_cursor(next_cursor), is_first_page=cursor is None)
+    await callback.message.edit_text(text=format_history_page(records), reply_markup=keyboard)
+    await callback.answer()
+
+
+@history_router.callback_query(StateFilter(None, SearchHistory.results), MenuCallBack.filter(F.menu_name == 'search'),
+                               MenuCallBack.filter(F.level == 2), flags={'db_session': False})
+async def handle_search_button(callback: CallbackQuery, state: FSMContext):
+    """Handles click on buttons 'Поиск' of a history page and 'Новый поиск' of search results"""
+
+    await callback.message.edit_text(
+        text='Введите слово или фразу из примечания, например: <i>такси</i>', reply_markup=get_cancel_button()
+    )
+    await state.set_data({'previous_bot_message_id': callback.message.message_id})
+    await state.set_state(SearchHistory.query)
+    await callback.answer()
+
+
+@history_router.message(SearchHistory.query, F.text, flags={'db_session': 'read'})
+async def handle_search_query(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
+    """Handles search query entered by the user and shows the first page of results"""
+
+    state_data = await state.get_data()
+    # Deleting the previous bot message and the message of the user with one request
+    await bot.delete_messages(message.chat.id, [state_data['previous_bot_message_id'], message.message_id])
+
+    query = prepare_query(message.text)
+    if query is None:
+        sent_message = await message.answer(
+            text='Запрос должен содержать слово или число, например: <i>такси</i>', reply_markup=get_cancel_button()
+        )
+        await state.update_data(previous_bot_message_id=sent_message.message_id)
+        return
+
+    logger.debug(f'User with telegram_id={message.from_user.id} searched history')
+    text, keyboard = await _get_search_page(session, message.from_user.id, query, page=0)
+    await message.answer(text=text, reply_markup=keyboard)
+
+    await state.set_data({'query': query})
+    await state.set_state(SearchHistory.results)
+
+
+@history_router.callback_query(SearchHistory.results, MenuCallBack.filter(F.menu_name == 'search'),
+                               MenuCallBack.filter(F.level == 3), flags={'db_session': 'read'})
+async def handle_search_page(callback: CallbackQuery, callback_data: MenuCallBack, state: FSMContext,
+                             session: AsyncSession):
+    """Handles page buttons of search results"""
+
+    query = (await state.get_data())['query']
+    page = int(callback_data.cursor) if (callback_data.cursor or '').isdigit() else 0
+    text, keyboard = await _get_search_page(session, callback.from_user.id, query, page)
+    await callback.message.edit_text(text=text, reply_markup=keyboard)
+    await callback.answer()
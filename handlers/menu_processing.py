@@ -1,8 +1,32 @@
+from datetime import date
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_get_statistics
 from keyboards.inline import get_main_menu_buttons
 
+MONTH_NAMES = ('январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+               'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь')
+
 
 def get_main_page(session, *, level: int, menu_name: str):
     text = menu_name
     keyboard = get_main_menu_buttons(level=0)
 
     return text, keyboard
+
+
+async def get_statistics_text(session: AsyncSession, telegram_id: int) -> str:
+    """Returns text with totals of incomes and expenses by category for the current month"""
+
+    month = date.today().replace(day=1)
+    statistics = await orm_get_statistics(session, telegram_id, month)
+    lines = [f'<b>Статистика за {MONTH_NAMES[month.month - 1]} {month.year}</b>']
+
+    for is_income, title in ((False, 'Расходы'), (True, 'Доходы')):
+        rows = [row for row in statistics if row[0] == is_income]
+        total = sum(row[2] for row in rows)
+        lines.append(f'\n<b>{title}: {total:.2f}</b>')
+        lines.extend(f'{name} — {category_total:.2f} ({count})' for _, name, category_total, count in rows)
+
+    return '\n'.join(lines)
@@ -0,0 +1,114 @@
+import html
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject, StateFilter
+from aiogram.types import Message
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_get_user_categories
+from database.recurrences import orm_add_recurrence, orm_get_user_recurrences, orm_deactivate_recurrence
+from keyboards.inline import get_back_button
+from services.quick_add import AMOUNT_TOKEN, CategoryResolver, evaluate_amount
+from services.recurrence_scheduler import schedule_recurrence
+
+recurrences_router = Router()
+
+KINDS = {'расход': False, 'доход': True}
+FREQUENCY_NAMES = {'ежедневно': 'daily', 'еженедельно': 'weekly', 'ежемесячно': 'monthly'}
+STOP_WORDS = ('удалить', 'стоп')
+
+REPEAT_USAGE = (
+    'Регулярные записи добавляются автоматически в 9:00.\n\n'
+    'Добавить: <code>/repeat расход ЖКХ 3000 ежемесячно 5 аренда</code>\n'
+    '(тип, категория, сумма, периодичность: ежедневно, еженедельно или ежемесячно, '
+    'день недели (1-7) или месяца (1-31) и примечание, день и примечание можно не указывать)\n'
+    'Удалить: <code>/repeat удалить 3</code>'
+)
+
+
+def format_recurrences(recurrences) -> str:
+    if not recurrences:
+        return 'Регулярных записей пока нет.'
+
+    frequencies = {value: name for name, value in FREQUENCY_NAMES.items()}
+    lines = ['<b>Регулярные записи</b>']
+    for recurrence, category in recurrences:
+        line = (f'{recurrence.id}. {["➖", "➕"][recurrence.is_income]} {recurrence.amount:.2f} - {category} - '
+                f'{frequencies[recurrence.frequency]}, следующая {recurrence.next_due:%d.%m.%Y}')
+        if recurrence.description:
+            line += f' - {html.escape(recurrence.description)}'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+async def _add_recurrence(message: Message, session: AsyncSession, words: list[str]) -> str:
+    """Adds recurrence described by words of the command and returns the answer to the user"""
+
+    is_income = KINDS[words[0].lower()]
+    amount_index = next((i for i, word in enumerate(words) if i > 1 and AMOUNT_TOKEN.match(word)), None)
+    if (
+            amount_index is None
+            or amount_index + 1 >= len(words)
+            or words[amount_index + 1].lower() not in FREQUENCY_NAMES
+    ):
+        return REPEAT_USAGE
+
+    try:
+        amount = evaluate_amount(words[amount_index])
+    except ValueError:
+        return 'Сумма должна быть положительным числом.'
+
+    categories = await orm_get_user_categories(session, telegram_id=message.from_user.id, is_income=is_income)
+    category = CategoryResolver(categories).resolve(' '.join(words[1:amount_index]))
+    if category is None:
+        return f'Категория не найдена. Доступные категории: {", ".join(categories)}'
+
+    frequency = FREQUENCY_NAMES[words[amount_index + 1].lower()]
+    rest = words[amount_index + 2:]
+    day = None
+    if rest and rest[0].isdigit() and frequency != 'daily':
+        day = int(rest.pop(0))
+        if not 1 <= day <= (7 if frequency == 'weekly' else 31):
+            return 'День недели должен быть от 1 до 7, день месяца - от 1 до 31.'
+
+    recurrence = await orm_add_recurrence(
+        session,
+        telegram_id=message.from_user.id,
+        is_income=is_income,
+        amount=amount,
+        category=category,
+        description=' '.join(rest)[:150] or None,
+        frequency=frequency,
+        day=day,
+    )
+    schedule_recurrence(recurrence.id, recurrence.next_due)
+    logger.debug(f'User with telegram_id={message.from_user.id} added recurrence with id={recurrence.id}')
+    return f'Регулярная запись добавлена, первая будет {recurrence.next_due:%d.%m.%Y в %H:%M}.'
+
+
+@recurrences_router.message(StateFilter(None), Command('repeat'))
+async def handle_repeat_command(message: Message, command: CommandObject, session: AsyncSession):
+    """Handles command /repeat listing, adding and deleting recurring incomes and expenses"""
+
+    await message.delete()
+    words = (command.args or '').split()
+
+    try:
+        if not words:
+            text = format_recurrences(await orm_get_user_recurrences(session, message.from_user.id))
+            text += f'\n\n{REPEAT_USAGE}'
+        elif words[0].lower() in STOP_WORDS and len(words) == 2 and words[1].isdigit():
+            deactivated = await orm_deactivate_recurrence(session, telegram_id=message.from_user.id,
+                                                          recurrence_id=int(words[1]))
+            text = 'Регулярная запись удалена.' if deactivated else 'Регулярная запись не найдена.'
+        elif words[0].lower() in KINDS:
+            text = await _add_recurrence(message, session, words)
+        else:
+            text = REPEAT_USAGE
+    except SQLAlchemyError as e:
+        logger.error(f'Error when processing command /repeat: {e}')
+        text = 'При обработке команды произошла ошибка! Попробуйте еще раз.'
+
+    await message.answer(text, reply_markup=get_back_button())
@@ -1,6 +1,6 @@
 ############# Finite state machine for adding new income or expense #############
+import html
 from datetime import datetime
-from typing import Optional
 
 from aiogram import F, Router, Bot
 from aiogram.filters import StateFilter
@@ -11,10 +11,12 @@ from loguru import logger
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.orm_query import orm_get_user_categories, orm_add_income_expense
+from database.orm_query import orm_get_user_categories
+from database.write_behind import add_income_expense
 from handlers.menu_processing import get_main_page
 from keyboards.inline import MenuCallBack, get_cancel_button, get_category_list_buttons, get_skip_buttons, \
     get_save_buttons, get_main_menu_buttons
+from services.quick_add import parse_quick_add, save_quick_add, QuickAddResult
 
 state_machines_router = Router()
 
@@ -26,13 +28,21 @@ class AddIncomeExpense(StatesGroup):
     category = State()
     description = State()
 
-    is_income: Optional[bool] = None
-    previous_bot_message_id: Optional[int] = None
+    # Flow data (is_income, previous_bot_message_id, amount, category, description) is kept in FSM storage,
+    # so concurrent flows of different users do not interfere and any worker can continue the flow
+
+
+# Hints about adding several records with one message, shown with the amount prompt
+QUICK_ADD_HINTS = {
+    False: 'Можно добавить несколько расходов одним сообщением, например: <i>продукты 250,50; 120+45 отдых</i>',
+    True: 'Можно добавить несколько доходов одним сообщением, например: <i>зарплата 50000; вклады 1200,50</i>',
+}
 
 
 @state_machines_router.callback_query(
     StateFilter(None),
-    MenuCallBack.filter(F.menu_name.in_(['add_expense', 'add_income']))
+    MenuCallBack.filter(F.menu_name.in_(['add_expense', 'add_income'])),
+    flags={'db_session': False},
 )
 async def add_income_expense_callback(
         callback: CallbackQuery,
@@ -41,29 +51,39 @@ async def add_income_expense_callback(
 ):
     """Handles clicks on inline menu buttons 'Добавить расход' and 'Добавить доход'"""
 
-    if callback_data.menu_name == 'add_expense':
-        await callback.message.edit_text(text='Введите сумму расхода: ', reply_markup=get_cancel_button())
-        AddIncomeExpense.is_income = False
-    elif callback_data.menu_name == 'add_income':
-        await callback.message.edit_text(text='Введите сумму дохода: ', reply_markup=get_cancel_button())
-        AddIncomeExpense.is_income = True
+    is_income = callback_data.menu_name == 'add_income'
+    if is_income:
+        await callback.message.edit_text(text=f'Введите сумму дохода: \n\n{QUICK_ADD_HINTS[is_income]}',
+                                         reply_markup=get_cancel_button())
+    else:
+        await callback.message.edit_text(text=f'Введите сумму расхода: \n\n{QUICK_ADD_HINTS[is_income]}',
+                                         reply_markup=get_cancel_button())
 
-    AddIncomeExpense.previous_bot_message_id = callback.message.message_id
+    await state.update_data(is_income=is_income, previous_bot_message_id=callback.message.message_id)
     await state.set_state(AddIncomeExpense.amount)
 
 
-@state_machines_router.message(AddIncomeExpense.amount)
+@state_machines_router.message(AddIncomeExpense.amount, F.text)
 async def add_income_expense_amount(message: Message, state: FSMContext, session: AsyncSession, bot: Bot):
-    await bot.delete_message(message.chat.id, AddIncomeExpense.previous_bot_message_id)
-    text = message.text
+    state_data = await state.get_data()
+    is_income = state_data['is_income']
+    # Deleting the previous bot message and the message of the user with one request
+    await bot.delete_messages(message.chat.id, [state_data['previous_bot_message_id'], message.message_id])
+    text = message.text.replace(',', '.')
     number_parts = text.split('.')
-    await message.delete()
 
     if (
             len(number_parts) > 2
             or (len(number_parts) == 1 and not number_parts[0].isdigit())
             or (len(number_parts) == 2 and not (number_parts[0].isdigit() and number_parts[1].isdigit()))
     ):
+        # The message is not a single amount, so it may contain several records
+        categories = await orm_get_user_categories(session, telegram_id=message.from_user.id, is_income=is_income)
+        quick_add = parse_quick_add(message.text, categories)
+        if quick_add.entries:
+            await save_quick_add_entries(message, state, session, is_income, quick_add)
+            return
+
         sent_message = await message.answer(
             '<b>Вводить можно только положительное десятичное число, разделённое точкой!</b>\n\nВведите сумму корректно:',
             reply_markup=get_cancel_button())
@@ -75,7 +95,7 @@ async def add_income_expense_amount(message: Message, state: FSMContext, session
         categories = await orm_get_user_categories(
             session,
             telegram_id=message.from_user.id,
-            is_income=AddIncomeExpense.is_income
+            is_income=is_income
         )
         category_names = list(categories.keys())
 
@@ -84,56 +104,93 @@ async def add_income_expense_amount(message: Message, state: FSMContext, session
         keyboard = get_category_list_buttons(
             categories=category_names,
             level=1,
-            menu_name=['add_expense', 'add_income'][AddIncomeExpense.is_income],
+            menu_name=['add_expense', 'add_income'][is_income],
             create_add_button=False,
             sizes=sizes,
         )
         sent_message = await message.answer(
-            f'Выберите категорию {"дохода" if AddIncomeExpense.is_income else "расхода"}:',
+            f'Выберите категорию {"дохода" if is_income else "расхода"}:',
             reply_markup=keyboard)
 
         amount = round(float(text), 2)
         await state.update_data(amount=amount)
         await state.set_state(AddIncomeExpense.category)
 
-    AddIncomeExpense.previous_bot_message_id = sent_message.message_id
+    await state.update_data(previous_bot_message_id=sent_message.message_id)
+
 
+async def save_quick_add_entries(message: Message, state: FSMContext, session: AsyncSession, is_income: bool,
+                                 quick_add: QuickAddResult):
+    """Saves records parsed from one message in one transaction and reports them with the main menu"""
 
-@state_machines_router.callback_query(AddIncomeExpense.category, MenuCallBack.filter(F.level != 0))
+    try:
+        saved_records = await save_quick_add(session, message.from_user.id, is_income, quick_add.entries)
+    except SQLAlchemyError as e:
+        logger.error(f'Error when adding incomes or expenses from one message: {e}')
+        sent_message = await message.answer('При добавлении записей произошла ошибка! Попробуйте еще раз.',
+                                            reply_markup=get_cancel_button())
+        await state.update_data(previous_bot_message_id=sent_message.message_id)
+        return
+
+    logger.debug(f'Added {len(saved_records)} incomes/expenses from one message for user with '
+                 f'telegram_id={message.from_user.id}')
+    sign = ["➖", "➕"][is_income]
+    lines = [f'<b>Добавлено записей: {len(saved_records)}</b>']
+    for entry in quick_add.entries:
+        line = f'{sign} {entry.amount:.2f} - {entry.category}'
+        lines.append(f'{line} - {html.escape(entry.description)}' if entry.description else line)
+    if quick_add.errors:
+        lines.append('\nНе удалось разобрать: ' + html.escape('; '.join(quick_add.errors)))
+
+    # Reporting the last state of every category limit reached by the new records
+    limit_statuses = {entry.category: saved.limit_status for entry, saved in zip(quick_add.entries, saved_records)
+                      if saved.limit_status is not None and saved.limit_status.status != 'ok'}
+    for category, limit_status in limit_statuses.items():
+        if limit_status.status == 'warning':
+            lines.append(f'\nЛимит категории "{category}" израсходован на {limit_status.ratio:.0%}. '
+                         f'Осталось: {limit_status.remaining:.2f}')
+        else:
+            lines.append(f'\nЛимит категории "{category}" превышен на {-limit_status.remaining:.2f}')
+
+    await state.clear()
+    await message.answer('\n'.join(lines), reply_markup=get_main_menu_buttons(level=0))
+
+
+@state_machines_router.callback_query(AddIncomeExpense.category, MenuCallBack.filter(F.level != 0),
+                                     flags={'db_session': False})
 async def add_income_expense_category(callback: CallbackQuery, callback_data: MenuCallBack, state: FSMContext):
-    await state.update_data(category=callback_data.category)
+    await state.update_data(category=callback_data.category, previous_bot_message_id=callback.message.message_id)
     await callback.message.edit_text('Введите примечание к операции или нажмите кнопку "Пропустить":',
                                      reply_markup=get_skip_buttons())
     await state.set_state(AddIncomeExpense.description)
-    AddIncomeExpense.previous_bot_message_id = callback.message.message_id
     await callback.answer()
 
 
-@state_machines_router.callback_query(AddIncomeExpense.description, MenuCallBack.filter(F.action == 'skip'))
+@state_machines_router.callback_query(AddIncomeExpense.description, MenuCallBack.filter(F.action == 'skip'),
+                                     flags={'db_session': False})
 async def skip_income_expense_description(callback: CallbackQuery, state: FSMContext):
-    await state.update_data(description=None)
-    state_data = await state.get_data()
-    message_text = f'{["➖", "➕"][AddIncomeExpense.is_income]} {state_data["amount"]:.2f} - {state_data["category"]}'
+    state_data = await state.update_data(description=None, previous_bot_message_id=callback.message.message_id)
+    message_text = f'{["➖", "➕"][state_data["is_income"]]} {state_data["amount"]:.2f} - {state_data["category"]}'
     await callback.message.edit_text(message_text, reply_markup=get_save_buttons())
-    AddIncomeExpense.previous_bot_message_id = callback.message.message_id
     await callback.answer()
 
 
-@state_machines_router.message(AddIncomeExpense.description)
+@state_machines_router.message(AddIncomeExpense.description, F.text, flags={'db_session': False})
 async def add_income_expense_description(message: Message, state: FSMContext, bot: Bot):
-    await bot.delete_message(message.chat.id, AddIncomeExpense.previous_bot_message_id)
+    state_data = await state.get_data()
+    await bot.delete_messages(message.chat.id, [state_data['previous_bot_message_id'], message.message_id])
     text = message.text
-    await message.delete()
 
     if len(text) > 150:
-        await message.answer(
+        sent_message = await message.answer(
             '<b>Длина примечания не должна превышать 150 символов!</b>\n\nВведите примечание корректно:',
             reply_markup=get_skip_buttons())
     else:
-        await state.update_data(description=text)
-        state_data = await state.get_data()
-        message_text = f'{["➖", "➕"][AddIncomeExpense.is_income]} {state_data["amount"]:.2f} - {state_data["category"]} - {state_data["description"]}'
-        await message.answer(message_text, reply_markup=get_save_buttons())
+        state_data = await state.update_data(description=text)
+        message_text = f'{["➖", "➕"][state_data["is_income"]]} {state_data["amount"]:.2f} - {state_data["category"]} - {state_data["description"]}'
+        sent_message = await message.answer(message_text, reply_markup=get_save_buttons())
+
+    await state.update_data(previous_bot_message_id=sent_message.message_id)
 
 
 @state_machines_router.callback_query(AddIncomeExpense.description, MenuCallBack.filter(F.action == 'save'))
@@ -142,23 +199,32 @@ async def save_income_expense(callback: CallbackQuery, state: FSMContext, sessio
     date_time = datetime.now()
 
     try:
-        await orm_add_income_expense(
+        saved_record = await add_income_expense(
             session,
             telegram_id=callback.from_user.id,
-            is_income=AddIncomeExpense.is_income,
+            is_income=state_data["is_income"],
             amount=state_data["amount"],
             category=state_data["category"],
             description=state_data["description"],
             date_time=date_time,
         )
-        logger.debug(f'Added new income/expense for user with telegram_id = {callback.message.from_user.id}')
-        await callback.answer('Запись добавлена успешно!')
+        logger.debug(f'Added new income/expense with id={saved_record.id} for user with telegram_id={callback.from_user.id}')
+        limit_status = saved_record.limit_status
+        if limit_status is None or limit_status.status == 'ok':
+            await callback.answer('Запись добавлена успешно!')
+        elif limit_status.status == 'warning':
+            await callback.answer(
+                f'Запись добавлена успешно!\n\nЛимит категории "{state_data["category"]}" израсходован на '
+                f'{limit_status.ratio:.0%}. Осталось: {limit_status.remaining:.2f}', show_alert=True)
+        else:
+            await callback.answer(
+                f'Запись добавлена успешно!\n\nЛимит категории "{state_data["category"]}" превышен на '
+                f'{-limit_status.remaining:.2f}', show_alert=True)
 
     except SQLAlchemyError as e:
         logger.error(f'Error when adding income or expense: {e}')
         await callback.answer('При добавлении записи произошла ошибка! Попробуйте еще раз.', show_alert=True)
 
-    AddIncomeExpense.is_income = None
     await state.clear()
     text, keyboard_markup = get_main_page(session, level=0, menu_name='main')
     await callback.message.edit_text(text=text, reply_markup=keyboard_markup)
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Optional
 
 from aiogram.filters.callback_data import CallbackData
@@ -11,16 +12,14 @@ class MenuCallBack(CallbackData, prefix='menu'):
     menu_name: str = 'main'
     category: Optional[str] = None
     action: Optional[str] = None
+    cursor: Optional[str] = None
 
 
-def get_main_menu_buttons(*, level: int, sizes: tuple[int, ...] = (2,)) -> InlineKeyboardMarkup:
-    """
-    Returns main menu inline keyboard
-    :param level: menu level
-    :param sizes: size of keyboard
-    :return: inline keyboard markup
-    """
+# Markups are immutable in practice (they are only serialized when sent), so they are built once and shared.
+# Static keyboards are built at import time, keyboards with parameters are memoized with bounded LRU caches.
+
 
+def _build_main_menu_buttons(level: int, sizes: tuple[int, ...]) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     buttons = {
         'Добавить расход': 'add_expense',
@@ -39,32 +38,37 @@ def get_main_menu_buttons(*, level: int, sizes: tuple[int, ...] = (2,)) -> Inlin
     return keyboard.adjust(*sizes).as_markup()
 
 
-def get_cancel_button() -> InlineKeyboardMarkup:
-    """Returns inline keyboard markup with button 'Отмена'"""
-
-    keyboard = InlineKeyboardBuilder()
-    keyboard.add(InlineKeyboardButton(text='Отмена ❌', callback_data=MenuCallBack(level=0, menu_name='main').pack()))
-
-    return keyboard.as_markup()
+_cached_main_menu_buttons = lru_cache(maxsize=32)(_build_main_menu_buttons)
 
 
-def get_category_list_buttons(*,
-                              categories: list[str],
-                              level: int,
-                              menu_name: str,
-                              create_add_button: bool = False,
-                              sizes: tuple[int, ...] = (2,)
-                              ) -> InlineKeyboardMarkup:
+def get_main_menu_buttons(*, level: int, sizes: tuple[int, ...] = (2,)) -> InlineKeyboardMarkup:
     """
-    Returns inline keyboard with categories
-    :param categories: list of category names
+    Returns main menu inline keyboard
     :param level: menu level
-    :param menu_name: menu name
-    :param create_add_button: if True, 'Добавить' button will be added to the keyboard
     :param sizes: size of keyboard
     :return: inline keyboard markup
     """
+    return _cached_main_menu_buttons(level, tuple(sizes))
+
 
+def _build_cancel_button() -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(InlineKeyboardButton(text='Отмена ❌', callback_data=MenuCallBack(level=0, menu_name='main').pack()))
+
+    return keyboard.as_markup()
+
+
+def get_cancel_button() -> InlineKeyboardMarkup:
+    """Returns inline keyboard markup with button 'Отмена'"""
+    return _STATIC_KEYBOARDS['cancel']
+
+
+def _build_category_list_buttons(categories: tuple[str, ...],
+                                 level: int,
+                                 menu_name: str,
+                                 create_add_button: bool,
+                                 sizes: tuple[int, ...]
+                                 ) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
 
     if create_add_button:
@@ -84,9 +88,29 @@ def get_category_list_buttons(*,
     return keyboard.adjust(*sizes).as_markup()
 
 
-def get_skip_buttons() -> InlineKeyboardMarkup:
-    """Returns inline keyboard markup with buttons 'Пропустить' and 'Отмена'"""
+_cached_category_list_buttons = lru_cache(maxsize=1024)(_build_category_list_buttons)
+
+
+def get_category_list_buttons(*,
+                              categories: list[str],
+                              level: int,
+                              menu_name: str,
+                              create_add_button: bool = False,
+                              sizes: tuple[int, ...] = (2,)
+                              ) -> InlineKeyboardMarkup:
+    """
+    Returns inline keyboard with categories
+    :param categories: list of category names
+    :param level: menu level
+    :param menu_name: menu name
+    :param create_add_button: if True, 'Добавить' button will be added to the keyboard
+    :param sizes: size of keyboard
+    :return: inline keyboard markup
+    """
+    return _cached_category_list_buttons(tuple(categories), level, menu_name, create_add_button, tuple(sizes))
 
+
+def _build_skip_buttons() -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     keyboard.add(
         InlineKeyboardButton(text='Пропустить ▶', callback_data=MenuCallBack(action='skip').pack())
@@ -98,9 +122,12 @@ def get_skip_buttons() -> InlineKeyboardMarkup:
     return keyboard.adjust(1).as_markup()
 
 
-def get_save_buttons() -> InlineKeyboardMarkup:
-    """Returns inline keyboard markup with buttons 'Сохранить' and 'Отмена'"""
+def get_skip_buttons() -> InlineKeyboardMarkup:
+    """Returns inline keyboard markup with buttons 'Пропустить' and 'Отмена'"""
+    return _STATIC_KEYBOARDS['skip']
+
 
+def _build_save_buttons() -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     keyboard.add(
         InlineKeyboardButton(text='Сохранить ✅', callback_data=MenuCallBack(action='save').pack())
@@ -110,3 +137,103 @@ def get_save_buttons() -> InlineKeyboardMarkup:
     )
 
     return keyboard.adjust(1).as_markup()
+
+
+def get_save_buttons() -> InlineKeyboardMarkup:
+    """Returns inline keyboard markup with buttons 'Сохранить' and 'Отмена'"""
+    return _STATIC_KEYBOARDS['save']
+
+
+def _build_back_button() -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(InlineKeyboardButton(text='Назад ◀', callback_data=MenuCallBack(level=0, menu_name='main').pack()))
+
+    return keyboard.as_markup()
+
+
+def get_back_button() -> InlineKeyboardMarkup:
+    """Returns inline keyboard markup with button 'Назад' leading to the main menu"""
+    return _STATIC_KEYBOARDS['back']
+
+
+def _build_statistics_buttons() -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(InlineKeyboardButton(
+        text='Диаграмма 🥧', callback_data=MenuCallBack(level=2, menu_name='chart', action='pie').pack()
+    ))
+    keyboard.add(InlineKeyboardButton(
+        text='По месяцам 📊', callback_data=MenuCallBack(level=2, menu_name='chart', action='bar').pack()
+    ))
+    keyboard.add(InlineKeyboardButton(text='Назад ◀', callback_data=MenuCallBack(level=0, menu_name='main').pack()))
+
+    return keyboard.adjust(2, 1).as_markup()
+
+
+def get_statistics_buttons() -> InlineKeyboardMarkup:
+    """Returns inline keyboard markup of statistics page with chart buttons and button 'Назад'"""
+    return _STATIC_KEYBOARDS['statistics']
+
+
+def get_history_buttons(*, next_cursor: Optional[str], is_first_page: bool) -> InlineKeyboardMarkup:
+    """
+    Returns inline keyboard of a history page
+    :param next_cursor: encoded cursor of the next page, None if the page is the last one
+    :param is_first_page: if False, 'В начало' button will be added to the keyboard
+    :return: inline keyboard markup
+    """
+
+    keyboard = InlineKeyboardBuilder()
+
+    if next_cursor is not None:
+        keyboard.add(InlineKeyboardButton(
+            text='Далее ▶', callback_data=MenuCallBack(level=1, menu_name='history', cursor=next_cursor).pack()
+        ))
+    if not is_first_page:
+        keyboard.add(InlineKeyboardButton(
+            text='В начало ⏮', callback_data=MenuCallBack(level=1, menu_name='history').pack()
+        ))
+    navigation_buttons = len(list(keyboard.buttons))
+    keyboard.add(InlineKeyboardButton(text='Поиск 🔎', callback_data=MenuCallBack(level=2, menu_name='search').pack()))
+    keyboard.add(InlineKeyboardButton(text='Назад ◀', callback_data=MenuCallBack(level=0, menu_name='main').pack()))
+
+    return keyboard.adjust(*([navigation_buttons] if navigation_buttons else []), 2).as_markup()
+
+
+def get_search_buttons(*, next_page: Optional[int], is_first_page: bool) -> InlineKeyboardMarkup:
+    """
+    Returns inline keyboard of a page of search results
+    :param next_page: number of the next page, None if the page is the last one
+    :param is_first_page: if False, 'В начало' button will be added to the keyboard
+    :return: inline keyboard markup
+    """
+
+    keyboard = InlineKeyboardBuilder()
+
+    if next_page is not None:
+        keyboard.add(InlineKeyboardButton(
+            text='Далее ▶', callback_data=MenuCallBack(level=3, menu_name='search', cursor=str(next_page)).pack()
+        ))
+    if not is_first_page:
+        keyboard.add(InlineKeyboardButton(
+            text='В начало ⏮', callback_data=MenuCallBack(level=3, menu_name='search', cursor='0').pack()
+        ))
+    navigation_buttons = len(list(keyboard.buttons))
+    keyboard.add(InlineKeyboardButton(
+        text='Новый поиск 🔎', callback_data=MenuCallBack(level=2, menu_name='search').pack()
+    ))
+    keyboard.add(InlineKeyboardButton(text='Назад ◀', callback_data=MenuCallBack(level=0, menu_name='main').pack()))
+
+    return keyboard.adjust(*([navigation_buttons] if navigation_buttons else []), 2).as_markup()
+
+
+# Registry of static keyboards built at import time
+_STATIC_KEYBOARDS: dict[str, InlineKeyboardMarkup] = {
+    'back': _build_back_button(),
+    'cancel': _build_cancel_button(),
+    'skip': _build_skip_buttons(),
+    'save': _build_save_buttons(),
+    'statistics': _build_statistics_buttons(),
+}
+
+# Main menu is shown after every finished action, so it is built in advance too
+get_main_menu_buttons(level=0)
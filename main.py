@@ -1,69 +1,188 @@
+# Imported first, so the startup report includes importing of the bot
+from services.startup import startup_timer
+
 import asyncio
 import os
+import sys
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand, BotCommandScopeAllPrivateChats
 from dotenv import load_dotenv, find_dotenv
 from loguru import logger
 
-from database.engine import drop_db, create_db, session_maker
+from database.engine import (drop_db, migrate_db, check_schema, session_maker, engine, read_session_maker,
+                             read_engine, get_update_concurrency, db_url)
+from database.write_behind import is_write_behind_enabled, start_write_behind, stop_write_behind
+from handlers.bank_import import bank_import_router
+from handlers.charts import charts_router
 from handlers.command_handlers import commands_handlers_router
+from handlers.export import export_router
+from handlers.history import history_router
+from handlers.recurrences import recurrences_router
 from handlers.state_machines import state_machines_router
+from middlewares.concurrency import ConcurrencyLimitMiddleware
 from middlewares.db_session import DataBaseSession
+from middlewares.logging_context import LoggingContextMiddleware
+from middlewares.metrics import setup_metrics_middlewares, MeasuredEventIsolation
+from middlewares.request_scheduler import RequestScheduler
+from middlewares.throttling import ThrottlingMiddleware
+from services.charts import chart_service
+from services.recurrence_scheduler import start_recurrence_scheduler, stop_recurrence_scheduler
+from storages.factory import create_fsm_storage
+from webserver.metrics import is_metrics_enabled, start_metrics_server, stop_metrics_server
+from webserver.webhook import is_webhook_mode, run_webhook, set_webhook
 
 # Loading environment variables
 load_dotenv(find_dotenv())
 
 # Initializing Bot and Dispatcher
 bot = Bot(token=os.getenv('BOT_TOKEN'), default=DefaultBotProperties(parse_mode='HTML'))
-dp = Dispatcher(storage=MemoryStorage())
+# Updates of one user in a chat are processed one by one in order of arrival, so FSM state of an update is read
+# after the previous update changed it. Updates of different users are processed concurrently
+dp = Dispatcher(storage=create_fsm_storage(db_url), events_isolation=MeasuredEventIsolation())
 
 # Registering router handling user commands
 dp.include_router(state_machines_router)
+dp.include_router(history_router)
+dp.include_router(charts_router)
+dp.include_router(export_router)
+dp.include_router(bank_import_router)
+dp.include_router(recurrences_router)
 dp.include_router(commands_handlers_router)
 
-# Registering middleware for providing  database session
-dp.update.middleware(DataBaseSession(session_pool=session_maker))
+# Registering middleware adding update_id and telegram_id to log records
+dp.update.outer_middleware(LoggingContextMiddleware())
+
+# Registering instrumentation of updates, Telegram API calls and SQL statements exported on the metrics endpoint.
+# It is registered before throttling and the concurrency limit, so dropped updates and waiting for a slot are counted
+if is_metrics_enabled():
+    setup_metrics_middlewares(dp, bot, engine, read_engine)
+
+# Registering throttling of users and the limit of updates processed at a time. The limit is derived from the size
+# of the database pool assuming one connection per update (see get_update_concurrency),
+# MAX_CONCURRENT_UPDATES overrides it
+dp.update.outer_middleware(ThrottlingMiddleware.from_env())
+max_concurrent_updates = int(os.getenv('MAX_CONCURRENT_UPDATES') or 0) or get_update_concurrency(engine)
+if max_concurrent_updates:
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(max_concurrent_updates))
+
+# Registering middleware for providing database session.
+# It is an inner middleware of message and callback_query observers, so it can read flags of the matched handler.
+# Analytical handlers use the read replica if READ_DB_URL is set
+db_session_middleware = DataBaseSession(session_pool=session_maker, read_session_pool=read_session_maker)
+dp.message.middleware(db_session_middleware)
+dp.callback_query.middleware(db_session_middleware)
+
+# Registering scheduler of outgoing requests keeping them within Telegram flood limits.
+# It is registered after metrics middleware, so measured time of API calls includes waiting for the limits
+bot.session.middleware(RequestScheduler.from_env())
 
+startup_timer.mark('imports and setup')
 
-def configure_logger(level: str):
-    """Performs the initial configuration of the logger"""
+
+# Default log levels of environments, LOG_LEVEL overrides them
+LOG_LEVELS = {'development': 'DEBUG', 'production': 'INFO'}
+
+
+def configure_logger(environment: str):
+    """
+    Performs the initial configuration of the logger. Sinks are enqueued, so records are written by a background
+    thread instead of the event loop. Records in the log file are JSON in production and text in development,
+    LOG_FORMAT (json or text) overrides it
+    """
+    level = os.getenv('LOG_LEVEL') or LOG_LEVELS.get(environment, 'DEBUG')
+    log_format = os.getenv('LOG_FORMAT') or ('json' if environment == 'production' else 'text')
     log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'logs.log')
+
+    logger.remove()
+    logger.configure(extra={'update_id': None, 'telegram_id': None})
+    logger.add(sys.stderr, level=level, enqueue=True)
     logger.add(
         log_file_path,
-        format='{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}',
+        format='{time:YYYY-MM-DD at HH:mm:ss} | {level} | update={extra[update_id]} user={extra[telegram_id]} | '
+               '{message}',
         level=level,
         rotation='10 MB',
+        enqueue=True,
+        serialize=log_format == 'json',
     )
 
 
 async def set_default_commands():
     """Sets default bot commands"""
-    commands = [BotCommand(command='start', description='Запустить бота')]
+    commands = [
+        BotCommand(command='start', description='Запустить бота'),
+        BotCommand(command='export', description='Выгрузить историю (csv или xlsx)'),
+        BotCommand(command='import', description='Загрузить выписку из банка (csv)'),
+        BotCommand(command='repeat', description='Регулярные доходы и расходы'),
+    ]
     await bot.set_my_commands(commands, BotCommandScopeAllPrivateChats())
 
 
+async def prepare_database():
+    """
+    Checks that the database schema matches the code. Migrations are applied by "python manage.py migrate"
+    before the deploy, MIGRATE_ON_STARTUP=true applies them on startup instead, e.g. for local runs
+    """
+    if os.getenv('MIGRATE_ON_STARTUP', 'false').lower() == 'true':
+        await migrate_db()
+    else:
+        await check_schema()
+
+
 async def on_startup():
     """The function is performed on bot startup"""
-    await set_default_commands()
-    # Deleting pending updates on bot startup
-    await bot.delete_webhook(drop_pending_updates=True)
-
     run_param = False
     if run_param:
         await drop_db()
-    await create_db()
 
-    logger.info('Bot started successfully!')
+    if is_webhook_mode():
+        receive_updates = set_webhook(bot, allowed_updates=dp.resolve_used_update_types())
+    else:
+        # Deleting pending updates on bot startup
+        receive_updates = bot.delete_webhook(drop_pending_updates=True)
+
+    # Independent requests to Telegram and to the database are performed concurrently
+    await asyncio.gather(
+        startup_timer.measure('database schema', prepare_database()),
+        startup_timer.measure('bot commands', set_default_commands()),
+        startup_timer.measure('webhook', receive_updates),
+    )
+
+    if is_write_behind_enabled():
+        start_write_behind(session_maker)
+
+    # Writing recurring incomes and expenses when they are due
+    start_recurrence_scheduler(session_maker, bot)
+
+    if is_metrics_enabled():
+        await startup_timer.measure('metrics server', start_metrics_server())
+
+    startup_timer.report()
+
+
+async def on_shutdown():
+    """The function is performed on bot shutdown"""
+    # Flushing incomes and expenses which are still waiting in the write-behind queue
+    await stop_write_behind()
+    await stop_recurrence_scheduler()
+    chart_service.shutdown()
+    await stop_metrics_server()
+    await dp.storage.close()
 
 
 async def main():
-    configure_logger('DEBUG')
+    configure_logger(os.getenv('ENVIRONMENT', 'development'))
 
     dp.startup.register(on_startup)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    dp.shutdown.register(on_shutdown)
+
+    # Mode of receiving updates is chosen by BOT_MODE environment variable: 'polling' (default) or 'webhook'
+    if is_webhook_mode():
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,51 @@
+"""
+Management commands of the bot.
+Usage:
+    python manage.py migrate
+    python manage.py rebuild-rollups [--telegram-id TELEGRAM_ID]
+"""
+import argparse
+import asyncio
+
+from loguru import logger
+
+from database.engine import session_maker, migrate_db
+from database.orm_query import orm_get_user_id
+from database.rollups import rebuild_rollups
+
+
+async def rebuild_rollups_command(telegram_id: int | None):
+    """Recalculates totals used by statistics for one user or for all users"""
+
+    async with session_maker() as session:
+        user_id = await orm_get_user_id(session, telegram_id) if telegram_id is not None else None
+        await rebuild_rollups(session, user_id=user_id)
+        await session.commit()
+
+    logger.info(f'Rollups rebuilt for {"all users" if telegram_id is None else f"telegram_id={telegram_id}"}')
+
+
+async def migrate_command():
+    """Applies pending schema migrations"""
+    version = await migrate_db()
+    logger.info(f'Database schema is at version {version}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Management commands of the bot')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('migrate', help='Apply pending schema migrations')
+
+    rebuild_parser = subparsers.add_parser('rebuild-rollups', help='Backfill or repair totals used by statistics')
+    rebuild_parser.add_argument('--telegram-id', type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        asyncio.run(migrate_command())
+    elif args.command == 'rebuild-rollups':
+        asyncio.run(rebuild_rollups_command(args.telegram_id))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import asyncio
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from middlewares.metrics import record_queue_time
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """
+    Outer middleware of updates processing at most max_in_flight updates at a time, so they do not wait for
+    connections of the database pool. Updates of one user in a chat are processed one by one in order of arrival by
+    the event isolation of the dispatcher (see MeasuredEventIsolation), which aiogram applies before outer
+    middlewares, so an update takes a slot only when the previous update of its user is done and updates waiting
+    behind it do not hold slots.
+    """
+
+    def __init__(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        async with self._semaphore:
+            record_queue_time(time.perf_counter() - started)
+            return await handler(event, data)
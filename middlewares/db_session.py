@@ -1,15 +1,30 @@
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional
 
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.fsm.context import FSMContext
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from database.replica import COMMITTED_KEY, recent_writers
 
 
 class DataBaseSession(BaseMiddleware):
-    """Middleware for transferring database session"""
+    """
+    Middleware for transferring database session.
+    Must be registered as inner middleware of message and callback_query observers, so handler flags are available.
+    Handlers declared with flags={'db_session': False} get no session at all. Other handlers get a session which
+    checks out a pooled connection only when it executes the first statement.
+    Analytical handlers declared with flags={'db_session': 'read'} get a read-only session of read_session_pool
+    (read replica) unless the user has written to the primary database recently (the marker is kept in the FSM
+    storage, so redis or sql storage shares it between bot processes), so users always see their own writes.
+    Without read_session_pool they use the primary database.
+    """
 
-    def __init__(self, session_pool: async_sessionmaker) -> None:
+    def __init__(self, session_pool: async_sessionmaker,
+                 read_session_pool: Optional[async_sessionmaker] = None) -> None:
         self.session_pool = session_pool
+        self.read_session_pool = read_session_pool
 
     async def __call__(
             self,
@@ -17,6 +32,22 @@ class DataBaseSession(BaseMiddleware):
             event: TelegramObject,
             data: Dict[str, Any]
     ) -> Any:
-        async with self.session_pool() as session:
-            data['session'] = session
+        flag = get_flag(data, 'db_session', default=True)
+        if flag is False:
+            return await handler(event, data)
+
+        # Writes are remembered only when reads may go to the replica
+        state: Optional[FSMContext] = data.get('state') if self.read_session_pool is not None else None
+        if flag == 'read' and self.read_session_pool is not None and not (
+                state is not None and await recent_writers.wrote_recently(data['fsm_storage'], state.key)):
+            session: AsyncSession = self.read_session_pool()
+        else:
+            session = self.session_pool()
+
+        data['session'] = session
+        try:
             return await handler(event, data)
+        finally:
+            await session.close()
+            if state is not None and session.info.get(COMMITTED_KEY):
+                await recent_writers.mark(data['fsm_storage'], state.key)
@@ -0,0 +1,25 @@
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+from loguru import logger
+
+
+class LoggingContextMiddleware(BaseMiddleware):
+    """
+    Outer middleware of updates adding update_id and telegram_id to every log record made while the update is
+    processed. Must be registered on dp.update, after the dispatcher has resolved the user of the event.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user: User | None = data.get('event_from_user')
+        with logger.contextualize(
+                update_id=event.update_id if isinstance(event, Update) else None,
+                telegram_id=user.id if user is not None else None,
+        ):
+            return await handler(event, data)
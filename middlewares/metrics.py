@@ -0,0 +1,216 @@
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Awaitable, Optional, AsyncGenerator
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.methods import TelegramMethod, Response
+from aiogram.types import TelegramObject, Update
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from services.metrics import (updates_total, update_duration, update_queue_duration, update_api_duration,
+                              update_sql_duration, update_sql_statements, telegram_api_requests, slow_updates_total)
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+
+@dataclass
+class UpdateMetrics:
+    """Measurements of the update being processed"""
+    handler: str = 'unhandled'
+    # Set if the update was dropped before reaching a handler
+    status: Optional[str] = None
+    queue_time: float = 0.0
+    api_calls: int = 0
+    api_time: float = 0.0
+    sql_statements: int = 0
+    sql_time: float = 0.0
+
+
+# Measurements of the current update. Set by UpdateMetricsMiddleware, filled by the handler name middleware,
+# Telegram API request middleware and engine events running in the same context
+current_update_metrics: contextvars.ContextVar[Optional[UpdateMetrics]] = contextvars.ContextVar(
+    'current_update_metrics', default=None
+)
+
+# Time the current update waited for the previous update of the same user in the chat, set by MeasuredEventIsolation
+isolation_wait: contextvars.ContextVar[float] = contextvars.ContextVar('isolation_wait', default=0.0)
+
+
+class MeasuredEventIsolation(SimpleEventIsolation):
+    """
+    Event isolation of the dispatcher processing updates of a user in a chat one by one. The lock is taken by aiogram
+    before outer middlewares of updates, so time of waiting for it is passed to UpdateMetricsMiddleware by a context
+    variable
+    """
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        started = time.perf_counter()
+        async with super().lock(key):
+            token = isolation_wait.set(time.perf_counter() - started)
+            try:
+                yield
+            finally:
+                isolation_wait.reset(token)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Outer middleware of updates measuring total latency of every update together with time spent waiting in the queue
+    (for the previous update of its user and a processing slot), on Telegram API and SQL statements. Updates processed
+    longer than slow_update_threshold seconds are logged with the breakdown. Must be registered on dp.update before
+    ThrottlingMiddleware and ConcurrencyLimitMiddleware, so dropped updates and the queue wait are counted.
+    Handler names are recorded by record_handler_name.
+    """
+
+    def __init__(self, slow_update_threshold: Optional[float] = None) -> None:
+        self.slow_update_threshold = slow_update_threshold
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        metrics = UpdateMetrics(queue_time=isolation_wait.get())
+        token = current_update_metrics.set(metrics)
+        status = 'ok'
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            if result is UNHANDLED:
+                status = 'unhandled'
+            return result
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            current_update_metrics.reset(token)
+            status = metrics.status or status
+            self._observe(event, metrics, status, duration)
+
+    def _observe(self, event: TelegramObject, metrics: UpdateMetrics, status: str, duration: float) -> None:
+        updates_total.inc(metrics.handler, status)
+        update_duration.observe(duration, metrics.handler)
+        update_queue_duration.observe(metrics.queue_time, metrics.handler)
+        update_api_duration.observe(metrics.api_time, metrics.handler)
+        update_sql_duration.observe(metrics.sql_time, metrics.handler)
+        update_sql_statements.observe(metrics.sql_statements, metrics.handler)
+
+        if self.slow_update_threshold is not None and duration >= self.slow_update_threshold:
+            slow_updates_total.inc(metrics.handler)
+            update_id = event.update_id if isinstance(event, Update) else None
+            logger.warning(
+                f'Slow update {update_id} handled by {metrics.handler} ({status}): {duration * 1000:.1f} ms total, '
+                f'{metrics.queue_time * 1000:.1f} ms in the queue, '
+                f'{metrics.api_calls} Telegram API calls {metrics.api_time * 1000:.1f} ms, '
+                f'{metrics.sql_statements} SQL statements {metrics.sql_time * 1000:.1f} ms'
+            )
+
+
+async def record_handler_name(
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+) -> Any:
+    """Inner middleware saving name of the matched handler to measurements of the current update"""
+
+    metrics = current_update_metrics.get()
+    if metrics is not None:
+        metrics.handler = data['handler'].callback.__name__
+    return await handler(event, data)
+
+
+def record_dropped_update(reason: str) -> None:
+    """Marks the current update as dropped by the reason instead of a handler"""
+
+    metrics = current_update_metrics.get()
+    if metrics is not None:
+        metrics.handler = reason
+        metrics.status = 'dropped'
+
+
+def record_queue_time(seconds: float) -> None:
+    """Adds time the current update waited for a processing slot to its measurements"""
+
+    metrics = current_update_metrics.get()
+    if metrics is not None:
+        metrics.queue_time += seconds
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    """Request middleware of the bot session measuring latency of Telegram API calls"""
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType,
+            bot: Bot,
+            method: TelegramMethod,
+    ) -> Response:
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            duration = time.perf_counter() - started
+            telegram_api_requests.observe(duration, method.__api_method__)
+            metrics = current_update_metrics.get()
+            if metrics is not None:
+                metrics.api_calls += 1
+                metrics.api_time += duration
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info['metrics_started'].pop()
+    metrics = current_update_metrics.get()
+    if metrics is not None:
+        metrics.sql_statements += 1
+        metrics.sql_time += time.perf_counter() - started
+
+
+def _handle_error(exception_context) -> None:
+    # after_cursor_execute is not called for failed statements
+    if exception_context.connection is not None and exception_context.connection.info.get('metrics_started'):
+        exception_context.connection.info['metrics_started'].pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Counts SQL statements executed by the engine and their time in measurements of the current update"""
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine.sync_engine, 'handle_error', _handle_error)
+
+
+def setup_metrics_middlewares(dp: Dispatcher, bot: Bot, engine: AsyncEngine,
+                              read_engine: Optional[AsyncEngine] = None) -> None:
+    """
+    Registers instrumentation of updates, handlers, Telegram API calls and SQL statements.
+    Slow updates are logged if METRICS_SLOW_UPDATE_MS environment variable is set
+    """
+
+    slow_update_ms = os.getenv('METRICS_SLOW_UPDATE_MS')
+    dp.update.outer_middleware(UpdateMetricsMiddleware(
+        slow_update_threshold=float(slow_update_ms) / 1000 if slow_update_ms else None,
+    ))
+    dp.message.middleware(record_handler_name)
+    dp.callback_query.middleware(record_handler_name)
+    bot.session.middleware(TelegramApiMetricsMiddleware())
+    instrument_engine(engine)
+    if read_engine is not None:
+        instrument_engine(read_engine)
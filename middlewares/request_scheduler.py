@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    TelegramMethod, Response, DeleteMessage, DeleteMessages, GetUpdates, SendMessage, SendPhoto, SendDocument,
+    SendMediaGroup, SendAnimation, SendAudio, SendVideo, SendVideoNote, SendVoice, SendSticker, SendContact, SendDice,
+    SendGame, SendInvoice, SendLocation, SendPaidMedia, SendPoll, SendVenue, CopyMessage, CopyMessages, ForwardMessage,
+    ForwardMessages,
+)
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+# Priorities of outgoing requests, requests with lower values are sent first
+INTERACTIVE_PRIORITY = 0
+BACKGROUND_PRIORITY = 10
+
+# Maximum number of messages deleted by one deleteMessages request
+MAX_DELETE_BATCH = 100
+
+# Methods sending new messages, only they are limited per chat by Telegram
+NEW_MESSAGE_METHODS = (
+    SendMessage, SendPhoto, SendDocument, SendMediaGroup, SendAnimation, SendAudio, SendVideo, SendVideoNote,
+    SendVoice, SendSticker, SendContact, SendDice, SendGame, SendInvoice, SendLocation, SendPaidMedia, SendPoll,
+    SendVenue, CopyMessage, CopyMessages, ForwardMessage, ForwardMessages,
+)
+
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar('request_priority',
+                                                                       default=INTERACTIVE_PRIORITY)
+
+
+@contextmanager
+def background_requests() -> Iterator[None]:
+    """Sends Telegram requests made inside the block after interactive replies to users"""
+
+    token = request_priority.set(BACKGROUND_PRIORITY)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket allowing rate requests per second with bursts up to capacity.
+    Every caller reserves a token immediately and sleeps until the token is refilled, so callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns number of seconds to wait before it may be used"""
+
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(wait, self._blocked_until - now)
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available now. Returns False without taking a token otherwise"""
+
+        now = time.monotonic()
+        self._refill(now)
+        if self._tokens >= 1 and self._blocked_until <= now:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float) -> None:
+        """Stops issuing tokens for specified time, e.g. after Telegram answered with RetryAfter"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    @property
+    def is_idle(self) -> bool:
+        """True if the bucket is full, so forgetting it does not change limits"""
+        now = time.monotonic()
+        self._refill(now)
+        return self._tokens >= self.capacity and self._blocked_until <= now
+
+
+class PriorityTokenBucket(TokenBucket):
+    """Token bucket serving waiting callers by priority and then in order of arrival"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        super().__init__(rate, capacity)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._release_task: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int = INTERACTIVE_PRIORITY) -> None:
+        if not self._waiters and self.try_acquire():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._release_task is None or self._release_task.done():
+            self._release_task = asyncio.create_task(self._release_waiters())
+        await future
+
+    async def _release_waiters(self) -> None:
+        while self._waiters:
+            now = time.monotonic()
+            self._refill(now)
+            if self._blocked_until > now:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._tokens -= 1
+                future.set_result(None)
+
+
+@dataclass
+class DeleteBatch:
+    """Messages of one chat waiting to be deleted with one request"""
+    message_ids: list[int] = field(default_factory=list)
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class RequestScheduler(BaseRequestMiddleware):
+    """
+    Request middleware of the bot session keeping outgoing requests within Telegram flood limits.
+    Requests sending new messages pass a token bucket of the chat, and all requests pass the global priority token
+    bucket, so edits, deletions and answers to callbacks are not delayed by the per chat limit. Interactive requests
+    are sent before background ones (see background_requests). Deletions of messages of one chat which are waiting
+    for tokens at the same time are sent as one deleteMessages request. Requests answered with RetryAfter are retried
+    after the requested time, and the chat (or the whole bot) is paused meanwhile, so other requests do not
+    provoke more RetryAfter errors.
+    """
+
+    def __init__(self, *, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 3, max_chats: int = 10_000) -> None:
+        self.global_bucket = PriorityTokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chat_buckets: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._delete_batches: dict[int | str, DeleteBatch] = {}
+
+    @classmethod
+    def from_env(cls) -> 'RequestScheduler':
+        """Creates scheduler configured by TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST and
+        TELEGRAM_MAX_RETRIES environment variables"""
+        return cls(
+            global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', 30)),
+            chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', 1)),
+            chat_burst=float(os.getenv('TELEGRAM_CHAT_BURST', 3)),
+            max_retries=int(os.getenv('TELEGRAM_MAX_RETRIES', 3)),
+        )
+
+    def _get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is not None:
+            self._chat_buckets.move_to_end(chat_id)
+            return bucket
+
+        # Forgetting least recently used chats whose buckets are full anyway
+        if len(self._chat_buckets) >= self.max_chats:
+            for old_chat_id in list(self._chat_buckets)[:len(self._chat_buckets) // 10 + 1]:
+                if self._chat_buckets[old_chat_id].is_idle:
+                    del self._chat_buckets[old_chat_id]
+
+        bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType,
+            bot: Bot,
+            method: TelegramMethod,
+    ) -> Response:
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await self._send(make_request, bot, method, None)
+        if isinstance(method, DeleteMessage):
+            return await self._delete(make_request, bot, method)
+
+        await self._acquire(method, chat_id)
+        return await self._send(make_request, bot, method, chat_id)
+
+    def _get_method_chat_bucket(self, method: TelegramMethod, chat_id: Optional[int | str]) -> Optional[TokenBucket]:
+        """Returns bucket of the chat if the method is limited per chat, None otherwise"""
+
+        if chat_id is None or not isinstance(method, NEW_MESSAGE_METHODS):
+            return None
+        return self._get_chat_bucket(chat_id)
+
+    async def _acquire(self, method: TelegramMethod, chat_id: Optional[int | str]) -> None:
+        """Waits for tokens of the chat bucket (only for methods sending new messages) and of the global bucket"""
+
+        chat_bucket = self._get_method_chat_bucket(method, chat_id)
+        if chat_bucket is not None:
+            await chat_bucket.acquire()
+        await self.global_bucket.acquire(request_priority.get())
+
+    async def _delete(self, make_request: NextRequestMiddlewareType, bot: Bot, method: DeleteMessage) -> Response:
+        """Joins the deletion to a batch of the chat waiting for tokens or sends a new batch"""
+
+        chat_id = method.chat_id
+        batch = self._delete_batches.get(chat_id)
+        if batch is not None and len(batch.message_ids) < MAX_DELETE_BATCH:
+            batch.message_ids.append(method.message_id)
+            return await batch.future
+
+        batch = self._delete_batches[chat_id] = DeleteBatch(message_ids=[method.message_id])
+        try:
+            # Letting deletions made at the same time, e.g. by asyncio.gather, join the batch
+            await asyncio.sleep(0)
+            await self.global_bucket.acquire(request_priority.get())
+        finally:
+            if self._delete_batches.get(chat_id) is batch:
+                del self._delete_batches[chat_id]
+
+        if len(batch.message_ids) > 1:
+            request = DeleteMessages(chat_id=chat_id, message_ids=batch.message_ids)
+        else:
+            request = method
+
+        try:
+            result = await self._send(make_request, bot, request, chat_id)
+        except Exception as e:
+            batch.future.set_exception(e)
+            # Retrieving the exception, so it is not reported as never retrieved if nobody joined the batch
+            batch.future.exception()
+            raise
+        batch.future.set_result(result)
+        return result
+
+    async def _send(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod,
+                    chat_id: Optional[int | str]) -> Response:
+        """Sends request retrying it after RetryAfter errors"""
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f'Flood limit exceeded by {type(method).__name__} in chat {chat_id}, '
+                               f'retrying in {e.retry_after}s')
+                # The retry passes the same buckets as the first attempt, the chat bucket (if any) or the global one
+                # is paused, so other requests of the chat or the bot wait too
+                (self._get_method_chat_bucket(method, chat_id) or self.global_bucket).block(e.retry_after)
+                await self._acquire(method, chat_id)
@@ -0,0 +1,113 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Awaitable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+
+from middlewares.metrics import record_dropped_update
+from middlewares.request_scheduler import TokenBucket
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer middleware of updates limiting every user to rate updates per second with bursts up to burst.
+    Presses of a button whose previous press is still being processed or was processed less than duplicate_window
+    seconds ago are merged with it: the callback is answered and dropped, so repeated presses do not open database
+    sessions and send the same pages again. Other updates exceeding the limit are dropped, callbacks are answered
+    with a notice. Must be registered on dp.update before ConcurrencyLimitMiddleware, so dropped updates do not wait
+    for a processing slot. rate=0 disables throttling.
+    """
+
+    def __init__(self, *, rate: float = 2, burst: float = 5, duplicate_window: float = 1.0,
+                 max_users: int = 10_000) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.max_users = max_users
+        self._buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        # Time when processing of the last press of the button finished, None while it is being processed
+        self._presses: OrderedDict[tuple[int, str], Optional[float]] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> 'ThrottlingMiddleware':
+        """Creates middleware configured by THROTTLE_RATE, THROTTLE_BURST and THROTTLE_DUPLICATE_WINDOW_MS
+        environment variables"""
+        return cls(
+            rate=float(os.getenv('THROTTLE_RATE', 2)),
+            burst=float(os.getenv('THROTTLE_BURST', 5)),
+            duplicate_window=float(os.getenv('THROTTLE_DUPLICATE_WINDOW_MS', 1000)) / 1000,
+        )
+
+    def _get_bucket(self, telegram_id: int) -> TokenBucket:
+        bucket = self._buckets.get(telegram_id)
+        if bucket is not None:
+            self._buckets.move_to_end(telegram_id)
+            return bucket
+
+        # Forgetting least recently used users whose buckets are full anyway
+        if len(self._buckets) >= self.max_users:
+            for old_telegram_id in list(self._buckets)[:len(self._buckets) // 10 + 1]:
+                if self._buckets[old_telegram_id].is_idle:
+                    del self._buckets[old_telegram_id]
+
+        bucket = self._buckets[telegram_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _is_duplicate(self, press: tuple[int, str], now: float) -> bool:
+        if press not in self._presses:
+            return False
+        finished = self._presses[press]
+        return finished is None or now - finished < self.duplicate_window
+
+    def _forget_old_presses(self, now: float) -> None:
+        while self._presses:
+            press, finished = next(iter(self._presses.items()))
+            if finished is None or now - finished < self.duplicate_window:
+                break
+            del self._presses[press]
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get('event_from_user')
+        if not self.rate or user is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        callback = event.callback_query
+        now = time.monotonic()
+        self._forget_old_presses(now)
+        press = (user.id, callback.data or '') if callback is not None else None
+
+        if press is not None and self._is_duplicate(press, now):
+            logger.debug(f'Repeated press of {callback.data} by user with telegram_id={user.id} is dropped')
+            record_dropped_update('duplicate_press')
+            await callback.answer()
+            return None
+
+        if not self._get_bucket(user.id).try_acquire():
+            logger.warning(f'Update {event.update_id} of user with telegram_id={user.id} is dropped by throttling')
+            record_dropped_update('throttled')
+            if callback is not None:
+                await callback.answer('Слишком много запросов, подождите немного')
+            return None
+
+        if press is None:
+            return await handler(event, data)
+
+        self._presses[press] = None
+        self._presses.move_to_end(press)
+        try:
+            return await handler(event, data)
+        finally:
+            self._presses[press] = time.monotonic()
+            self._presses.move_to_end(press)
@@ -0,0 +1,252 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import BinaryIO, Iterator, Optional, Awaitable, Callable
+
+from dotenv import load_dotenv, find_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_get_user_categories, orm_get_records_between, orm_add_incomes_expenses
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+IMPORT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database',
+                                 'import_rules.json')
+
+# Names of columns in statements of different banks
+COLUMN_ALIASES = {
+    'date': ('дата', 'дата операции', 'дата платежа', 'date'),
+    'amount': ('сумма', 'сумма операции', 'сумма платежа', 'amount'),
+    'description': ('описание', 'назначение платежа', 'описание операции', 'description'),
+    'category': ('категория', 'category'),
+}
+DATE_FORMATS = ('%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+IMPORT_CHUNK_SIZE = 500
+
+
+class StatementFormatError(ValueError):
+    """Raised if the file does not look like a bank statement"""
+
+
+@dataclass(frozen=True)
+class StatementRow:
+    created: datetime
+    amount: Decimal
+    is_income: bool
+    description: Optional[str]
+    category: Optional[str]
+
+
+@dataclass
+class ImportResult:
+    added: int = 0
+    duplicates: int = 0
+    unmatched: int = 0
+    invalid: int = 0
+    unmatched_examples: list[str] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.added + self.duplicates + self.unmatched + self.invalid
+
+
+@lru_cache(maxsize=1)
+def get_import_rules() -> dict[str, tuple[str, ...]]:
+    """
+    Loads keyword rules mapping category names to keywords of descriptions from the file specified by
+    IMPORT_RULES_FILE environment variable (database/import_rules.json by default)
+    """
+
+    path = os.getenv('IMPORT_RULES_FILE') or IMPORT_RULES_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as file:
+        return {category: tuple(keyword.casefold() for keyword in keywords)
+                for category, keywords in json.load(file).items()}
+
+
+def record_hash(amount: Decimal, created: datetime, description: Optional[str]) -> str:
+    """Returns hash identifying a record for deduplication of imported rows"""
+
+    key = f'{Decimal(amount).copy_abs():.2f}|{created:%Y-%m-%d %H:%M:%S}|{(description or "").strip().casefold()}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _parse_amount(value: str) -> Decimal:
+    value = value.replace('\xa0', '').replace(' ', '').replace(',', '.')
+    return Decimal(value)
+
+
+def _parse_date(value: str) -> datetime:
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f'Unknown date format: {value}')
+
+
+def _find_columns(header: list[str]) -> dict[str, int]:
+    normalized = [name.strip().casefold() for name in header]
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for i, name in enumerate(normalized):
+            if name in aliases:
+                columns[column] = i
+                break
+
+    if 'date' not in columns or 'amount' not in columns:
+        raise StatementFormatError('Statement must have date and amount columns')
+    return columns
+
+
+def parse_statement(file: BinaryIO, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[list[Optional[StatementRow]]]:
+    """
+    Parses CSV bank statement by chunks. Negative amounts are expenses, positive amounts are incomes.
+    Yields lists of parsed rows, None stands for a row which could not be parsed.
+    """
+
+    text_file = io.TextIOWrapper(file, encoding='utf-8-sig', errors='replace', newline='')
+    sample = text_file.read(4096)
+    text_file.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        raise StatementFormatError('Could not detect CSV delimiter')
+
+    reader = csv.reader(text_file, dialect)
+    header = next(reader, None)
+    if header is None:
+        raise StatementFormatError('Statement is empty')
+    columns = _find_columns(header)
+
+    chunk = []
+    for values in reader:
+        if not any(values):
+            continue
+        try:
+            amount = _parse_amount(values[columns['amount']])
+            description = values[columns['description']].strip()[:150] if 'description' in columns else None
+            chunk.append(StatementRow(
+                created=_parse_date(values[columns['date']]),
+                amount=abs(amount),
+                is_income=amount > 0,
+                description=description or None,
+                category=values[columns['category']].strip() if 'category' in columns else None,
+            ))
+        except (IndexError, ValueError, InvalidOperation):
+            chunk.append(None)
+
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+    # The wrapper must not close the file of the caller when it is garbage collected
+    text_file.detach()
+
+
+class CategoryMatcher:
+    """Maps statement rows to user categories by category column or by keyword rules applied to the description"""
+
+    def __init__(self, categories: list[str], rules: dict[str, tuple[str, ...]]) -> None:
+        self.categories = {name.casefold(): name for name in categories}
+        self.rules = [(self.categories[name.casefold()], keywords) for name, keywords in rules.items()
+                      if name.casefold() in self.categories]
+
+    def match(self, row: StatementRow) -> Optional[str]:
+        if row.category and row.category.casefold() in self.categories:
+            return self.categories[row.category.casefold()]
+
+        description = (row.description or '').casefold()
+        for name, keywords in self.rules:
+            if any(keyword in description for keyword in keywords):
+                return name
+        return None
+
+
+async def import_statement(
+        session: AsyncSession,
+        telegram_id: int,
+        file: BinaryIO,
+        on_progress: Optional[Callable[[ImportResult], Awaitable[None]]] = None,
+) -> ImportResult:
+    """
+    Imports CSV bank statement into incomes and expenses of the user with one transaction per chunk, so row locks
+    and the connection are not held while progress is reported. If the import fails, chunks committed before stay,
+    and importing the statement again adds only the rest because rows are deduplicated.
+    Rows are mapped to categories, deduplicated against existing records and rows already seen in the file
+    by (amount, created, description) hash and inserted with one multi-row INSERT per chunk.
+    The file is parsed in a thread, so large statements do not block the event loop.
+    :param on_progress: coroutine function called after every committed chunk
+    :return: counters of the import
+    """
+
+    rules = get_import_rules()
+    matchers = {
+        is_income: CategoryMatcher(list(await orm_get_user_categories(session, telegram_id, is_income)), rules)
+        for is_income in (False, True)
+    }
+    result = ImportResult()
+    seen_hashes: set[tuple[bool, str]] = set()
+
+    chunks = parse_statement(file)
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        rows = [row for row in chunk if row is not None]
+        result.invalid += len(chunk) - len(rows)
+
+        # Loading hashes of existing records in the time range of the chunk with one query per table
+        if rows:
+            start, end = min(row.created for row in rows), max(row.created for row in rows)
+            for is_income in (False, True):
+                for amount, created, description in await orm_get_records_between(session, telegram_id, start, end,
+                                                                                   is_income):
+                    seen_hashes.add((is_income, record_hash(amount, created, description)))
+
+        records = []
+        for row in rows:
+            key = (row.is_income, record_hash(row.amount, row.created, row.description))
+            if key in seen_hashes:
+                result.duplicates += 1
+                continue
+
+            category = matchers[row.is_income].match(row)
+            if category is None:
+                result.unmatched += 1
+                if len(result.unmatched_examples) < 5:
+                    result.unmatched_examples.append(row.description or str(row.amount))
+                continue
+
+            seen_hashes.add(key)
+            records.append({
+                'telegram_id': telegram_id,
+                'is_income': row.is_income,
+                'amount': row.amount,
+                'category': category,
+                'description': row.description,
+                'date_time': row.created,
+            })
+
+        if records:
+            for saved in await orm_add_incomes_expenses(session, records):
+                if isinstance(saved, Exception):
+                    raise saved
+            result.added += len(records)
+
+        await session.commit()
+        if on_progress is not None:
+            await on_progress(result)
+
+    return result
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Hashable, Optional, Sequence
+
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+CHART_SIZE = (6, 6)
+CHART_DPI = 100
+# Categories beyond this number are shown as one "Другое" sector of a pie chart
+MAX_PIE_SECTORS = 8
+
+
+class ChartQueueFull(Exception):
+    """Raised if too many charts are being rendered, so the request must be retried later"""
+
+
+def data_version(*values) -> str:
+    """Returns short hash of chart data, so a chart is rendered again only when its data changes"""
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:16]
+
+
+def _new_figure():
+    # matplotlib is an optional dependency needed only for charts. Figure is used instead of pyplot,
+    # so no global state is kept between charts rendered by the same worker process
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=CHART_SIZE, dpi=CHART_DPI)
+
+
+def _to_png(figure) -> bytes:
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def render_pie_chart(title: str, labels: Sequence[str], values: Sequence[float]) -> bytes:
+    """Renders pie chart to PNG. Runs in a worker process"""
+
+    if len(labels) > MAX_PIE_SECTORS:
+        labels = list(labels[:MAX_PIE_SECTORS - 1]) + ['Другое']
+        values = list(values[:MAX_PIE_SECTORS - 1]) + [sum(values[MAX_PIE_SECTORS - 1:])]
+
+    figure = _new_figure()
+    axes = figure.subplots()
+    axes.pie(values, labels=labels, autopct='%1.0f%%', startangle=90, counterclock=False)
+    axes.set_title(title)
+    axes.axis('equal')
+    return _to_png(figure)
+
+
+def render_bar_chart(title: str, labels: Sequence[str], series: dict[str, Sequence[float]]) -> bytes:
+    """Renders bar chart with bars of every series side by side to PNG. Runs in a worker process"""
+
+    figure = _new_figure()
+    axes = figure.subplots()
+    width = 0.8 / max(len(series), 1)
+    positions = range(len(labels))
+    for i, (name, values) in enumerate(series.items()):
+        axes.bar([position + i * width for position in positions], values, width=width, label=name)
+    axes.set_xticks([position + width * (len(series) - 1) / 2 for position in positions], labels)
+    axes.set_title(title)
+    axes.legend()
+    axes.grid(axis='y', alpha=0.3)
+    return _to_png(figure)
+
+
+class _LRU(OrderedDict):
+    def __init__(self, max_size: int) -> None:
+        super().__init__()
+        self.max_size = max_size
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def put(self, key, value) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+class ChartService:
+    """
+    Renders charts in a pool of worker processes, so rendering does not block the event loop.
+    PNG bytes are cached by key (user, chart, period, data version), and after the first upload Telegram file_id
+    of the chart is cached too, so the same chart is sent again without rendering and uploading.
+    Equal requests rendered at the same time share one rendering. At most max_pending charts are rendered or waiting
+    for a worker, further requests raise ChartQueueFull.
+    """
+
+    def __init__(self, *, max_workers: int = 2, max_pending: int = 8, png_cache_size: int = 256,
+                 file_id_cache_size: int = 10_000) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._png_cache = _LRU(png_cache_size)
+        self._file_ids = _LRU(file_id_cache_size)
+        self._rendering: dict[Hashable, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Workers are started on the first chart. They are spawned instead of forked from the event loop process
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def get_file_id(self, key: Hashable) -> Optional[str]:
+        """Returns Telegram file_id of the chart if it has already been uploaded"""
+        return self._file_ids.get(key)
+
+    def set_file_id(self, key: Hashable, file_id: str) -> None:
+        self._file_ids.put(key, file_id)
+        # PNG is not needed any more, the chart is sent by file_id
+        self._png_cache.pop(key, None)
+
+    async def render(self, key: Hashable, render_function: Callable[..., bytes], *args) -> bytes:
+        """Returns PNG of the chart from the cache or renders it with render_function(*args) in a worker process"""
+
+        png = self._png_cache.get(key)
+        if png is not None:
+            return png
+
+        rendering = self._rendering.get(key)
+        if rendering is not None:
+            return await asyncio.shield(rendering)
+
+        if len(self._rendering) >= self.max_pending:
+            raise ChartQueueFull()
+
+        loop = asyncio.get_running_loop()
+        rendering = self._rendering[key] = loop.run_in_executor(self._get_executor(), render_function, *args)
+        try:
+            png = await asyncio.shield(rendering)
+        finally:
+            del self._rendering[key]
+
+        self._png_cache.put(key, png)
+        return png
+
+    def shutdown(self) -> None:
+        """Stops worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info('Chart workers stopped')
+
+
+chart_service = ChartService(
+    max_workers=int(os.getenv('CHART_WORKERS', 2)),
+    max_pending=int(os.getenv('CHART_MAX_PENDING', 8)),
+    png_cache_size=int(os.getenv('CHART_CACHE_SIZE', 256)),
+)
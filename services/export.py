@@ -0,0 +1,129 @@
+import asyncio
+import csv
+import io
+import os
+from tempfile import SpooledTemporaryFile
+from typing import AsyncGenerator, AsyncIterator, BinaryIO
+
+from aiogram import Bot
+from aiogram.types import InputFile
+from dotenv import load_dotenv, find_dotenv
+
+from database.orm_query import HistoryRecord
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_HEADER = ('Дата', 'Тип', 'Сумма', 'Категория', 'Примечание')
+
+# Files larger than this are spilled from memory to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+# Rows collected in memory before they are written to the file in a thread
+WRITE_BATCH = 1000
+
+# Limits number of exports running at the same time in this process
+export_semaphore = asyncio.Semaphore(int(os.getenv('EXPORT_CONCURRENCY', 2)))
+
+
+class SpooledInputFile(InputFile):
+    """Input file reading a (possibly spooled to disk) file object by chunks when it is uploaded"""
+
+    def __init__(self, file: BinaryIO, filename: str, chunk_size: int = READ_CHUNK_SIZE) -> None:
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        # The file may be on disk, so it is read in a thread instead of the event loop
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
+
+
+def _to_row(record: HistoryRecord) -> tuple:
+    return (
+        record.created.strftime('%Y-%m-%d %H:%M:%S'),
+        'Доход' if record.is_income else 'Расход',
+        record.amount,
+        record.category,
+        record.description or '',
+    )
+
+
+async def _write_csv(records: AsyncIterator[HistoryRecord], file: BinaryIO) -> int:
+    # Rows are formatted in memory and written by batches in a thread, because the spooled file may be on disk
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(EXPORT_HEADER)
+    encoding = 'utf-8-sig'
+
+    async def write_buffer() -> None:
+        nonlocal encoding
+        data = buffer.getvalue().encode(encoding)
+        # Byte order mark is written only once at the beginning of the file
+        encoding = 'utf-8'
+        buffer.seek(0)
+        buffer.truncate()
+        await asyncio.to_thread(file.write, data)
+
+    count = 0
+    async for record in records:
+        writer.writerow(_to_row(record))
+        count += 1
+        if count % WRITE_BATCH == 0:
+            await write_buffer()
+
+    await write_buffer()
+    return count
+
+
+async def _write_xlsx(records: AsyncIterator[HistoryRecord], file: BinaryIO) -> int:
+    # openpyxl is an optional dependency needed only for XLSX export
+    from openpyxl import Workbook
+
+    # Write-only workbook keeps rows in a temporary file instead of memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('История')
+    sheet.append(EXPORT_HEADER)
+
+    def append_rows(rows: list[tuple]) -> None:
+        for row in rows:
+            sheet.append(row)
+
+    # Rows are written to the temporary file of the sheet by batches in a thread
+    rows = []
+    count = 0
+    async for record in records:
+        _, kind, amount, category, description = _to_row(record)
+        rows.append((record.created, kind, float(amount), category, description))
+        count += 1
+        if len(rows) == WRITE_BATCH:
+            await asyncio.to_thread(append_rows, rows)
+            rows = []
+
+    await asyncio.to_thread(append_rows, rows)
+    await asyncio.to_thread(workbook.save, file)
+    return count
+
+
+async def export_history(records: AsyncIterator[HistoryRecord], export_format: str) -> tuple[SpooledTemporaryFile, int]:
+    """
+    Writes records incrementally to a spooled temporary file in CSV or XLSX format
+    :param records: records of history from old to new
+    :param export_format: 'csv' or 'xlsx'
+    :return: file positioned at the beginning and number of written records
+    """
+
+    file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        if export_format == 'xlsx':
+            count = await _write_xlsx(records, file)
+        else:
+            count = await _write_csv(records, file)
+    except BaseException:
+        file.close()
+        raise
+
+    file.seek(0)
+    return file, count
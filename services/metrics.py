@@ -0,0 +1,158 @@
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# Buckets of latency histograms in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets of histograms of SQL statements number per update
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Buckets of histograms of number of rows written by one batch
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value per combination of labels"""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets per combination of labels"""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per labels: counts of observations in every bucket (the last one is +Inf), sum and count
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            counts, total = self._values.setdefault(label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, *label_values: str) -> int:
+        counts, _ = self._values.get(label_values, ([0], [0.0]))
+        return sum(counts)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {_format_value(total[0])}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CollectedCounter:
+    """Counter whose values are kept elsewhere, e.g. in stats of a cache, and are read when metrics are rendered"""
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], dict[tuple[str, ...], float]],
+                 labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in Prometheus text exposition format"""
+
+    def __init__(self) -> None:
+        self.metrics: list[Counter | Histogram | CollectedCounter] = []
+
+    def register(self, metric: Counter | Histogram | CollectedCounter) -> Counter | Histogram | CollectedCounter:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = MetricsRegistry()
+
+updates_total = registry.register(Counter(
+    'bot_updates_total', 'Processed updates by handler and result', labels=('handler', 'status'),
+))
+update_duration = registry.register(Histogram(
+    'bot_update_duration_seconds', 'Total time of processing an update', labels=('handler',),
+))
+update_queue_duration = registry.register(Histogram(
+    'bot_update_queue_seconds', 'Time an update waited for the previous update of its user and a processing slot',
+    labels=('handler',),
+))
+update_api_duration = registry.register(Histogram(
+    'bot_update_telegram_api_seconds', 'Time of an update spent waiting on Telegram API calls', labels=('handler',),
+))
+update_sql_duration = registry.register(Histogram(
+    'bot_update_sql_seconds', 'Time of an update spent executing SQL statements', labels=('handler',),
+))
+update_sql_statements = registry.register(Histogram(
+    'bot_update_sql_statements', 'Number of SQL statements executed for an update', labels=('handler',),
+    buckets=COUNT_BUCKETS,
+))
+telegram_api_requests = registry.register(Histogram(
+    'bot_telegram_api_request_seconds', 'Latency of Telegram API requests', labels=('method',),
+))
+slow_updates_total = registry.register(Counter(
+    'bot_slow_updates_total', 'Updates processed longer than the slow update threshold', labels=('handler',),
+))
+write_behind_batch_size = registry.register(Histogram(
+    'bot_write_behind_batch_size', 'Number of incomes and expenses written by one write-behind batch',
+    buckets=BATCH_BUCKETS,
+))
+write_behind_flush_duration = registry.register(Histogram(
+    'bot_write_behind_flush_seconds', 'Time of writing a write-behind batch by result', labels=('status',),
+))
@@ -0,0 +1,168 @@
+import ast
+import operator
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from difflib import get_close_matches
+from typing import Optional, Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_add_incomes_expenses, SavedRecord
+
+# Entries are separated by semicolons, new lines or commas followed by a space ("250,50" is a decimal number)
+ENTRY_SEPARATOR = re.compile(r'[;\n]|,(?=\s)')
+# Amount is a token of digits, decimal separators, parentheses and arithmetic operators
+AMOUNT_TOKEN = re.compile(r'^[\d(][\d.,+\-*/()]*$')
+
+MAX_INTEGER_DIGITS = 10
+MAX_DESCRIPTION_LENGTH = 150
+MAX_EXPRESSION_LENGTH = 50
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+@dataclass(frozen=True)
+class QuickAddEntry:
+    amount: Decimal
+    category: str
+    description: Optional[str]
+
+
+@dataclass
+class QuickAddResult:
+    entries: list[QuickAddEntry] = field(default_factory=list)
+    # Fragments of the message which could not be parsed
+    errors: list[str] = field(default_factory=list)
+
+
+def _evaluate_node(node: ast.AST) -> Decimal:
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return Decimal(str(node.value))
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate_node(node.left), _evaluate_node(node.right))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _evaluate_node(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    raise ValueError('Unsupported expression')
+
+
+def evaluate_amount(expression: str) -> Decimal:
+    """
+    Evaluates amount written as a number or a simple arithmetic expression (+, -, *, / and parentheses),
+    commas are accepted as decimal separators. Only numeric literals and these operators are allowed.
+    Raises ValueError if the expression is invalid or its value is not a positive amount
+    """
+
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError('Expression is too long')
+    try:
+        tree = ast.parse(expression.replace(',', '.'), mode='eval')
+        amount = _evaluate_node(tree.body).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except (SyntaxError, ArithmeticError) as e:
+        raise ValueError(f'Invalid amount: {expression}') from e
+
+    if amount <= 0 or len(str(int(amount))) > MAX_INTEGER_DIGITS:
+        raise ValueError(f'Invalid amount: {expression}')
+    return amount
+
+
+class CategoryResolver:
+    """Matches category names written by the user to names of user categories ignoring case and typos"""
+
+    def __init__(self, categories: Iterable[str], cutoff: float = 0.6) -> None:
+        self.categories = {name.casefold(): name for name in categories}
+        self.cutoff = cutoff
+
+    def resolve(self, name: str) -> Optional[str]:
+        name = ' '.join(name.split()).casefold()
+        if not name:
+            return None
+        if name in self.categories:
+            return self.categories[name]
+
+        # Unambiguous abbreviation, e.g. "прод" for "Продукты"
+        prefixed = [category for key, category in self.categories.items() if key.startswith(name)]
+        if len(prefixed) == 1:
+            return prefixed[0]
+
+        matches = get_close_matches(name, list(self.categories), n=1, cutoff=self.cutoff)
+        return self.categories[matches[0]] if matches else None
+
+
+def _parse_entry(words: list[str], resolver: CategoryResolver) -> QuickAddEntry:
+    amount_index = next((i for i, word in enumerate(words) if AMOUNT_TOKEN.match(word)), None)
+    if amount_index is None:
+        raise ValueError('Amount is not found')
+    amount = evaluate_amount(words[amount_index])
+    before, after = words[:amount_index], words[amount_index + 1:]
+
+    if before:
+        # "категория сумма [примечание]"
+        category = resolver.resolve(' '.join(before))
+        description_words = after
+    else:
+        # "сумма категория [примечание]": the longest matching prefix of words is the category
+        category, description_words = None, after
+        for length in range(len(after), 0, -1):
+            category = resolver.resolve(' '.join(after[:length]))
+            if category is not None:
+                description_words = after[length:]
+                break
+
+    if category is None:
+        raise ValueError('Category is not found')
+    description = ' '.join(description_words)[:MAX_DESCRIPTION_LENGTH] or None
+    return QuickAddEntry(amount=amount, category=category, description=description)
+
+
+def parse_quick_add(text: str, categories: Iterable[str]) -> QuickAddResult:
+    """
+    Parses several incomes or expenses written in one message,
+    e.g. "продукты 250,50; жкх 3000 коммуналка, 120+45 отдых". Every entry consists of a category and an amount
+    in any order followed by an optional description
+    """
+
+    resolver = CategoryResolver(categories)
+    result = QuickAddResult()
+    for fragment in ENTRY_SEPARATOR.split(text):
+        words = fragment.split()
+        if not words:
+            continue
+        try:
+            result.entries.append(_parse_entry(words, resolver))
+        except ValueError:
+            result.errors.append(fragment.strip())
+    return result
+
+
+async def save_quick_add(session: AsyncSession, telegram_id: int, is_income: bool,
+                         entries: list[QuickAddEntry]) -> list[SavedRecord]:
+    """Adds all entries as incomes or expenses of the user with one multi-row INSERT in one transaction"""
+
+    date_time = datetime.now()
+    records = [
+        {
+            'telegram_id': telegram_id,
+            'is_income': is_income,
+            'amount': entry.amount,
+            'category': entry.category,
+            'description': entry.description,
+            'date_time': date_time,
+        }
+        for entry in entries
+    ]
+
+    saved_records = await orm_add_incomes_expenses(session, records)
+    for saved in saved_records:
+        if isinstance(saved, Exception):
+            await session.rollback()
+            raise saved
+    await session.commit()
+    return saved_records
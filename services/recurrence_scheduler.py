@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.recurrences import orm_get_due_recurrences, orm_materialize_recurrences, MaterializedOccurrence
+from middlewares.request_scheduler import background_requests
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+# Maximum time of sleeping between checks, so changes of the clock are noticed
+MAX_SLEEP = 60.0
+# Pause after an error
+ERROR_RETRY_DELAY = 10.0
+
+
+class RecurrenceScheduler:
+    """
+    Writes occurrences of recurring incomes and expenses when they are due.
+    Recurrences due in the next window are loaded in pages of (next_due, id) into a min-heap, so the scheduler sleeps
+    until the nearest due time instead of polling the whole table. Every window is loaded from the beginning, so
+    recurrences created by other processes are picked up by the next window at the latest. Due recurrences are materialized in batches
+    with one transaction per batch, and users are notified by a fixed number of workers through a bounded queue.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, bot: Bot, *, window: timedelta = timedelta(hours=1),
+                 page_size: int = 1000, batch_size: int = 500, notify_concurrency: int = 10,
+                 notify_queue_size: int = 1000) -> None:
+        self.session_pool = session_pool
+        self.bot = bot
+        self.window = window
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.notify_concurrency = notify_concurrency
+
+        # (next_due, id) of recurrences due before window_end; entries whose due differs from _scheduled are stale
+        self._heap: list[tuple[datetime, int]] = []
+        self._scheduled: dict[int, datetime] = {}
+        # All active recurrences due before window_end are in the heap
+        self._window_end: Optional[datetime] = None
+        # False if the last page of the window was full, so the window ends at the last loaded row
+        self._window_complete = False
+        # (next_due, id) of the last row loaded in the current window
+        self._cursor: Optional[tuple[datetime, int]] = None
+
+        self._wakeup = asyncio.Event()
+        self._notifications: asyncio.Queue[Optional[MaterializedOccurrence]] = asyncio.Queue(notify_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Starts the scheduler and notification workers"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._workers = [asyncio.create_task(self._notify_worker()) for _ in range(self.notify_concurrency)]
+
+    async def stop(self) -> None:
+        """Stops the scheduler and waits until queued notifications are sent"""
+
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        for _ in self._workers:
+            await self._notifications.put(None)
+        await asyncio.gather(*self._workers)
+        self._workers = []
+
+    def schedule(self, recurrence_id: int, next_due: datetime) -> None:
+        """Adds new or changed recurrence to the heap if it is due in the loaded window"""
+
+        if self._window_end is not None and next_due <= self._window_end:
+            self._push(recurrence_id, next_due)
+            self._wakeup.set()
+
+    def _push(self, recurrence_id: int, next_due: datetime) -> None:
+        if self._scheduled.get(recurrence_id) != next_due:
+            self._scheduled[recurrence_id] = next_due
+            heapq.heappush(self._heap, (next_due, recurrence_id))
+
+    def _peek(self) -> Optional[datetime]:
+        """Returns due time of the nearest recurrence dropping stale heap entries"""
+
+        while self._heap:
+            due, recurrence_id = self._heap[0]
+            if self._scheduled.get(recurrence_id) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    async def _load(self, now: datetime) -> None:
+        """Loads the next page of recurrences due before the end of the window starting now"""
+
+        horizon = now + self.window
+        if self._window_complete:
+            # New window starts from the beginning, recurrences already in the heap are not pushed twice
+            self._cursor = None
+        async with self.session_pool() as session:
+            rows = await orm_get_due_recurrences(session, horizon, after=self._cursor, limit=self.page_size)
+
+        for next_due, recurrence_id in rows:
+            self._push(recurrence_id, next_due)
+        if rows:
+            self._cursor = rows[-1]
+
+        # If the page is full, the next page is loaded when the heap is drained up to the last loaded row
+        self._window_complete = len(rows) < self.page_size
+        self._window_end = horizon if self._window_complete else self._cursor[0]
+
+    def _needs_loading(self, now: datetime) -> bool:
+        if self._window_end is None:
+            return True
+        if self._window_complete:
+            return self._window_end <= now
+        nearest = self._peek()
+        return nearest is None or nearest > self._window_end
+
+    def _pop_due(self, now: datetime) -> list[int]:
+        recurrence_ids = []
+        while len(recurrence_ids) < self.batch_size:
+            nearest = self._peek()
+            if nearest is None or nearest > now:
+                break
+            _, recurrence_id = heapq.heappop(self._heap)
+            del self._scheduled[recurrence_id]
+            recurrence_ids.append(recurrence_id)
+        return recurrence_ids
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._tick()
+            except Exception:
+                # The scheduler must survive any error, otherwise recurrences stop being written until restart
+                logger.exception(f'Error of recurrence scheduler, retrying in {ERROR_RETRY_DELAY}s')
+                await asyncio.sleep(ERROR_RETRY_DELAY)
+
+    async def _tick(self) -> None:
+        now = datetime.now()
+        if self._needs_loading(now):
+            await self._load(now)
+            return
+
+        recurrence_ids = self._pop_due(now)
+        if recurrence_ids:
+            await self._materialize(recurrence_ids, now)
+            return
+
+        nearest = self._peek()
+        wake_at = min(nearest, self._window_end) if nearest is not None else self._window_end
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), min(max((wake_at - now).total_seconds(), 0), MAX_SLEEP))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _materialize(self, recurrence_ids: list[int], now: datetime) -> None:
+        try:
+            async with self.session_pool() as session:
+                materialized, next_dues = await orm_materialize_recurrences(session, recurrence_ids, now)
+        except Exception:
+            # Putting the batch back, so it is retried after the delay
+            for recurrence_id in recurrence_ids:
+                self._push(recurrence_id, now)
+            raise
+
+        for recurrence_id, next_due in next_dues.items():
+            if next_due <= self._window_end:
+                self._push(recurrence_id, next_due)
+
+        if materialized:
+            logger.info(f'Written {len(materialized)} occurrences of {len(next_dues)} recurrences')
+        for occurrence in materialized:
+            await self._notifications.put(occurrence)
+
+    async def _notify_worker(self) -> None:
+        while True:
+            occurrence = await self._notifications.get()
+            if occurrence is None:
+                return
+
+            text = (f'🔁 Добавлен регулярный {"доход" if occurrence.is_income else "расход"}: '
+                    f'{occurrence.amount:.2f} - {occurrence.category}')
+            if occurrence.description:
+                text += f' - {occurrence.description}'
+            try:
+                # Notifications are sent after interactive replies to users
+                with background_requests():
+                    await self.bot.send_message(occurrence.telegram_id, text, parse_mode=None)
+            except TelegramAPIError as e:
+                logger.warning(f'Could not notify user with telegram_id={occurrence.telegram_id} '
+                               f'about recurrence {occurrence.recurrence_id}: {e}')
+
+
+recurrence_scheduler: Optional[RecurrenceScheduler] = None
+
+
+def start_recurrence_scheduler(session_pool: async_sessionmaker, bot: Bot) -> RecurrenceScheduler:
+    """Creates and starts the scheduler of recurring incomes and expenses configured from environment variables"""
+
+    global recurrence_scheduler
+    recurrence_scheduler = RecurrenceScheduler(
+        session_pool,
+        bot,
+        window=timedelta(minutes=float(os.getenv('RECURRENCE_WINDOW_MINUTES', 60))),
+        batch_size=int(os.getenv('RECURRENCE_BATCH_SIZE', 500)),
+        notify_concurrency=int(os.getenv('RECURRENCE_NOTIFY_CONCURRENCY', 10)),
+    )
+    recurrence_scheduler.start()
+    return recurrence_scheduler
+
+
+async def stop_recurrence_scheduler() -> None:
+    """Stops the scheduler of recurring incomes and expenses if it is running"""
+
+    global recurrence_scheduler
+    if recurrence_scheduler is not None:
+        await recurrence_scheduler.stop()
+        recurrence_scheduler = None
+
+
+def schedule_recurrence(recurrence_id: int, next_due: datetime) -> None:
+    """Notifies the running scheduler about new recurrence"""
+    if recurrence_scheduler is not None:
+        recurrence_scheduler.schedule(recurrence_id, next_due)
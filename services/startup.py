@@ -0,0 +1,40 @@
+import time
+from typing import Awaitable, TypeVar
+
+from loguru import logger
+
+T = TypeVar('T')
+
+
+class StartupTimer:
+    """
+    Measures steps of the bot startup and logs them as one report. It is created when the module is imported,
+    so the module must be imported by main.py first to include importing of the bot in the report
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self.steps: dict[str, float] = {}
+
+    def mark(self, step: str) -> None:
+        """Records time passed since the previous mark as the step"""
+        now = time.perf_counter()
+        self.steps[step] = now - self._last_mark
+        self._last_mark = now
+
+    async def measure(self, step: str, awaitable: Awaitable[T]) -> T:
+        """Awaits the step recording its time. Steps measured this way may run concurrently"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps[step] = time.perf_counter() - started
+
+    def report(self) -> None:
+        total = time.perf_counter() - self.started
+        steps = ', '.join(f'{step} {seconds:.3f}s' for step, seconds in self.steps.items())
+        logger.info(f'Bot started successfully in {total:.3f}s ({steps})')
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,35 @@
+import os
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv, find_dotenv
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+
+def create_fsm_storage(db_url: str) -> BaseStorage:
+    """
+    Creates FSM storage selected by FSM_STORAGE environment variable:
+    'memory' (default, single process only), 'redis' (FSM_REDIS_URL) or 'sql' (fsm_record table of the bot database
+    at db_url, accessed through a separate pool of FSM_POOL_SIZE connections).
+    Abandoned flows expire after FSM_TTL seconds in redis and sql storages.
+    For local multi-worker runs without Redis use 'sql' storage with SQLite database, RedisStorage can also be
+    created with an in-process client such as fakeredis.aioredis.FakeRedis.
+    """
+
+    backend = os.getenv('FSM_STORAGE', 'memory').lower()
+    ttl = int(os.getenv('FSM_TTL', 86400))
+
+    if backend == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0'), state_ttl=ttl, data_ttl=ttl)
+
+    if backend == 'sql':
+        from storages.sql import SQLStorage
+        return SQLStorage.from_url(db_url, pool_size=int(os.getenv('FSM_POOL_SIZE', 5)), ttl=ttl)
+
+    if backend != 'memory':
+        raise ValueError(f'Unknown FSM storage: {backend}')
+
+    return MemoryStorage()
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional
+from weakref import WeakKeyDictionary
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from loguru import logger
+from sqlalchemy import select, delete, case, literal, null
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession, AsyncEngine, create_async_engine
+
+from database.dialect import dialect_insert
+from database.model import FSMRecord
+
+# Records read or written by an update are reused by later reads of the same update during this time
+RECORD_REUSE_SECONDS = 5.0
+
+
+class _Record(NamedTuple):
+    state: Optional[str]
+    data: Dict[str, Any]
+    read_at: float
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM storage keeping states and data in the fsm_record table, so several bot processes can share flows.
+    Every write prolongs the record for ttl seconds, abandoned flows are expired on read and purged periodically.
+    A record read by an update (asyncio task) is reused by its later reads, so reading the state by the dispatcher and
+    the data by the handler costs one query, and writes return the new record instead of reading it again.
+    Use from_url in the bot, so the storage has its own pool: handlers read and write the state while their session
+    holds a connection, and with a shared pool every update in flight would need two connections of it.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, *, ttl: int = 86400, purge_interval: int = 600,
+                 engine: Optional[AsyncEngine] = None) -> None:
+        self.session_pool = session_pool
+        # Engine created by from_url, disposed on close
+        self._engine = engine
+        self.ttl = timedelta(seconds=ttl)
+        self.purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+        self._task_records: WeakKeyDictionary[asyncio.Task, dict[str, _Record]] = WeakKeyDictionary()
+
+    @classmethod
+    def from_url(cls, url: str, *, pool_size: int = 5, ttl: int = 86400) -> 'SQLStorage':
+        """Creates storage with its own engine with a pool of pool_size connections"""
+
+        engine = create_async_engine(url, pool_size=pool_size, max_overflow=0)
+        session_pool = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        return cls(session_pool, ttl=ttl, engine=engine)
+
+    @staticmethod
+    def _build_key(key: StorageKey) -> str:
+        parts = (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny)
+        return ':'.join('' if part is None else str(part) for part in parts)
+
+    def _get_task_records(self) -> dict[str, _Record]:
+        task = asyncio.current_task()
+        if task is None:
+            return {}
+        return self._task_records.setdefault(task, {})
+
+    def _remember(self, record_key: str, state: Optional[str], data: Optional[Dict[str, Any]]) -> _Record:
+        record = self._get_task_records()[record_key] = _Record(state, dict(data or {}), time.monotonic())
+        return record
+
+    async def _upsert(self, session: AsyncSession, key: StorageKey, **values) -> None:
+        """Writes state or data of the record. The other column is reset if the existing record has expired"""
+
+        now = datetime.now()
+        expires_at = now + self.ttl
+        is_expired = FSMRecord.expires_at <= now
+        if 'state' in values:
+            values.setdefault('data', {})
+            update_values = dict(
+                state=values['state'],
+                data=case((is_expired, literal({}, FSMRecord.data.type)), else_=FSMRecord.data),
+            )
+        else:
+            values.setdefault('state', None)
+            update_values = dict(data=values['data'], state=case((is_expired, null()), else_=FSMRecord.state))
+
+        record_key = self._build_key(key)
+        query = (
+            dialect_insert(session, FSMRecord)
+            .values(key=record_key, expires_at=expires_at, **values)
+            .on_conflict_do_update(index_elements=[FSMRecord.key], set_=dict(expires_at=expires_at, **update_values))
+            .returning(FSMRecord.state, FSMRecord.data)
+        )
+        state, data = (await session.execute(query)).one()
+        await session.commit()
+        self._remember(record_key, state, data)
+
+    async def _maybe_purge(self) -> None:
+        if time.monotonic() - self._last_purge > self.purge_interval:
+            await self.purge_expired()
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        record_key = self._build_key(key)
+        record = self._get_task_records().get(record_key)
+        if record is not None and time.monotonic() - record.read_at < RECORD_REUSE_SECONDS:
+            return record
+
+        async with self.session_pool() as session:
+            query = (
+                select(FSMRecord.state, FSMRecord.data)
+                .where(FSMRecord.key == record_key, FSMRecord.expires_at > datetime.now())
+            )
+            row = (await session.execute(query)).first()
+
+        state, data = row if row is not None else (None, None)
+        return self._remember(record_key, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        async with self.session_pool() as session:
+            await self._upsert(session, key, state=state.state if isinstance(state, State) else state)
+        await self._maybe_purge()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        async with self.session_pool() as session:
+            if not data:
+                # Finished flows leave no rows behind
+                record_key = self._build_key(key)
+                query = delete(FSMRecord).where(FSMRecord.key == record_key, FSMRecord.state.is_(None))
+                result = await session.execute(query)
+                if result.rowcount:
+                    await session.commit()
+                    self._remember(record_key, None, None)
+                    return
+
+            await self._upsert(session, key, data=data)
+        await self._maybe_purge()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get_record(key)).data)
+
+    async def purge_expired(self) -> int:
+        """Deletes records of abandoned flows. Returns number of deleted records"""
+
+        self._last_purge = time.monotonic()
+        async with self.session_pool() as session:
+            result = await session.execute(delete(FSMRecord).where(FSMRecord.expires_at <= datetime.now()))
+            await session.commit()
+
+        if result.rowcount:
+            logger.debug(f'{result.rowcount} expired FSM records deleted')
+        return result.rowcount
+
+    async def close(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from database.cache import user_id_cache, category_cache
+from database.model import Base
+
+T = TypeVar('T')
+
+
+@pytest.fixture
+def run_with_session(tmp_path) -> Callable[[Callable[[AsyncSession], Awaitable[T]]], T]:
+    """Runs the test coroutine with a session of a new SQLite database with all tables and empty caches"""
+
+    def run(test: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        async def main() -> T:
+            user_id_cache.clear()
+            category_cache.clear()
+            engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                    return await test(session)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,57 @@
+import io
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.model import Expense, Income
+from database.orm_query import orm_add_user
+from services.bank_import import import_statement, IMPORT_CHUNK_SIZE
+
+TELEGRAM_ID = 42
+
+
+def _statement(rows: int) -> io.BytesIO:
+    lines = ['Дата;Сумма;Описание']
+    for i in range(rows):
+        lines.append(f'{i % 28 + 1:02d}.03.2026 10:{i % 60:02d}:{i // 60 % 60:02d};-{i + 1},50;Пятерочка {i}')
+    lines.append('01.03.2026;100 000;Зарплата')
+    lines.append('не дата;-1;Ошибка')
+    lines.append('02.03.2026;-5;Неизвестно')
+    return io.BytesIO('\n'.join(lines).encode('utf-8-sig'))
+
+
+def test_import_statement_commits_every_chunk_before_reporting_progress(run_with_session):
+    rows = IMPORT_CHUNK_SIZE + 10
+
+    async def test(session):
+        await orm_add_user(session, telegram_id=TELEGRAM_ID)
+        other_session_pool = async_sessionmaker(session.bind)
+        committed = []
+
+        async def on_progress(result):
+            # Records of the chunk are visible to other connections when progress is reported
+            async with other_session_pool() as other_session:
+                committed.append((result.added, await other_session.scalar(select(func.count(Expense.id)))))
+
+        result = await import_statement(session, TELEGRAM_ID, _statement(rows), on_progress=on_progress)
+        incomes = await session.scalar(select(func.count(Income.id)))
+        return result, committed, incomes
+
+    result, committed, incomes = run_with_session(test)
+
+    assert (result.added, result.invalid, result.unmatched, result.duplicates) == (rows + 1, 1, 1, 0)
+    assert committed == [(IMPORT_CHUNK_SIZE, IMPORT_CHUNK_SIZE), (rows + 1, rows)]
+    assert incomes == 1
+
+
+def test_import_statement_again_adds_only_new_rows(run_with_session):
+    async def test(session):
+        await orm_add_user(session, telegram_id=TELEGRAM_ID)
+        first = await import_statement(session, TELEGRAM_ID, _statement(5))
+        second = await import_statement(session, TELEGRAM_ID, _statement(8))
+        return first, second
+
+    first, second = run_with_session(test)
+
+    assert first.added == 6
+    assert (second.added, second.duplicates) == (3, 6)
@@ -0,0 +1,136 @@
+import pytest
+
+import database.cache
+from database.cache import UserIdCache, CategoryCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(database.cache, 'time', clock)
+    return clock
+
+
+def test_user_id_cache_hit_and_miss(clock):
+    cache = UserIdCache()
+    assert cache.get(1) is None
+
+    cache.set(1, 10)
+    assert cache.get(1) == 10
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_user_id_cache_expires_entries(clock):
+    cache = UserIdCache(ttl=60)
+    cache.set(1, 10)
+
+    clock.now += 59
+    assert cache.get(1) == 10
+    clock.now += 2
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_user_id_cache_evicts_least_recently_used(clock):
+    cache = UserIdCache(max_size=2)
+    cache.set(1, 10)
+    cache.set(2, 20)
+    cache.get(1)
+    cache.set(3, 30)
+
+    assert cache.get(2) is None
+    assert cache.get(1) == 10
+    assert cache.get(3) == 30
+    assert cache.stats.evictions == 1
+
+
+def test_user_id_cache_invalidate(clock):
+    cache = UserIdCache()
+    cache.set(1, 10)
+    cache.invalidate(1)
+
+    assert cache.get(1) is None
+
+
+def test_category_cache_expires_snapshots(clock):
+    cache = CategoryCache(ttl=30)
+    cache.set(1, False, [('Продукты', 5)], version=cache.version(1, False))
+
+    clock.now += 29
+    assert cache.get(1, False).name_to_id == {'Продукты': 5}
+    clock.now += 2
+    assert cache.get(1, False) is None
+
+
+def test_category_cache_snapshot_keeps_limits(clock):
+    cache = CategoryCache()
+    snapshot = cache.set(1, False, [('Продукты', 5, 1000), ('Такси', 6, None)], version=cache.version(1, False))
+
+    assert snapshot.id_to_name == {5: 'Продукты', 6: 'Такси'}
+    assert snapshot.limits == {5: 1000}
+
+
+def test_category_cache_invalidate_removes_both_types(clock):
+    cache = CategoryCache()
+    cache.set(1, False, [('Продукты', 5)], version=cache.version(1, False))
+    cache.set(1, True, [('Зарплата', 7)], version=cache.version(1, True))
+    cache.set(2, False, [('Такси', 8)], version=cache.version(2, False))
+
+    cache.invalidate(1)
+
+    assert cache.get(1, False) is None
+    assert cache.get(1, True) is None
+    assert cache.get(2, False) is not None
+
+
+def test_category_cache_does_not_store_snapshot_loaded_during_invalidation(clock):
+    cache = CategoryCache()
+    version = cache.version(1, False)
+    # Categories are changed while the snapshot is being loaded from the database
+    cache.invalidate(1, False)
+    snapshot = cache.set(1, False, [('Продукты', 5)], version=version)
+
+    assert snapshot.name_to_id == {'Продукты': 5}
+    assert cache.get(1, False) is None
+
+    cache.set(1, False, [('Продукты', 5), ('Такси', 6)], version=cache.version(1, False))
+    assert cache.get(1, False).name_to_id == {'Продукты': 5, 'Такси': 6}
+
+
+def test_category_cache_clear_rejects_pending_snapshots(clock):
+    cache = CategoryCache()
+    version = cache.version(1, False)
+    cache.clear()
+    cache.set(1, False, [('Продукты', 5)], version=version)
+
+    assert len(cache) == 0
+
+
+def test_category_cache_stores_snapshot_loaded_during_invalidation_of_other_user(clock):
+    cache = CategoryCache()
+    version = cache.version(1, False)
+    cache.invalidate(2)
+    cache.invalidate(1, True)
+    cache.set(1, False, [('Продукты', 5)], version=version)
+
+    assert cache.get(1, False).name_to_id == {'Продукты': 5}
+
+
+def test_category_cache_forgotten_invalidations_reject_pending_snapshots(clock):
+    cache = CategoryCache(max_size=2)
+    version = cache.version(1, False)
+    cache.invalidate(1, False)
+    # Invalidations of other users push out the key of the first user
+    cache.invalidate(2)
+    cache.invalidate(3)
+    cache.set(1, False, [('Продукты', 5)], version=version)
+
+    assert cache.get(1, False) is None
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import StatesGroup, State
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update, Message, Chat, User
+
+from middlewares.metrics import MeasuredEventIsolation
+from middlewares.concurrency import ConcurrencyLimitMiddleware
+
+
+class Flow(StatesGroup):
+    amount = State()
+
+
+def _update(update_id: int, chat_id: int, text: str) -> Update:
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type='private'),
+        from_user=User(id=chat_id, is_bot=False, first_name='User'),
+        text=text,
+    ))
+
+
+def _create_dispatcher(handled: list[tuple[int, str]]) -> Dispatcher:
+    router = Router()
+
+    @router.message(StateFilter(None), F.text == 'start')
+    async def start(message: Message, state: FSMContext):
+        # The state is set after a pause, so the next update of the chat arrives while this one is processed
+        await asyncio.sleep(0.05)
+        await state.set_state(Flow.amount)
+        handled.append((message.chat.id, 'start'))
+
+    @router.message(Flow.amount)
+    async def amount(message: Message, state: FSMContext):
+        await state.clear()
+        handled.append((message.chat.id, f'amount {message.text}'))
+
+    @router.message()
+    async def other(message: Message):
+        handled.append((message.chat.id, f'other {message.text}'))
+
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=MeasuredEventIsolation())
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(max_in_flight=2))
+    dp.include_router(router)
+    return dp
+
+
+def test_next_update_of_chat_sees_state_set_by_previous_one():
+    handled = []
+
+    async def test():
+        dp = _create_dispatcher(handled)
+        bot = Bot('42:TEST')
+        updates = [_update(i * 10 + chat_id, chat_id, text) for chat_id in (1, 2, 3)
+                   for i, text in enumerate(('start', '100', 'again'))]
+        await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+        await bot.session.close()
+
+    asyncio.run(test())
+
+    for chat_id in (1, 2, 3):
+        assert [text for chat, text in handled if chat == chat_id] == ['start', 'amount 100', 'other again']
+
+
+def test_updates_of_one_chat_are_processed_in_order_within_the_limit():
+    processed = []
+    running = peak = 0
+
+    async def handler(message: Message):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Earlier updates take longer, so without isolation later ones would finish first
+        await asyncio.sleep(0.01 * (5 - int(message.text)))
+        processed.append((message.chat.id, int(message.text)))
+        running -= 1
+
+    async def test():
+        router = Router()
+        router.message()(handler)
+        dp = Dispatcher(storage=MemoryStorage(), events_isolation=MeasuredEventIsolation())
+        dp.update.outer_middleware(ConcurrencyLimitMiddleware(max_in_flight=2))
+        dp.include_router(router)
+        bot = Bot('42:TEST')
+        await asyncio.gather(*(dp.feed_update(bot, _update(i * 10 + chat_id, chat_id, str(i)))
+                               for i in range(5) for chat_id in range(1, 5)))
+        await bot.session.close()
+
+    asyncio.run(test())
+
+    for chat_id in range(1, 5):
+        assert [i for chat, i in processed if chat == chat_id] == list(range(5))
+    assert peak == 2
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.types import Update, Message, Chat, User
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from database.model import Base
+from database.replica import READ_ONLY_KEY
+from middlewares.db_session import DataBaseSession
+from storages.sql import SQLStorage
+
+
+def _update(update_id: int, chat_id: int, text_: str) -> Update:
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type='private'),
+        from_user=User(id=chat_id, is_bot=False, first_name='User'),
+        text=text_,
+    ))
+
+
+def _create_dispatcher(storage: SQLStorage, session_pool: async_sessionmaker, read_session_pool: async_sessionmaker,
+                       used_pools: list[str]) -> Dispatcher:
+    router = Router()
+
+    @router.message(F.text == 'write')
+    async def write(message: Message, session: AsyncSession):
+        await session.execute(text('SELECT 1'))
+        await session.commit()
+
+    @router.message(F.text == 'read', flags={'db_session': 'read'})
+    async def read(message: Message, session: AsyncSession):
+        used_pools.append('replica' if session.info.get(READ_ONLY_KEY) else 'primary')
+
+    db_session_middleware = DataBaseSession(session_pool=session_pool, read_session_pool=read_session_pool)
+    dp = Dispatcher(storage=storage)
+    dp.message.middleware(db_session_middleware)
+    dp.include_router(router)
+    return dp
+
+
+def test_read_after_write_goes_to_primary_in_other_process(tmp_path):
+    used_pools = []
+
+    async def test():
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_pool = async_sessionmaker(engine, expire_on_commit=False)
+        read_session_pool = async_sessionmaker(engine, expire_on_commit=False, info={READ_ONLY_KEY: True})
+
+        # Two bot processes sharing FSM storage: the write goes through the first one, reads through the second one
+        storages = [SQLStorage.from_url(f'sqlite+aiosqlite:///{tmp_path / "test.db"}') for _ in range(2)]
+        writer, reader = (_create_dispatcher(storage, session_pool, read_session_pool, used_pools)
+                          for storage in storages)
+        bot = Bot('42:TEST')
+        try:
+            # Every update is processed by its own task as in polling and webhook modes
+            for dp, update in ((reader, _update(1, 1, 'read')), (writer, _update(2, 1, 'write')),
+                               (reader, _update(3, 1, 'read')), (reader, _update(4, 2, 'read'))):
+                await asyncio.create_task(dp.feed_update(bot, update))
+        finally:
+            await bot.session.close()
+            for storage in storages:
+                await storage.close()
+            await engine.dispose()
+
+    asyncio.run(test())
+    # Other users keep reading from the replica
+    assert used_pools == ['replica', 'primary', 'replica']
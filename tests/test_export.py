@@ -0,0 +1,57 @@
+import asyncio
+import csv
+import io
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from database.orm_query import HistoryRecord
+from services.export import export_history, EXPORT_HEADER, WRITE_BATCH
+
+COUNT = WRITE_BATCH * 2 + 7
+
+
+async def _records(count: int, error: Exception = None):
+    for i in range(count):
+        yield HistoryRecord(i % 2 == 1, i, datetime(2026, 3, 1) + timedelta(minutes=i), Decimal('10.50'), 'Продукты',
+                            f'покупка; {i}' if i % 3 else None)
+    if error is not None:
+        raise error
+
+
+def test_export_csv():
+    file, count = asyncio.run(export_history(_records(COUNT), 'csv'))
+    with file:
+        data = file.read()
+
+    assert count == COUNT
+    # Byte order mark is written once, so Excel detects UTF-8
+    assert data.startswith(b'\xef\xbb\xbf') and data.count(b'\xef\xbb\xbf') == 1
+    rows = list(csv.reader(io.StringIO(data.decode('utf-8-sig'), newline=''), delimiter=';'))
+    assert rows[0] == list(EXPORT_HEADER)
+    assert len(rows) == COUNT + 1
+    assert rows[2] == ['2026-03-01 00:01:00', 'Доход', '10.50', 'Продукты', 'покупка; 1']
+    assert rows[-1][0] == (datetime(2026, 3, 1) + timedelta(minutes=COUNT - 1)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_export_xlsx():
+    openpyxl = pytest.importorskip('openpyxl')
+
+    file, count = asyncio.run(export_history(_records(COUNT), 'xlsx'))
+    with file:
+        sheet = openpyxl.load_workbook(file, read_only=True)['История']
+        rows = list(sheet.values)
+
+    assert count == COUNT
+    assert rows[0] == EXPORT_HEADER
+    assert len(rows) == COUNT + 1
+    assert rows[1] == (datetime(2026, 3, 1), 'Расход', 10.5, 'Продукты', None)
+
+
+def test_export_propagates_database_error():
+    error = OperationalError('SELECT', {}, Exception('connection lost'))
+
+    with pytest.raises(OperationalError):
+        asyncio.run(export_history(_records(10, error), 'csv'))
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from database.orm_query import (orm_add_user, orm_get_cached_categories, orm_add_income_expense,
+                                orm_get_history_page, HistoryCursor)
+from handlers.history import encode_cursor, decode_cursor
+
+TELEGRAM_ID = 42
+
+
+async def _add_records(session) -> None:
+    """Adds incomes and expenses with equal creation times inside and across both tables"""
+
+    await orm_add_user(session, telegram_id=TELEGRAM_ID)
+    expense_category = next(iter((await orm_get_cached_categories(session, TELEGRAM_ID)).name_to_id))
+    income_category = next(iter((await orm_get_cached_categories(session, TELEGRAM_ID, is_income=True)).name_to_id))
+    start = datetime(2026, 3, 1, 10)
+    for day in range(7):
+        date_time = start + timedelta(days=day // 2)
+        await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=10 + day, category=expense_category,
+                                     date_time=date_time)
+        if day % 3 == 0:
+            await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, is_income=True, amount=100 + day,
+                                         category=income_category, date_time=date_time)
+
+
+async def _read_all_pages(session, limit: int) -> list[list]:
+    pages = []
+    cursor = None
+    while True:
+        records, cursor = await orm_get_history_page(session, TELEGRAM_ID, cursor, limit=limit)
+        pages.append(records)
+        if cursor is None:
+            return pages
+
+
+def test_history_pages_follow_feed_order_without_gaps(run_with_session):
+    async def test(session):
+        await _add_records(session)
+        [feed] = await _read_all_pages(session, limit=100)
+        return feed, await _read_all_pages(session, limit=3)
+
+    feed, pages = run_with_session(test)
+
+    assert len(feed) == 10
+    assert [record.cursor for record in feed] == sorted((record.cursor for record in feed), reverse=True)
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert [record for page in pages for record in page] == feed
+
+
+def test_history_last_full_page_has_no_next_cursor(run_with_session):
+    async def test(session):
+        await _add_records(session)
+        return await _read_all_pages(session, limit=5)
+
+    assert [len(page) for page in run_with_session(test)] == [5, 5]
+
+
+def test_history_cursor_survives_callback_data():
+    cursor = HistoryCursor(datetime(2026, 3, 15, 10, 30, 15, 123456), True, 123456789)
+
+    encoded = encode_cursor(cursor)
+
+    assert len(encoded) < 40
+    assert decode_cursor(encoded) == cursor
+    assert decode_cursor('not a cursor') is None
+    assert decode_cursor(None) is None
@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_dispatcher_benchmark_with_sql_fsm_storage(tmp_path):
+    # Every simulated user is in flight at once, so updates compete for connections of the pool
+    users = 100
+    report_path = tmp_path / 'report.json'
+    env = dict(os.environ, FSM_STORAGE='sql', DB_URL=f'sqlite+aiosqlite:///{tmp_path / "load.db"}')
+    env.pop('MAX_CONCURRENT_UPDATES', None)
+
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.dispatcher_benchmark', '--users', str(users), '--concurrency', str(users),
+         '--json', str(report_path)],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+
+    assert result.returncode == 0, result.stderr[-2000:]
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    # Every step of the scenario of every user is handled
+    assert report['updates'] == users * 9
+    assert 'unhandled' not in report['handlers']
@@ -0,0 +1,84 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from database.cache import category_cache, user_id_cache
+from database.orm_query import (orm_add_user, orm_get_cached_categories, orm_set_category_limit,
+                                orm_add_income_expense, orm_add_incomes_expenses, orm_get_user_id)
+
+TELEGRAM_ID = 42
+
+
+async def _add_user_with_limit(session, limit: Decimal) -> str:
+    """Adds the user with default categories and sets the limit of the first expense category. Returns its name"""
+
+    await orm_add_user(session, telegram_id=TELEGRAM_ID)
+    name, category_id = next(iter((await orm_get_cached_categories(session, TELEGRAM_ID)).name_to_id.items()))
+    await orm_set_category_limit(session, telegram_id=TELEGRAM_ID, category_id=category_id, limit=limit)
+    return name
+
+
+def _expense(category: str, amount: str) -> dict:
+    return {'telegram_id': TELEGRAM_ID, 'is_income': False, 'amount': Decimal(amount), 'category': category,
+            'description': None, 'date_time': datetime(2026, 3, 15, 10)}
+
+
+def test_batch_reports_limit_status_without_cached_categories(run_with_session):
+    async def test(session):
+        category = await _add_user_with_limit(session, Decimal('1000'))
+        # The snapshot of categories has expired
+        category_cache.clear()
+        results = await orm_add_incomes_expenses(session, [_expense(category, '300'), _expense(category, '600')])
+        await session.commit()
+        return results
+
+    first, second = run_with_session(test)
+
+    assert (first.limit_status.spent, second.limit_status.spent) == (Decimal('900.00'), Decimal('900.00'))
+    assert second.limit_status.limit == Decimal('1000')
+    assert second.limit_status.status == 'warning'
+
+
+def test_batch_and_single_row_paths_report_the_same_limit_status(run_with_session):
+    async def test(session):
+        category = await _add_user_with_limit(session, Decimal('100'))
+        await orm_get_cached_categories(session, TELEGRAM_ID)
+        [cached_result] = await orm_add_incomes_expenses(session, [_expense(category, '60')])
+        await session.commit()
+
+        category_cache.clear()
+        [uncached_result] = await orm_add_incomes_expenses(session, [_expense(category, '30')])
+        await session.commit()
+
+        category_cache.clear()
+        single = await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=20, category=category,
+                                              date_time=datetime(2026, 3, 15, 11))
+        return cached_result.limit_status, uncached_result.limit_status, single.limit_status
+
+    cached_status, uncached_status, single_status = run_with_session(test)
+
+    assert cached_status.status == 'ok'
+    assert uncached_status.status == 'warning'
+    assert single_status.status == 'exceeded'
+    assert single_status.spent == Decimal('110.00')
+
+
+def test_returning_user_is_looked_up_without_insert(run_with_session):
+    async def test(session):
+        statements = []
+        event.listen(session.bind.sync_engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        assert await orm_add_user(session, telegram_id=TELEGRAM_ID)
+        user_id = await orm_get_user_id(session, TELEGRAM_ID)
+        # The user id is no longer cached, e.g. in another bot process
+        user_id_cache.clear()
+        statements.clear()
+        is_added = await orm_add_user(session, telegram_id=TELEGRAM_ID)
+        return is_added, statements, user_id, user_id_cache.get(TELEGRAM_ID)
+
+    is_added, statements, user_id, cached_user_id = run_with_session(test)
+
+    assert not is_added
+    assert [statement.split()[0] for statement in statements] == ['SELECT']
+    assert cached_user_id == user_id
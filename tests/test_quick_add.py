@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+import pytest
+
+from services.quick_add import evaluate_amount, parse_quick_add, QuickAddEntry
+
+CATEGORIES = ['Продукты', 'ЖКХ', 'Отдых', 'Транспорт', 'Такси']
+
+
+@pytest.mark.parametrize('expression, amount', [
+    ('250', Decimal('250.00')),
+    ('250,50', Decimal('250.50')),
+    ('250.505', Decimal('250.51')),
+    ('120+45', Decimal('165.00')),
+    ('(100-20)*3/4', Decimal('60.00')),
+    ('10/3', Decimal('3.33')),
+])
+def test_evaluate_amount(expression, amount):
+    assert evaluate_amount(expression) == amount
+
+
+@pytest.mark.parametrize('expression', [
+    '0', '5-10', '1/0', '2**10', '__import__("os")', 'abc', '1' * 11, '1+' * 30 + '1',
+])
+def test_evaluate_amount_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        evaluate_amount(expression)
+
+
+def test_parse_quick_add_several_entries():
+    result = parse_quick_add('продукты 250,50; жкх 3000 коммуналка, 120+45 отдых', CATEGORIES)
+
+    assert result.entries == [
+        QuickAddEntry(Decimal('250.50'), 'Продукты', None),
+        QuickAddEntry(Decimal('3000.00'), 'ЖКХ', 'коммуналка'),
+        QuickAddEntry(Decimal('165.00'), 'Отдых', None),
+    ]
+    assert result.errors == []
+
+
+def test_parse_quick_add_resolves_abbreviations_and_typos():
+    result = parse_quick_add('прод 100\nтрансопрт 50 метро', CATEGORIES)
+
+    assert result.entries == [
+        QuickAddEntry(Decimal('100.00'), 'Продукты', None),
+        QuickAddEntry(Decimal('50.00'), 'Транспорт', 'метро'),
+    ]
+
+
+def test_parse_quick_add_ambiguous_prefix_is_not_guessed():
+    # "т" is the beginning of both "Транспорт" and "Такси"
+    result = parse_quick_add('т 100', CATEGORIES)
+
+    assert result.entries == []
+    assert result.errors == ['т 100']
+
+
+def test_parse_quick_add_collects_errors():
+    result = parse_quick_add('продукты; неизвестно 100; такси 300', CATEGORIES)
+
+    assert result.entries == [QuickAddEntry(Decimal('300.00'), 'Такси', None)]
+    assert result.errors == ['продукты', 'неизвестно 100']
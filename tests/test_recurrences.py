@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, func, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import database.recurrences
+import database.rollups
+from database.model import Recurrence, Expense, CategoryRollup
+from database.orm_query import orm_add_user, orm_get_cached_categories
+from database.recurrences import (next_occurrence, first_occurrence, orm_get_due_recurrences,
+                                  orm_materialize_recurrences, MAX_CATCH_UP_OCCURRENCES)
+from services.recurrence_scheduler import RecurrenceScheduler
+
+
+@pytest.mark.parametrize('due, frequency, day, expected', [
+    (datetime(2026, 3, 15, 9), 'daily', None, datetime(2026, 3, 16, 9)),
+    (datetime(2026, 12, 31, 9), 'daily', None, datetime(2027, 1, 1, 9)),
+    (datetime(2026, 3, 15, 9), 'weekly', None, datetime(2026, 3, 22, 9)),
+    (datetime(2026, 3, 15, 9), 'monthly', 15, datetime(2026, 4, 15, 9)),
+    (datetime(2026, 12, 5, 9), 'monthly', 5, datetime(2027, 1, 5, 9)),
+    # The day of month is clamped to the last day of short months and restored in longer ones
+    (datetime(2026, 1, 31, 9), 'monthly', 31, datetime(2026, 2, 28, 9)),
+    (datetime(2026, 2, 28, 9), 'monthly', 31, datetime(2026, 3, 31, 9)),
+    (datetime(2028, 1, 30, 9), 'monthly', 30, datetime(2028, 2, 29, 9)),
+])
+def test_next_occurrence(due, frequency, day, expected):
+    assert next_occurrence(due, frequency, day) == expected
+
+
+@pytest.mark.parametrize('now, frequency, day, expected', [
+    (datetime(2026, 10, 18, 8), 'daily', None, datetime(2026, 10, 18, 9)),
+    (datetime(2026, 10, 18, 10), 'daily', None, datetime(2026, 10, 19, 9)),
+    # 2026-10-18 is Sunday, 1 is Monday
+    (datetime(2026, 10, 18, 10), 'weekly', 1, datetime(2026, 10, 19, 9)),
+    (datetime(2026, 10, 18, 8), 'weekly', 7, datetime(2026, 10, 18, 9)),
+    (datetime(2026, 10, 18, 10), 'weekly', 7, datetime(2026, 10, 25, 9)),
+    (datetime(2026, 10, 18, 10), 'monthly', 5, datetime(2026, 11, 5, 9)),
+    (datetime(2026, 10, 18, 10), 'monthly', 25, datetime(2026, 10, 25, 9)),
+    (datetime(2026, 1, 31, 10), 'monthly', 31, datetime(2026, 2, 28, 9)),
+])
+def test_first_occurrence(now, frequency, day, expected):
+    assert first_occurrence(now, frequency, day) == expected
+
+
+def _recurrence(next_due: datetime, is_active: bool = True) -> Recurrence:
+    return Recurrence(is_income=False, amount=Decimal('100.00'), frequency='daily', next_due=next_due,
+                      is_active=is_active, user_id=1, category_id=1)
+
+
+def test_orm_get_due_recurrences_pages_by_keyset(run_with_session):
+    due = datetime(2026, 3, 15, 9)
+
+    async def test(session):
+        recurrences = [_recurrence(due), _recurrence(due), _recurrence(due + timedelta(hours=1)),
+                       _recurrence(due, is_active=False), _recurrence(due + timedelta(days=1))]
+        session.add_all(recurrences)
+        await session.commit()
+
+        pages, cursor = [], None
+        while page := await orm_get_due_recurrences(session, due + timedelta(hours=2), after=cursor, limit=2):
+            pages.append(page)
+            cursor = page[-1]
+        return [recurrence.id for recurrence in recurrences], pages
+
+    ids, pages = run_with_session(test)
+
+    # Recurrences with equal next_due are ordered by id, inactive and later ones are skipped
+    assert pages == [
+        [(due, ids[0]), (due, ids[1])],
+        [(due + timedelta(hours=1), ids[2])],
+    ]
+
+
+def test_scheduler_loads_every_window_from_the_beginning(run_with_session):
+    now = datetime(2026, 3, 15, 9)
+
+    async def test(session):
+        session.add_all([_recurrence(now + timedelta(minutes=minutes)) for minutes in (10, 20, 30)])
+        await session.commit()
+
+        scheduler = RecurrenceScheduler(async_sessionmaker(session.bind), bot=None, window=timedelta(hours=1),
+                                        page_size=2)
+        await scheduler._load(now)
+        first_page = sorted(scheduler._scheduled)
+        await scheduler._load(now)
+        first_window = sorted(scheduler._scheduled)
+
+        # Created by another process with next_due below the cursor of the first window
+        late = _recurrence(now + timedelta(minutes=5))
+        session.add(late)
+        await session.commit()
+        await scheduler._load(now + timedelta(hours=1))
+        return first_page, first_window, late.id, sorted(scheduler._scheduled)
+
+    first_page, first_window, late_id, second_window = run_with_session(test)
+
+    assert first_page == [1, 2]
+    assert first_window == [1, 2, 3]
+    assert second_window == [1, 2, 3, late_id]
+
+
+def test_materialize_catch_up_in_chunks(run_with_session, monkeypatch):
+    monkeypatch.setattr(database.recurrences, 'OCCURRENCE_INSERT_CHUNK', 100)
+    monkeypatch.setattr(database.rollups, 'UPSERT_CHUNK', 100)
+    now = datetime(2026, 3, 15, 12)
+    started = datetime(2026, 3, 15, 9) - timedelta(days=400)
+
+    async def test(session):
+        await orm_add_user(session, telegram_id=42)
+        category_id = next(iter((await orm_get_cached_categories(session, 42)).id_to_name))
+        recurrences = [Recurrence(is_income=False, amount=Decimal('10.00'), frequency='daily', next_due=started,
+                                  user_id=1, category_id=category_id) for _ in range(3)]
+        session.add_all(recurrences)
+        await session.commit()
+        ids = [recurrence.id for recurrence in recurrences]
+
+        materialized, next_dues = await orm_materialize_recurrences(session, ids, now)
+        # Replaying the same occurrences, e.g. after a crash before next_due was saved, writes nothing
+        await session.execute(update(Recurrence).values(next_due=started))
+        await session.commit()
+        replayed, _ = await orm_materialize_recurrences(session, ids, now)
+
+        expenses = await session.scalar(select(func.count(Expense.id)))
+        month_total = await session.scalar(
+            select(func.sum(CategoryRollup.total)).where(CategoryRollup.period == 'month')
+        )
+        return len(materialized), set(next_dues.values()), len(replayed), expenses, month_total
+
+    materialized, next_dues, replayed, expenses, month_total = run_with_session(test)
+
+    assert materialized == 3 * MAX_CATCH_UP_OCCURRENCES
+    assert next_dues == {datetime(2026, 3, 16, 9)}
+    assert replayed == 0
+    assert expenses == 3 * MAX_CATCH_UP_OCCURRENCES
+    assert month_total == Decimal('10.00') * 3 * MAX_CATCH_UP_OCCURRENCES
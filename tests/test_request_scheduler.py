@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, DeleteMessages, EditMessageText, SendMessage, TelegramMethod
+
+from middlewares.request_scheduler import RequestScheduler
+
+CHAT_ID = 42
+RETRY_AFTER = 0.2
+# asyncio may wake sleeping tasks earlier by resolution of the clock
+TOLERANCE = 0.01
+
+
+class FakeTelegram:
+    """make_request of the bot session recording sent requests and answering the first ones with RetryAfter"""
+
+    def __init__(self, flood_errors: int = 0) -> None:
+        self.flood_errors = flood_errors
+        self.requests: list[tuple[float, TelegramMethod]] = []
+
+    async def __call__(self, bot: Bot, method: TelegramMethod):
+        self.requests.append((time.monotonic(), method))
+        if self.flood_errors:
+            self.flood_errors -= 1
+            raise TelegramRetryAfter(method, 'Too Many Requests', RETRY_AFTER)
+        return True
+
+
+def test_deletions_of_one_chat_are_sent_as_one_request():
+    telegram = FakeTelegram()
+
+    async def test():
+        scheduler = RequestScheduler()
+        bot = Bot('42:TEST')
+        return await asyncio.gather(*(scheduler(telegram, bot, DeleteMessage(chat_id=CHAT_ID, message_id=message_id))
+                                      for message_id in (1, 2, 3)))
+
+    results = asyncio.run(test())
+
+    assert results == [True, True, True]
+    [(_, request)] = telegram.requests
+    assert isinstance(request, DeleteMessages)
+    assert request.message_ids == [1, 2, 3]
+
+
+def test_deletion_batch_is_retried_after_flood_error():
+    telegram = FakeTelegram(flood_errors=1)
+
+    async def test():
+        scheduler = RequestScheduler()
+        bot = Bot('42:TEST')
+        return await asyncio.gather(*(scheduler(telegram, bot, DeleteMessage(chat_id=CHAT_ID, message_id=message_id))
+                                      for message_id in (1, 2)))
+
+    results = asyncio.run(test())
+
+    assert results == [True, True]
+    (first_time, first), (retry_time, retry) = telegram.requests
+    assert retry is first
+    assert retry_time - first_time >= RETRY_AFTER - TOLERANCE
+
+
+def test_retried_edit_does_not_take_tokens_of_the_chat():
+    telegram = FakeTelegram(flood_errors=1)
+    global_acquires = []
+
+    async def test():
+        scheduler = RequestScheduler(chat_burst=1)
+        acquire = scheduler.global_bucket.acquire
+
+        async def count_acquire(*args):
+            global_acquires.append(args)
+            await acquire(*args)
+
+        scheduler.global_bucket.acquire = count_acquire
+        bot = Bot('42:TEST')
+        await scheduler(telegram, bot, EditMessageText(chat_id=CHAT_ID, message_id=1, text='Edited'))
+        # The chat still has its token for a new message, so the message is sent without waiting for the chat rate
+        started = time.monotonic()
+        await scheduler(telegram, bot, SendMessage(chat_id=CHAT_ID, text='New'))
+        return time.monotonic() - started
+
+    send_duration = asyncio.run(test())
+
+    assert len(telegram.requests) == 3
+    assert send_duration < 0.5
+    # Both attempts of the edit and the message passed the global bucket
+    assert len(global_acquires) == 3
+
+
+def test_retried_message_waits_for_the_chat():
+    telegram = FakeTelegram(flood_errors=1)
+
+    async def test():
+        scheduler = RequestScheduler()
+        bot = Bot('42:TEST')
+        send = asyncio.create_task(scheduler(telegram, bot, SendMessage(chat_id=CHAT_ID, text='First')))
+        await asyncio.sleep(0.01)
+        # The message of the same chat sent during the pause waits for its end
+        await scheduler(telegram, bot, SendMessage(chat_id=CHAT_ID, text='Second'))
+        await send
+
+    asyncio.run(test())
+
+    (first_time, _), _, (second_time, second) = telegram.requests
+    assert second.text == 'Second'
+    assert second_time - first_time >= RETRY_AFTER - TOLERANCE
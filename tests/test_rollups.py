@@ -0,0 +1,92 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from database.model import CategoryRollup, Expense, User, CategoryExpense
+from database.rollups import RollupDelta, apply_rollup_deltas, period_start, rebuild_rollups
+
+
+async def _get_rollups(session) -> dict[tuple, tuple[Decimal, int]]:
+    rows = (await session.execute(select(CategoryRollup))).scalars().all()
+    return {(row.period, row.period_start, row.is_income, row.category_id): (row.total, row.count) for row in rows}
+
+
+def test_period_start():
+    created = datetime(2026, 3, 15, 23, 59)
+
+    assert period_start(created, 'day') == date(2026, 3, 15)
+    assert period_start(created, 'month') == date(2026, 3, 1)
+    assert period_start(date(2026, 3, 15), 'month') == date(2026, 3, 1)
+
+
+def test_apply_rollup_deltas_aggregates_day_and_month(run_with_session):
+    async def test(session):
+        totals = await apply_rollup_deltas(session, [
+            RollupDelta(1, False, 5, datetime(2026, 3, 15, 10), Decimal('100.00'), 1),
+            RollupDelta(1, False, 5, datetime(2026, 3, 15, 18), Decimal('50.50'), 1),
+            RollupDelta(1, False, 5, datetime(2026, 3, 16, 9), Decimal('20.00'), 1),
+        ])
+        return totals, await _get_rollups(session)
+
+    totals, rollups = run_with_session(test)
+
+    assert totals[(1, 'month', date(2026, 3, 1), False, 5)] == Decimal('170.50')
+    assert totals[(1, 'day', date(2026, 3, 15), False, 5)] == Decimal('150.50')
+    assert rollups == {
+        ('day', date(2026, 3, 15), False, 5): (Decimal('150.50'), 2),
+        ('day', date(2026, 3, 16), False, 5): (Decimal('20.00'), 1),
+        ('month', date(2026, 3, 1), False, 5): (Decimal('170.50'), 3),
+    }
+
+
+def test_apply_rollup_deltas_adds_to_existing_totals(run_with_session):
+    async def test(session):
+        created = datetime(2026, 3, 15, 10)
+        await apply_rollup_deltas(session, [RollupDelta(1, True, 7, created, Decimal('1000.00'), 1)])
+        await session.commit()
+        # Edit of the amount is a deletion of the old record plus an addition of the new one
+        await apply_rollup_deltas(session, [
+            RollupDelta(1, True, 7, created, Decimal('-1000.00'), -1),
+            RollupDelta(1, True, 7, created, Decimal('1200.00'), 1),
+        ])
+        await apply_rollup_deltas(session, [])
+        return await _get_rollups(session)
+
+    rollups = run_with_session(test)
+
+    assert rollups[('day', date(2026, 3, 15), True, 7)] == (Decimal('1200.00'), 1)
+    assert rollups[('month', date(2026, 3, 1), True, 7)] == (Decimal('1200.00'), 1)
+
+
+def test_rebuild_rollups_matches_applied_deltas(run_with_session):
+    records = [
+        (datetime(2026, 2, 28, 23, 0), Decimal('10.00')),
+        (datetime(2026, 3, 1, 0, 30), Decimal('20.25')),
+        (datetime(2026, 3, 1, 12, 0), Decimal('30.00')),
+    ]
+
+    async def test(session):
+        user = User(telegram_id=42)
+        session.add(user)
+        await session.flush()
+        category = CategoryExpense(name='Продукты', user_id=user.id)
+        session.add(category)
+        await session.flush()
+
+        for created, amount in records:
+            session.add(Expense(amount=amount, created=created, user_id=user.id, category_id=category.id))
+        await apply_rollup_deltas(session, [
+            RollupDelta(user.id, False, category.id, created, amount, 1) for created, amount in records
+        ])
+        await session.commit()
+        applied = await _get_rollups(session)
+
+        await rebuild_rollups(session, user.id)
+        await session.commit()
+        return applied, await _get_rollups(session)
+
+    applied, rebuilt = run_with_session(test)
+
+    assert len(applied) == 4
+    assert rebuilt == applied
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from database.orm_query import (orm_add_user, orm_get_cached_categories, orm_add_income_expense,
+                                orm_update_income_expense, orm_delete_income_expense)
+from database.search import create_search_indexes, orm_search_history
+
+TELEGRAM_ID = 42
+
+
+async def _add_user_with_search_indexes(session) -> tuple[str, str]:
+    """Adds the user and creates FTS5 tables. Returns names of the first expense and income categories"""
+
+    await create_search_indexes(await session.connection())
+    await session.commit()
+    await orm_add_user(session, telegram_id=TELEGRAM_ID)
+    expense_category = next(iter((await orm_get_cached_categories(session, TELEGRAM_ID)).name_to_id))
+    income_category = next(iter((await orm_get_cached_categories(session, TELEGRAM_ID, is_income=True)).name_to_id))
+    return expense_category, income_category
+
+
+def test_search_follows_inserts_updates_and_deletes(run_with_session):
+    async def test(session):
+        category, _ = await _add_user_with_search_indexes(session)
+        date_time = datetime(2026, 3, 15, 10)
+        taxi = await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=300, category=category,
+                                            description='Такси домой', date_time=date_time)
+        bus = await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=50, category=category,
+                                           description='Автобус', date_time=date_time)
+        found_after_insert = [record.id for record in (await orm_search_history(session, TELEGRAM_ID, 'такси')).records]
+
+        await orm_update_income_expense(session, telegram_id=TELEGRAM_ID, record_id=bus.id, description='Такси в офис')
+        found_after_update = [record.id for record in (await orm_search_history(session, TELEGRAM_ID, 'такси')).records]
+        bus_found = (await orm_search_history(session, TELEGRAM_ID, 'автобус')).count
+
+        await orm_delete_income_expense(session, telegram_id=TELEGRAM_ID, record_id=taxi.id)
+        found_after_delete = [record.id for record in (await orm_search_history(session, TELEGRAM_ID, 'такси')).records]
+        return taxi.id, bus.id, found_after_insert, found_after_update, bus_found, found_after_delete
+
+    taxi_id, bus_id, after_insert, after_update, bus_found, after_delete = run_with_session(test)
+
+    assert after_insert == [taxi_id]
+    assert sorted(after_update) == sorted([taxi_id, bus_id])
+    assert bus_found == 0
+    assert after_delete == [bus_id]
+
+
+def test_search_matches_prefixes_of_words(run_with_session):
+    async def test(session):
+        category, _ = await _add_user_with_search_indexes(session)
+        await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=100, category=category,
+                                     description='Продукты на неделю', date_time=datetime(2026, 3, 15, 10))
+        return [(await orm_search_history(session, TELEGRAM_ID, query)).count
+                for query in ('прод', 'продукты неделю', 'ПРОДУКТЫ', 'дукты', 'продукты месяц')]
+
+    assert run_with_session(test) == [1, 1, 1, 0, 0]
+
+
+def test_search_totals_cover_all_pages(run_with_session):
+    async def test(session):
+        expense_category, income_category = await _add_user_with_search_indexes(session)
+        start = datetime(2026, 3, 1, 10)
+        for day in range(12):
+            await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=10 + day, category=expense_category,
+                                         description=f'Кофе {day}', date_time=start + timedelta(days=day))
+        await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, is_income=True, amount=500,
+                                     category=income_category, description='Кофе на продажу',
+                                     date_time=start + timedelta(days=20))
+        await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=1000, category=expense_category,
+                                     description='Аренда', date_time=start)
+        return [await orm_search_history(session, TELEGRAM_ID, 'кофе', offset=offset, limit=5)
+                for offset in (0, 5, 10)]
+
+    pages = run_with_session(test)
+
+    assert [page.count for page in pages] == [13, 13, 13]
+    assert [len(page.records) for page in pages] == [5, 5, 3]
+    assert all(page.expenses_total == Decimal(sum(range(10, 22))) for page in pages)
+    assert all(page.incomes_total == Decimal(500) for page in pages)
+    # Pages are ordered from new to old without gaps or repeats
+    records = [record for page in pages for record in page.records]
+    assert records[0].is_income
+    assert [record.created for record in records] == sorted((record.created for record in records), reverse=True)
+    assert len({(record.is_income, record.id) for record in records}) == 13
+
+
+def test_query_without_words_finds_nothing(run_with_session):
+    async def test(session):
+        category, _ = await _add_user_with_search_indexes(session)
+        await orm_add_income_expense(session, telegram_id=TELEGRAM_ID, amount=100, category=category,
+                                     description='Такси', date_time=datetime(2026, 3, 15, 10))
+        return [(await orm_search_history(session, TELEGRAM_ID, query)).count for query in ('', '   ', '?!')]
+
+    assert run_with_session(test) == [0, 0, 0]
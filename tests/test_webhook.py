@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update, Message, Chat, User
+from aiohttp.test_utils import TestClient, TestServer
+
+from webserver.webhook import create_webhook_app, HEALTH_PATH, REQUEST_HANDLER_KEY
+
+WEBHOOK_PATH = '/webhook'
+
+
+def _update(update_id: int) -> dict:
+    update = Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=update_id, type='private'),
+        from_user=User(id=update_id, is_bot=False, first_name='User'),
+        text='text',
+    ))
+    return update.model_dump(mode='json', exclude_none=True)
+
+
+def _create_app(monkeypatch, release: asyncio.Event, handled: list[int]):
+    monkeypatch.setenv('WEBHOOK_PATH', WEBHOOK_PATH)
+    monkeypatch.setenv('WEBHOOK_MAX_CONCURRENCY', '1')
+    monkeypatch.setenv('WEBHOOK_MAX_PENDING', '2')
+    monkeypatch.delenv('WEBHOOK_SECRET', raising=False)
+
+    router = Router()
+
+    @router.message()
+    async def handle(message: Message):
+        await release.wait()
+        handled.append(message.message_id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return create_webhook_app(dp, Bot('42:TEST'))
+
+
+async def _wait_until_processed(app) -> None:
+    while app[REQUEST_HANDLER_KEY].pending:
+        await asyncio.sleep(0.01)
+
+
+def test_webhook_answers_503_while_too_many_updates_are_pending(monkeypatch):
+    handled = []
+
+    async def test():
+        release = asyncio.Event()
+        app = _create_app(monkeypatch, release, handled)
+        async with TestClient(TestServer(app)) as client:
+            statuses = [(await client.post(WEBHOOK_PATH, json=_update(update_id))).status for update_id in (1, 2, 3)]
+            health = await (await client.get(HEALTH_PATH)).json()
+
+            release.set()
+            await _wait_until_processed(app)
+            status_after_release = (await client.post(WEBHOOK_PATH, json=_update(4))).status
+            await _wait_until_processed(app)
+        return statuses, health, status_after_release
+
+    statuses, health, status_after_release = asyncio.run(test())
+
+    assert statuses == [200, 200, 503]
+    assert health == {'draining': False, 'pending': 2}
+    assert status_after_release == 200
+    assert sorted(handled) == [1, 2, 4]
+
+
+def test_drain_rejects_new_updates_and_waits_for_pending_ones(monkeypatch):
+    handled = []
+
+    async def test():
+        release = asyncio.Event()
+        app = _create_app(monkeypatch, release, handled)
+        async with TestClient(TestServer(app)) as client:
+            await client.post(WEBHOOK_PATH, json=_update(1))
+            drain = asyncio.create_task(app[REQUEST_HANDLER_KEY].drain(timeout=5))
+            await asyncio.sleep(0.01)
+            status_while_draining = (await client.post(WEBHOOK_PATH, json=_update(2))).status
+            health_status = (await client.get(HEALTH_PATH)).status
+            is_drained_early = drain.done()
+
+            release.set()
+            await drain
+        return status_while_draining, health_status, is_drained_early
+
+    status_while_draining, health_status, is_drained_early = asyncio.run(test())
+
+    assert (status_while_draining, health_status) == (503, 503)
+    assert not is_drained_early
+    assert handled == [1]
+
+
+def test_drain_cancels_updates_not_processed_in_time(monkeypatch):
+    handled = []
+
+    async def test():
+        app = _create_app(monkeypatch, asyncio.Event(), handled)
+        async with TestClient(TestServer(app)) as client:
+            await client.post(WEBHOOK_PATH, json=_update(1))
+            tasks = set(app[REQUEST_HANDLER_KEY]._background_feed_update_tasks)
+            await app[REQUEST_HANDLER_KEY].drain(timeout=0.05)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return tasks
+
+    [task] = asyncio.run(test())
+
+    assert task.cancelled()
+    assert handled == []
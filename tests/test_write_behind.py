@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import database.write_behind as write_behind
+from database.model import Expense
+from database.orm_query import orm_add_user, orm_get_cached_categories
+from database.write_behind import IncomeExpenseWriter
+
+TELEGRAM_ID = 42
+
+
+async def _submit_all(session, records: list[dict]) -> tuple[list, IncomeExpenseWriter, int]:
+    """Submits records at the same time. Returns results (or exceptions), the writer and the number of expenses"""
+
+    writer = IncomeExpenseWriter(async_sessionmaker(session.bind, expire_on_commit=False), max_delay=0.05)
+    writer.start()
+    try:
+        results = await asyncio.gather(*(writer.submit(**record) for record in records), return_exceptions=True)
+    finally:
+        await writer.stop()
+    count = (await session.execute(select(func.count()).select_from(Expense))).scalar_one()
+    return results, writer, count
+
+
+async def _get_records(session, amounts: list[str]) -> list[dict]:
+    await orm_add_user(session, telegram_id=TELEGRAM_ID)
+    category = next(iter((await orm_get_cached_categories(session, TELEGRAM_ID)).name_to_id))
+    return [{'telegram_id': TELEGRAM_ID, 'amount': Decimal(amount), 'category': category,
+             'date_time': datetime(2026, 3, 15, 10)} for amount in amounts]
+
+
+def test_records_submitted_together_are_written_in_one_batch(run_with_session):
+    async def test(session):
+        records = await _get_records(session, ['10', '20', '30'])
+        records[1]['category'] = 'Нет такой категории'
+        return await _submit_all(session, records)
+
+    results, writer, count = run_with_session(test)
+
+    assert writer.stats.batches == 1
+    assert count == 2
+    assert isinstance(results[1], SQLAlchemyError)
+    assert results[0].id != results[2].id
+
+
+def test_failed_batch_falls_back_to_writing_records_one_by_one(run_with_session, monkeypatch):
+    async def fail_batch(session, records):
+        raise OperationalError('INSERT', {}, Exception('connection lost'))
+
+    monkeypatch.setattr(write_behind, 'orm_add_incomes_expenses', fail_batch)
+
+    async def test(session):
+        records = await _get_records(session, ['10', '20', '30'])
+        records[1]['category'] = 'Нет такой категории'
+        return await _submit_all(session, records)
+
+    results, writer, count = run_with_session(test)
+
+    assert writer.stats.failed_batches == 1
+    # Every record is written in its own transaction, so the bad record does not affect the others
+    assert count == 2
+    assert isinstance(results[1], SQLAlchemyError)
+    assert results[0].id != results[2].id
+
+
+def test_records_submitted_after_stop_are_written_directly(run_with_session):
+    async def test(session):
+        [record] = await _get_records(session, ['10'])
+        writer = IncomeExpenseWriter(async_sessionmaker(session.bind, expire_on_commit=False))
+        result = await writer.submit(**record)
+        return result, writer
+
+    result, writer = run_with_session(test)
+
+    assert result.id
+    assert writer.stats.batches == 0
+
@@ -0,0 +1,55 @@
+import os
+from typing import Optional
+
+from aiohttp import web
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+
+from services.metrics import registry
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+METRICS_PATH = '/metrics'
+# Content type of Prometheus text exposition format
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def is_metrics_enabled() -> bool:
+    """Returns True if metrics endpoint is switched on by METRICS_ENABLED environment variable"""
+    return os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Returns all metrics in Prometheus text exposition format"""
+    return web.Response(body=registry.render().encode(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+
+def create_metrics_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get(METRICS_PATH, metrics)
+    return app
+
+
+metrics_runner: Optional[web.AppRunner] = None
+
+
+async def start_metrics_server() -> None:
+    """Serves metrics on METRICS_HOST:METRICS_PORT (default 127.0.0.1:9100), so they are not exposed publicly"""
+
+    global metrics_runner
+    metrics_runner = web.AppRunner(create_metrics_app())
+    await metrics_runner.setup()
+    site = web.TCPSite(metrics_runner, host=os.getenv('METRICS_HOST', '127.0.0.1'),
+                       port=int(os.getenv('METRICS_PORT', 9100)))
+    await site.start()
+    logger.info(f'Metrics are served on {site.name}{METRICS_PATH}')
+
+
+async def stop_metrics_server() -> None:
+    """Stops metrics server if it is running"""
+
+    global metrics_runner
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+        metrics_runner = None
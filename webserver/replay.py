@@ -0,0 +1,38 @@
+"""
+Posts recorded updates to a locally running webhook server.
+Usage: python -m webserver.replay updates.json [--url http://localhost:8080/webhook] [--secret SECRET]
+The file must contain one update object or a list of update objects in Telegram JSON format.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from aiohttp import ClientSession
+
+
+async def replay(path: str, url: str, secret: str | None) -> None:
+    with open(path, encoding='utf-8') as file:
+        updates = json.load(file)
+    if isinstance(updates, dict):
+        updates = [updates]
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    async with ClientSession() as session:
+        for update in updates:
+            async with session.post(url, json=update, headers=headers) as response:
+                print(f'update_id={update.get("update_id")}: {response.status}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Post recorded updates to the webhook server')
+    parser.add_argument('path', help='JSON file with an update or a list of updates')
+    parser.add_argument('--url', default=f'http://localhost:{os.getenv("WEBHOOK_PORT", 8080)}'
+                                         f'{os.getenv("WEBHOOK_PATH", "/webhook")}')
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET'))
+    args = parser.parse_args()
+    asyncio.run(replay(args.path, args.url, args.secret))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import signal
+from contextlib import suppress
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from dotenv import load_dotenv, find_dotenv
+from loguru import logger
+
+# Loading environment variables
+load_dotenv(find_dotenv())
+
+HEALTH_PATH = '/health'
+
+
+def is_webhook_mode() -> bool:
+    """Returns True if the bot is configured to receive updates by webhook (BOT_MODE=webhook)"""
+    return os.getenv('BOT_MODE', 'polling').lower() == 'webhook'
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook request handler which acknowledges updates immediately and processes them in background
+    with at most max_concurrency updates at a time. If more than max_pending updates are waiting, new requests are
+    answered with 503, so Telegram redelivers them later instead of the process piling up unbounded work.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, *, max_concurrency: int = 100, max_pending: int = 1000,
+                 secret_token: str | None = None, **data: Any) -> None:
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.max_pending = max_pending
+        self.is_draining = False
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def pending(self) -> int:
+        """Number of updates which are being processed or waiting for processing"""
+        return len(self._background_feed_update_tasks)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self.is_draining or self.pending >= self.max_pending:
+            return web.Response(status=503)
+        return await super()._handle_request_background(bot, request)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            await super()._background_feed_update(bot, update)
+
+    async def drain(self, app: web.Application | None = None, timeout: float | None = None) -> None:
+        """Stops accepting updates and waits until updates in progress are processed"""
+
+        self.is_draining = True
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+
+        timeout = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 30)) if timeout is None else timeout
+        logger.info(f'Draining {len(tasks)} webhook updates')
+        done, not_done = await asyncio.wait(tasks, timeout=timeout)
+        if not_done:
+            logger.warning(f'{len(not_done)} webhook updates were not processed in {timeout}s and will be cancelled')
+            for task in not_done:
+                task.cancel()
+
+
+# Key of the application holding its BoundedRequestHandler
+REQUEST_HANDLER_KEY = web.AppKey('request_handler', BoundedRequestHandler)
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot) -> web.Application:
+    """
+    Creates aiohttp application receiving updates on WEBHOOK_PATH (default /webhook) and
+    reporting its state on /health
+    """
+
+    request_handler = BoundedRequestHandler(
+        dispatcher,
+        bot,
+        max_concurrency=int(os.getenv('WEBHOOK_MAX_CONCURRENCY', 100)),
+        max_pending=int(os.getenv('WEBHOOK_MAX_PENDING', 1000)),
+        secret_token=os.getenv('WEBHOOK_SECRET'),
+    )
+
+    async def health(request: web.Request) -> web.Response:
+        status = 503 if request_handler.is_draining else 200
+        return web.json_response({'draining': request_handler.is_draining, 'pending': request_handler.pending},
+                                 status=status)
+
+    app = web.Application()
+    app[REQUEST_HANDLER_KEY] = request_handler
+    app.router.add_get(HEALTH_PATH, health)
+
+    # Shutdown callbacks are called in order: updates in progress are drained before the dispatcher shuts down
+    # and the bot session is closed
+    app.on_shutdown.append(request_handler.drain)
+    request_handler.register(app, path=os.getenv('WEBHOOK_PATH', '/webhook'))
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def set_webhook(bot: Bot, allowed_updates: list[str]) -> None:
+    """Registers webhook URL (WEBHOOK_BASE_URL + WEBHOOK_PATH) with secret token in Telegram"""
+
+    url = os.getenv('WEBHOOK_BASE_URL', '').rstrip('/') + os.getenv('WEBHOOK_PATH', '/webhook')
+    await bot.set_webhook(
+        url,
+        secret_token=os.getenv('WEBHOOK_SECRET'),
+        allowed_updates=allowed_updates,
+        max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40)),
+    )
+    logger.info(f'Webhook is set to {url}')
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    """Serves webhook application on WEBHOOK_HOST:WEBHOOK_PORT until SIGINT or SIGTERM is received"""
+
+    runner = web.AppRunner(create_webhook_app(dispatcher, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, host=os.getenv('WEBHOOK_HOST', '0.0.0.0'), port=int(os.getenv('WEBHOOK_PORT', 8080)))
+    await site.start()
+    logger.info(f'Webhook server is listening on {site.name}')
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, stop_event.set)
+
+    try:
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()